@@ -12,28 +12,67 @@ import json
 from pathlib import Path
 from datetime import datetime
 import matplotlib.pyplot as plt
+from altitude_raster import TILE_SIZE as ALTITUDE_TILE_SIZE, AltitudeRaster
+from artifact_writer import ArtifactWriter
 from chart_preprocessing import ChartPreprocessor
+from color_classifier import HSVColorClassifier
+from detection_io import load_arrays, save_arrays, write_csv_tables, write_json
+from label_raster import LabelRaster
+from polygon_store import PolygonStore
+from spatial_index import PolygonIndex
+from stage_profiler import StageProfiler, profiled
+from step_cache import StepCache
+
+# Rangs de color HSV per defecte per a cada tipus d'espai aeri
+DEFAULT_COLOR_RANGES = {
+    "restricted_airspace": ([0, 50, 50], [10, 255, 255]),      # Vermell
+    "controlled_airspace": ([100, 50, 50], [130, 255, 255]),   # Blau
+    "uncontrolled_airspace": ([40, 50, 50], [80, 255, 255]),   # Verd
+    "danger_areas": ([20, 50, 50], [40, 255, 255]),            # Groc/Taronja
+    "prohibited_areas": ([160, 50, 50], [180, 255, 255])       # Magenta
+}
+
+# Modes d'extracció de contorns: només exteriors, o amb forats ("ccomp", dos nivells)
+# i polígons niuats dins de forats ("tree", jerarquia completa)
+CONTOUR_MODES = {
+    "external": cv2.RETR_EXTERNAL,
+    "ccomp": cv2.RETR_CCOMP,
+    "tree": cv2.RETR_TREE,
+}
 
 class AirspaceVertexDetector:
-    def __init__(self, preprocessed_folder=None, image_path=None):
+    def __init__(self, preprocessed_folder=None, image_path=None, cache=None, profiler=None, writer=None):
         """
         Inicialitza el detector de vèrtexs d'espais aeris.
         
         Args:
             preprocessed_folder (str): Carpeta amb resultats de preprocessament
             image_path (str): Camí a la imatge original (si no es proporciona carpeta)
+            cache (StepCache): Memòria cau opcional dels resultats de detecció i extracció
+            profiler (StageProfiler): Instrumentació opcional del temps i la memòria de cada etapa
+            writer (ArtifactWriter): Escriptor de la visualització (classe "visualization");
+                per defecte, síncron
         """
         self.preprocessed_folder = Path(preprocessed_folder) if preprocessed_folder else None
         self.image_path = image_path
         self.original_image = None
         self.airspace_polygons = {}
-        self.vertex_data = {}
+        self.contour_hierarchy = {}
+        self.polygons = PolygonStore.empty()
+        self._vertex_data = None
+        self._spatial_index = None
+        self.cache = cache
+        self.profiler = profiler if profiler is not None else StageProfiler(enabled=False)
+        self.writer = writer if writer is not None else ArtifactWriter(max_workers=0)
+        self._image_key = None
+        self._detection_key = None
         
         if preprocessed_folder:
             self._load_preprocessed_data()
         elif image_path:
             self._load_original_image()
     
+    @profiled("load_image", output=lambda self, result: self.original_image)
     def _load_preprocessed_data(self):
         """Carrega dades preprocessades des de la carpeta especificada."""
         if not self.preprocessed_folder.exists():
@@ -48,6 +87,7 @@ class AirspaceVertexDetector:
         
         print(f"✓ Dades preprocessades carregades des de: {self.preprocessed_folder}")
     
+    @profiled("load_image", output=lambda self, result: self.original_image)
     def _load_original_image(self):
         """Carrega imatge original directament."""
         if not Path(self.image_path).exists():
@@ -59,45 +99,263 @@ class AirspaceVertexDetector:
         
         print(f"✓ Imatge original carregada: {self.image_path}")
     
-    def detect_airspace_areas(self, color_ranges=None):
+    @property
+    def vertex_data(self):
+        """Diccionari {tipus: [polígon, ...]} construït a demanda a partir de self.polygons."""
+        if self._vertex_data is None:
+            self._vertex_data = self.polygons.to_vertex_data()
+        return self._vertex_data
+    
+    @vertex_data.setter
+    def vertex_data(self, vertex_data):
+        self.polygons = PolygonStore.from_vertex_data(vertex_data)
+        self._vertex_data = None
+    
+    @property
+    def spatial_index(self):
+        """PolygonIndex sobre self.polygons, construït a demanda (i de nou si canvien els polígons)."""
+        if self._spatial_index is None or self._spatial_index.store is not self.polygons:
+            self._spatial_index = PolygonIndex(self.polygons, image_hash=self.image_hash)
+        return self._spatial_index
+    
+    @property
+    def image_hash(self):
+        """Hash SHA-256 del contingut de la imatge original (vegeu StepCache.hash_image)."""
+        if self._image_key is None:
+            self._image_key = StepCache.hash_image(self.original_image)
+        return self._image_key
+    
+    def _cache_key(self, step_name, params, input_key=None):
+        """Retorna la clau de memòria cau d'un pas del detector."""
+        return self.cache.step_key(step_name, params, [input_key or self.image_hash])
+    
+    @staticmethod
+    def _prefilter_components(mask, min_area, max_aspect=None, min_fill_ratio=None):
+        """
+        Elimina de la màscara els components connexos que no poden donar cap polígon vàlid.
+        
+        Els criteris s'avaluen vectoritzats sobre les estadístiques de
+        cv2.connectedComponentsWithStats, abans de traçar cap contorn. El filtre
+        d'àrea és exacte: un contorn passa per centres de píxel dins de la caixa
+        del seu component, de manera que la seva àrea mai supera (amplada - 1) *
+        (alçada - 1); els components eliminats tampoc haurien superat min_area.
+        Els components eliminats s'esborren dins de la seva pròpia caixa.
+        
+        Args:
+            mask (np.ndarray): Màscara binària uint8 (es modifica in situ)
+            min_area (float): Àrea mínima dels contorns
+            max_aspect (float): Relació màxima entre el costat llarg i el curt de la caixa
+                (opcional; descarta p. ex. línies i textos allargats)
+            min_fill_ratio (float): Fracció mínima de la caixa coberta pel component
+                (opcional; descarta p. ex. traços fins i corbes)
+        
+        Returns:
+            tuple: (màscara filtrada, components totals, components conservats)
+        """
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            return mask, 0, 0
+        
+        # Connectivitat 8, la mateixa amb què cv2.findContours separa els contorns
+        region = mask[y:y + h, x:x + w]
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(region, connectivity=8)
+        widths = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float64)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float64)
+        
+        keep = (widths - 1) * (heights - 1) > min_area
+        keep &= AirspaceVertexDetector._shape_mask(widths, heights, stats[1:, cv2.CC_STAT_AREA],
+                                                   max_aspect, min_fill_ratio)
+        
+        for label in (np.flatnonzero(~keep) + 1).tolist():
+            cx, cy, cw, ch = stats[label, :4].tolist()
+            box = region[cy:cy + ch, cx:cx + cw]
+            box[labels[cy:cy + ch, cx:cx + cw] == label] = 0
+        return mask, num_labels - 1, int(keep.sum())
+    
+    @staticmethod
+    def _shape_mask(widths, heights, areas, max_aspect=None, min_fill_ratio=None):
+        """
+        Aplica els filtres opcionals de forma a regions amb caixes (amplades, alçades) i àrees.
+        
+        Returns:
+            np.ndarray: Array booleà amb True per a les regions que passen els filtres
+        """
+        widths = np.asarray(widths, dtype=np.float64)
+        heights = np.asarray(heights, dtype=np.float64)
+        keep = np.ones(len(widths), dtype=bool)
+        if max_aspect is not None:
+            keep &= np.maximum(widths, heights) <= max_aspect * np.minimum(widths, heights)
+        if min_fill_ratio is not None:
+            keep &= np.asarray(areas, dtype=np.float64) >= min_fill_ratio * widths * heights
+        return keep
+    
+    @staticmethod
+    def _filter_contours(contours, min_area, max_aspect=None, min_fill_ratio=None):
+        """
+        Retorna una màscara booleana dels contorns que superen els filtres d'àrea i de forma.
+        
+        L'àrea de cada contorn es calcula una sola vegada; les caixes només si hi ha
+        algun filtre de forma.
+        """
+        areas = np.array([cv2.contourArea(contour) for contour in contours], dtype=np.float64)
+        keep = areas > min_area
+        if (max_aspect is not None or min_fill_ratio is not None) and len(contours):
+            boxes = np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.float64)
+            keep &= AirspaceVertexDetector._shape_mask(boxes[:, 2], boxes[:, 3], areas, max_aspect,
+                                                       min_fill_ratio)
+        return keep
+    
+    @staticmethod
+    def _filter_hierarchy(contours, hierarchy, min_area, max_aspect=None, min_fill_ratio=None):
+        """
+        Separa un arbre de contorns en polígons (nivells parells) i forats (nivells senars).
+        
+        Args:
+            contours (list): Contorns de cv2.findContours amb RETR_CCOMP o RETR_TREE
+            hierarchy (np.ndarray): Jerarquia [següent, anterior, primer fill, pare] de cada contorn
+            min_area (float): Àrea mínima dels polígons i dels forats
+            max_aspect, min_fill_ratio (float): Filtres de forma opcionals dels polígons
+        
+        Returns:
+            tuple: (polígons, jerarquia {"parents": índex del polígon pare o -1,
+                "hole_owners": polígon de cada forat, "holes": contorns dels forats})
+        """
+        if hierarchy is None:
+            return [], {"parents": np.empty(0, dtype=np.int32), "hole_owners": np.empty(0, dtype=np.int32),
+                        "holes": []}
+        parents = hierarchy.reshape(-1, 4)[:, 3]
+        
+        # Profunditat de cada contorn (els pares sempre apareixen abans que els fills)
+        depth = np.zeros(len(contours), dtype=np.int32)
+        for i, parent in enumerate(parents.tolist()):
+            if parent >= 0:
+                depth[i] = depth[parent] + 1
+        
+        large = AirspaceVertexDetector._filter_contours(contours, min_area)
+        shaped = AirspaceVertexDetector._filter_contours(contours, min_area, max_aspect, min_fill_ratio)
+        
+        kept = {}
+        polygons, polygon_parents = [], []
+        hole_owners, holes = [], []
+        for i, contour in enumerate(contours):
+            if not large[i]:
+                continue
+            parent = parents[i]
+            if depth[i] % 2 == 0 and shaped[i]:
+                # Polígon: el seu pare és el polígon que té el forat on es troba
+                kept[i] = len(polygons)
+                polygons.append(contour)
+                polygon_parents.append(kept.get(parents[parent], -1) if parent >= 0 else -1)
+            elif depth[i] % 2 == 1 and parent in kept:
+                hole_owners.append(kept[parent])
+                holes.append(contour)
+        
+        return polygons, {"parents": np.array(polygon_parents, dtype=np.int32),
+                          "hole_owners": np.array(hole_owners, dtype=np.int32), "holes": holes}
+    
+    @profiled(output=lambda self, result: self.airspace_polygons)
+    def detect_airspace_areas(self, color_ranges=None, single_pass=False, contour_mode="external",
+                              min_area=1000, max_aspect=None, min_fill_ratio=None, component_prefilter=False):
         """
         Detecta àrees d'espais aeris basant-se en colors.
         
         Args:
             color_ranges (dict): Diccionari amb rangs de color HSV per cada tipus d'espai aeri
+            single_pass (bool): Classificar tots els píxels en una sola passada amb una taula
+                de consulta HSV. Els píxels dins de rangs solapats s'assignen a la primera
+                classe de color_ranges, en lloc de pertànyer a totes dues màscares
+            contour_mode (str): Mode d'extracció de contorns (vegeu CONTOUR_MODES). Amb
+                "ccomp" i "tree" es conserven els forats i, amb "tree", els polígons
+                niuats dins de forats d'un altre polígon del mateix tipus (p. ex. una CTR
+                dins d'una TMA); la jerarquia es desa a self.contour_hierarchy
+            min_area (float): Àrea mínima en píxels dels contorns conservats
+            max_aspect (float): Relació màxima entre el costat llarg i el curt de la caixa
+                (opcional; descarta p. ex. línies i textos allargats)
+            min_fill_ratio (float): Fracció mínima de la caixa coberta per la regió
+                (opcional; descarta p. ex. traços fins i corbes)
+            component_prefilter (bool): Descartar els components connexos que no poden
+                superar els filtres (p. ex. els caràcters dels textos) abans de traçar cap
+                contorn, amb cv2.connectedComponentsWithStats; només es tracen els
+                contorns dels components restants. Amb max_aspect i min_fill_ratio, els
+                filtres s'avaluen sobre els components en lloc de sobre els contorns
         """
         if color_ranges is None:
-            # Rangs de color per defecte per a espais aeris
-            color_ranges = {
-                "restricted_airspace": ([0, 50, 50], [10, 255, 255]),      # Vermell
-                "controlled_airspace": ([100, 50, 50], [130, 255, 255]),   # Blau
-                "uncontrolled_airspace": ([40, 50, 50], [80, 255, 255]),   # Verd
-                "danger_areas": ([20, 50, 50], [40, 255, 255]),            # Groc/Taronja
-                "prohibited_areas": ([160, 50, 50], [180, 255, 255])       # Magenta
-            }
+            color_ranges = DEFAULT_COLOR_RANGES
+        if contour_mode not in CONTOUR_MODES:
+            raise ValueError(f"Mode de contorns desconegut: {contour_mode} (vàlids: {list(CONTOUR_MODES)})")
+        hierarchical = contour_mode != "external"
+        
+        # Recuperar de la memòria cau si ja s'ha detectat amb els mateixos paràmetres
+        if self.cache is not None:
+            params = {"color_ranges": color_ranges, "kernel": ("ellipse", (5, 5)), "min_area": min_area,
+                      "single_pass": single_pass}
+            if hierarchical:
+                params["contour_mode"] = contour_mode
+            if max_aspect is not None or min_fill_ratio is not None:
+                params["shape_filters"] = {"max_aspect": max_aspect, "min_fill_ratio": min_fill_ratio,
+                                           "component_prefilter": component_prefilter}
+            self._detection_key = self._cache_key("detect_airspace_areas", params)
+            cached = self.cache.get(self._detection_key)
+            if cached is not None:
+                if hierarchical:
+                    self.airspace_polygons = cached["contours"]
+                    self.contour_hierarchy = cached["hierarchy"]
+                else:
+                    self.airspace_polygons = cached
+                    self.contour_hierarchy = {}
+                print("\n♻ Àrees d'espais aeris recuperades de la memòria cau")
+                return
         
         # Convertir a HSV
         hsv_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2HSV)
         
         self.airspace_polygons = {}
+        self.contour_hierarchy = {}
+        
+        if single_pass:
+            # Una sola passada: imatge d'etiquetes de la qual es deriven les màscares
+            classifier = HSVColorClassifier(color_ranges)
+            labels = classifier.classify(hsv_image)
         
         for airspace_type, (lower, upper) in color_ranges.items():
             print(f"\n🔍 Detectant {airspace_type}...")
             
             # Crear màscara per al color
-            mask = cv2.inRange(hsv_image, np.array(lower), np.array(upper))
+            if single_pass:
+                mask = classifier.mask(labels, airspace_type)
+            else:
+                mask = cv2.inRange(hsv_image, np.array(lower), np.array(upper))
             
             # Aplicar operacions morfològiques per netejar la màscara
             kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
             mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
             mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
             
-            # Trobar contorns
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Descartar els components connexos petits abans de traçar contorns
+            if component_prefilter:
+                mask, num_components, num_kept = self._prefilter_components(mask, min_area, max_aspect,
+                                                                            min_fill_ratio)
+                if num_components:
+                    print(f"   {num_kept} de {num_components} components connexos superen els filtres")
+                # Els filtres de forma ja s'han aplicat als components
+                contour_filters = (None, None)
+            else:
+                contour_filters = (max_aspect, min_fill_ratio)
+            
+            # Trobar contorns només dins de la caixa de la màscara (mateix resultat, menys píxels)
+            x, y, w, h = cv2.boundingRect(mask)
+            contours, hierarchy = (), None
+            if w and h:
+                contours, hierarchy = cv2.findContours(mask[y:y + h, x:x + w], CONTOUR_MODES[contour_mode],
+                                                       cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
             
             # Filtrar contorns per àrea mínima
-            min_area = 1000  # Àrea mínima en píxels
-            filtered_contours = [c for c in contours if cv2.contourArea(c) > min_area]
+            if hierarchical:
+                filtered_contours, self.contour_hierarchy[airspace_type] = \
+                    self._filter_hierarchy(contours, hierarchy, min_area, *contour_filters)
+            else:
+                keep = self._filter_contours(contours, min_area, *contour_filters)
+                filtered_contours = [c for c, kept in zip(contours, keep) if kept]
             
             if filtered_contours:
                 print(f"   ✓ Trobats {len(filtered_contours)} contorns per a {airspace_type}")
@@ -105,75 +363,128 @@ class AirspaceVertexDetector:
             else:
                 print(f"   ⚠ No s'han trobat contorns per a {airspace_type}")
                 self.airspace_polygons[airspace_type] = []
+        
+        if self.cache is not None:
+            self.cache.put(self._detection_key, {"contours": self.airspace_polygons,
+                                                 "hierarchy": self.contour_hierarchy}
+                           if hierarchical else self.airspace_polygons)
     
+    @profiled(output=lambda self, result: self.polygons.to_arrays())
     def extract_polygon_vertices(self, epsilon_factor=0.02, min_vertices=3):
         """
         Extreu vèrtexs dels polígons d'espais aeris.
         
+        Si la detecció s'ha fet amb contour_mode "ccomp" o "tree", els forats
+        s'aproximen igual que els polígons i es resten de l'àrea i del centroide,
+        i cada polígon guarda el seu pare. En tots els modes el centroide d'un
+        anell és la mitjana dels seus vèrtexs; el d'un polígon amb forats és la
+        mitjana, ponderada per àrea, del contorn exterior menys els forats.
+        
         Args:
             epsilon_factor (float): Factor per a l'aproximació de Douglas-Peucker
             min_vertices (int): Nombre mínim de vèrtexs per considerar un polígon vàlid
         """
         print("\n📐 Extraient vèrtexs dels polígons...")
         
-        self.vertex_data = {}
+        cache_key = None
+        if self.cache is not None and self._detection_key is not None:
+            cache_key = self._cache_key("extract_polygon_vertices",
+                                        {"epsilon_factor": epsilon_factor, "min_vertices": min_vertices,
+                                         "format": "columnar-v3"},
+                                        self._detection_key)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.polygons = PolygonStore.from_arrays(cached)
+                self._vertex_data = None
+                print("♻ Vèrtexs recuperats de la memòria cau")
+                return
+        
+        class_names = []
+        vertices, counts, class_ids, polygon_ids = [], [], [], []
+        areas, perimeters, bboxes = [], [], []
+        centroids, parents = [], []
+        hole_vertices, hole_counts, hole_polygons = [], [], []
         
         for airspace_type, contours in self.airspace_polygons.items():
             if not contours:
                 continue
             
             print(f"\n🔍 Processant {airspace_type}:")
-            polygons = []
+            class_id = len(class_names)
+            class_names.append(airspace_type)
+            num_polygons = 0
+            
+            hierarchy = self.contour_hierarchy.get(airspace_type)
+            if hierarchy is not None:
+                # Forats de cada contorn i índex al magatzem dels contorns ja afegits
+                holes = [[] for _ in contours]
+                for owner, hole in zip(hierarchy["hole_owners"].tolist(), hierarchy["holes"]):
+                    holes[owner].append(hole)
+                stored = {}
             
             for i, contour in enumerate(contours):
                 # Aproximar contorn com a polígon
-                epsilon = epsilon_factor * cv2.arcLength(contour, True)
-                approx_polygon = cv2.approxPolyDP(contour, epsilon, True)
+                perimeter = cv2.arcLength(contour, True)
+                approx_polygon = cv2.approxPolyDP(contour, epsilon_factor * perimeter, True)
                 
                 # Verificar que tingui suficients vèrtexs
                 if len(approx_polygon) >= min_vertices:
-                    # Convertir a llista de coordenades (x, y)
-                    vertices = [(int(point[0][0]), int(point[0][1])) for point in approx_polygon]
-                    
                     # Calcular propietats del polígon
                     area = cv2.contourArea(contour)
-                    perimeter = cv2.arcLength(contour, True)
-                    bounding_rect = cv2.boundingRect(contour)
                     
-                    polygon_data = {
-                        "id": i + 1,
-                        "vertices": vertices,
-                        "num_vertices": len(vertices),
-                        "area": float(area),
-                        "perimeter": float(perimeter),
-                        "bounding_box": {
-                            "x": int(bounding_rect[0]),
-                            "y": int(bounding_rect[1]),
-                            "width": int(bounding_rect[2]),
-                            "height": int(bounding_rect[3])
-                        },
-                        "centroid": self._calculate_centroid(vertices)
-                    }
+                    if hierarchy is not None:
+                        # Centroide de la regió: el del contorn menys els dels forats, ponderats per àrea
+                        centroid = approx_polygon.reshape(-1, 2).mean(axis=0)
+                        weighted = area * centroid
+                        for hole in holes[i]:
+                            approx_hole = cv2.approxPolyDP(hole, epsilon_factor * cv2.arcLength(hole, True), True)
+                            # Només es resten els forats que es guarden: la regió ha de coincidir amb el magatzem
+                            if len(approx_hole) < 3:
+                                continue
+                            hole_area = cv2.contourArea(hole)
+                            weighted = weighted - hole_area * approx_hole.reshape(-1, 2).mean(axis=0)
+                            area -= hole_area
+                            hole_vertices.append(approx_hole.reshape(-1, 2))
+                            hole_counts.append(len(approx_hole))
+                            hole_polygons.append(len(counts))
+                        centroids.append(tuple(weighted / area) if area > 0 else tuple(centroid))
+                        parent = int(hierarchy["parents"][i])
+                        parents.append(stored.get(parent, -1))
+                        stored[i] = len(counts)
                     
-                    polygons.append(polygon_data)
-                    print(f"   ✓ Polígon {i+1}: {len(vertices)} vèrtexs, àrea: {area:.0f} px²")
+                    vertices.append(approx_polygon.reshape(-1, 2))
+                    counts.append(len(approx_polygon))
+                    class_ids.append(class_id)
+                    polygon_ids.append(i + 1)
+                    areas.append(area)
+                    perimeters.append(perimeter)
+                    bboxes.append(cv2.boundingRect(contour))
+                    num_polygons += 1
+                    print(f"   ✓ Polígon {i+1}: {len(approx_polygon)} vèrtexs, àrea: {area:.0f} px²")
             
-            self.vertex_data[airspace_type] = polygons
-            print(f"   📊 Total polígons detectats per a {airspace_type}: {len(polygons)}")
-    
-    def _calculate_centroid(self, vertices):
-        """Calcula el centroide d'un polígon."""
-        if not vertices:
-            return (0, 0)
-        
-        x_coords = [v[0] for v in vertices]
-        y_coords = [v[1] for v in vertices]
-        
-        centroid_x = sum(x_coords) / len(x_coords)
-        centroid_y = sum(y_coords) / len(y_coords)
+            print(f"   📊 Total polígons detectats per a {airspace_type}: {num_polygons}")
+        
+        # Un sol array de vèrtexs per a tots els polígons; els centroides es calculen vectoritzats
+        if vertices and self.contour_hierarchy:
+            self.polygons = PolygonStore(class_names, np.concatenate(vertices),
+                                         np.concatenate([[0], np.cumsum(counts)]), class_ids,
+                                         polygon_ids, areas, perimeters, bboxes, centroids=centroids,
+                                         parents=parents,
+                                         hole_vertices=np.concatenate(hole_vertices) if hole_vertices else None,
+                                         hole_offsets=np.concatenate([[0], np.cumsum(hole_counts)]),
+                                         hole_polygons=hole_polygons)
+        elif vertices:
+            self.polygons = PolygonStore(class_names, np.concatenate(vertices),
+                                         np.concatenate([[0], np.cumsum(counts)]), class_ids,
+                                         polygon_ids, areas, perimeters, bboxes)
+        else:
+            self.polygons = PolygonStore.empty(class_names)
+        self._vertex_data = None
         
-        return (float(centroid_x), float(centroid_y))
+        if cache_key is not None:
+            self.cache.put(cache_key, self.polygons.to_arrays())
     
+    @profiled()
     def visualize_polygons(self, output_path="airspace_polygons_visualization.png"):
         """
         Crea una visualització dels polígons detectats.
@@ -203,8 +514,9 @@ class AirspaceVertexDetector:
             for polygon in polygons:
                 vertices = np.array(polygon["vertices"], np.int32)
                 
-                # Dibuixar polígon
-                cv2.polylines(vis_image, [vertices], True, color, 2)
+                # Dibuixar polígon i els seus forats
+                holes = [np.array(hole, np.int32) for hole in polygon.get("holes", [])]
+                cv2.polylines(vis_image, [vertices, *holes], True, color, 2)
                 
                 # Dibuixar vèrtexs
                 for vertex in vertices:
@@ -220,35 +532,147 @@ class AirspaceVertexDetector:
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
         
         # Desar visualització
-        cv2.imwrite(output_path, vis_image)
+        output_path = self.writer.write_image(output_path, vis_image, artifact_class="visualization")
         print(f"✓ Visualització desada: {output_path}")
         
         return vis_image
     
-    def save_vertex_data(self, output_path="airspace_vertices.json"):
+    def _detection_metadata(self):
+        """Metadades dels resultats desats (imatge d'origen, hash i recomptes)."""
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "image_path": str(self.image_path) if self.image_path else "preprocessed",
+            "image_sha256": self.image_hash,
+            "total_airspace_types": len(self.polygons.class_names),
+            "total_polygons": len(self.polygons)
+        }
+    
+    @profiled()
+    def save_vertex_data(self, output_path="airspace_vertices.json", compact=False):
         """
         Desa les dades dels vèrtexs en format JSON.
         
+        Els polígons s'escriuen un a un des del magatzem columnar, sense construir
+        el diccionari vertex_data ni el document sencer en memòria.
+        
         Args:
             output_path (str): Camí per desar les dades
+            compact (bool): JSON minificat en lloc d'indentat (mateix contingut)
         """
-        # Preparar dades per a JSON
-        json_data = {
-            "metadata": {
-                "timestamp": datetime.now().isoformat(),
-                "image_path": str(self.image_path) if self.image_path else "preprocessed",
-                "total_airspace_types": len(self.vertex_data),
-                "total_polygons": sum(len(polygons) for polygons in self.vertex_data.values())
-            },
-            "airspace_polygons": self.vertex_data
-        }
-        
-        # Desa en fitxer JSON
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+        write_json(self.polygons, output_path, self._detection_metadata(), indent=None if compact else 2)
         
         print(f"✓ Dades dels vèrtexs desades: {output_path}")
     
+    @profiled()
+    def save_polygon_arrays(self, output_path="airspace_polygons.npz"):
+        """
+        Desa els arrays columnars dels polígons en un .npz (vegeu load_vertex_data).
+        
+        Args:
+            output_path (str): Camí del fitxer .npz
+        """
+        save_arrays(self.polygons, output_path, self._detection_metadata())
+        print(f"✓ Arrays dels polígons desats: {output_path}")
+    
+    @profiled()
+    def export_polygon_tables(self, polygons_path="airspace_polygons.csv", vertices_path="airspace_vertices.csv"):
+        """
+        Exporta els polígons en dues taules CSV: una fila per polígon i una per vèrtex.
+        
+        Args:
+            polygons_path (str): CSV de polígons (àrea, perímetre, caixa, centroide...)
+            vertices_path (str): CSV de vèrtexs, enllaçat per polygon_index
+        """
+        write_csv_tables(self.polygons, polygons_path, vertices_path)
+        print(f"✓ Taules de polígons exportades a CSV: {polygons_path}, {vertices_path}")
+    
+    @profiled()
+    def save_spatial_index(self, output_path="airspace_index.npz", transform=None):
+        """
+        Desa l'índex espacial dels polígons (vegeu PolygonIndex.save).
+        
+        Args:
+            output_path (str): Camí del fitxer .npz
+            transform (GeoTransform): Georeferenciació opcional per a les consultes en lat/lon
+        """
+        index = self.spatial_index
+        if transform is not None:
+            index.transform = transform
+        index.save(output_path)
+    
+    @profiled()
+    def build_label_raster(self, output_folder=None, transform=None):
+        """
+        Rasteritza els polígons en un ràster d'etiquetes per a consultes O(1) (vegeu LabelRaster).
+        
+        Args:
+            output_folder (str): Carpeta on es desa el ràster mapejat en memòria (opcional)
+            transform (GeoTransform): Georeferenciació opcional per a les consultes en lat/lon
+        
+        Returns:
+            LabelRaster: Ràster dels polígons actuals
+        """
+        return LabelRaster.build(self.polygons, self.original_image.shape, output_folder=output_folder,
+                                 transform=transform, image_hash=self.image_hash)
+    
+    @profiled()
+    def build_altitude_raster(self, limits, output_folder=None, output_shape=None, floor_rule="min",
+                              ceiling_rule="max", tile_size=ALTITUDE_TILE_SIZE, transform=None):
+        """
+        Genera el mapa d'altures: graelles int16 del floor i del ceiling dels espais aeris.
+        
+        Args:
+            limits: Floor i ceiling en peus de cada polígon, com a diccionari
+                {(tipus d'espai aeri, id): (floor, ceiling)} amb els ids de vertex_data o
+                com a array (P, 2) en l'ordre de self.polygons
+            output_folder (str): Carpeta on es desen les graelles mapejades en memòria (opcional)
+            output_shape (tuple): Mida (alçada, amplada) de les graelles; per defecte, la de la carta
+            floor_rule, ceiling_rule (str): "min" o "max" per als solapaments
+            tile_size (int): Costat de les rajoles en cel·les
+            transform (GeoTransform): Georeferenciació opcional per a les consultes en lat/lon
+        
+        Returns:
+            AltitudeRaster: Mapa d'altures dels polígons actuals
+        """
+        return AltitudeRaster.build(self.polygons, self.original_image.shape, limits, output_folder=output_folder,
+                                    output_shape=output_shape, floor_rule=floor_rule, ceiling_rule=ceiling_rule,
+                                    tile_size=tile_size, transform=transform, image_hash=self.image_hash)
+    
+    @profiled()
+    def load_vertex_data(self, input_path, verify=True):
+        """
+        Carrega polígons desats amb save_vertex_data en lloc de tornar-los a detectar.
+        
+        Args:
+            input_path (str): Fitxer JSON de save_vertex_data o .npz de save_polygon_arrays
+            verify (bool): Comprovar que el hash de la imatge desat coincideix amb el de
+                la imatge carregada; els fitxers antics sense hash s'accepten amb un avís
+        
+        Raises:
+            ValueError: Si els polígons són d'una altra imatge
+        """
+        if str(input_path).endswith(".npz"):
+            store, metadata = load_arrays(input_path)
+        else:
+            with open(input_path, 'r', encoding='utf-8') as f:
+                json_data = json.load(f)
+            store, metadata = None, json_data.get("metadata", {})
+        
+        saved_hash = metadata.get("image_sha256")
+        if verify:
+            if saved_hash is None:
+                print(f"⚠ {input_path} no té hash de la imatge; no es pot validar")
+            elif saved_hash != self.image_hash:
+                raise ValueError(f"Els polígons de {input_path} no corresponen a la imatge carregada")
+        
+        if store is not None:
+            self.polygons = store
+            self._vertex_data = None
+        else:
+            self.vertex_data = json_data["airspace_polygons"]
+        print(f"✓ Dades dels vèrtexs carregades: {input_path} ({len(self.polygons)} polígons)")
+    
+    @profiled()
     def save_vertex_coordinates(self, output_path="vertex_coordinates.txt"):
         """
         Desa només les coordenades dels vèrtexs en format llegible.
@@ -315,15 +739,15 @@ class AirspaceVertexDetector:
         Returns:
             list: Llista de tuples (airspace_type, polygon_id, vertex_index, x, y)
         """
-        coordinates_list = []
+        table = self.polygons.vertex_table()
+        polygon_index = table["polygon_index"]
+        names = np.array(self.polygons.class_names, dtype=object)
         
-        for airspace_type, polygons in self.vertex_data.items():
-            for polygon in polygons:
-                for i, (x, y) in enumerate(polygon['vertices']):
-                    coordinates_list.append((airspace_type, polygon['id'], i+1, x, y))
-        
-        return coordinates_list
+        return list(zip(names[self.polygons.class_ids[polygon_index]].tolist(),
+                        self.polygons.polygon_ids[polygon_index].tolist(),
+                        table["vertex_index"].tolist(), table["x"].tolist(), table["y"].tolist()))
     
+    @profiled()
     def export_vertices_csv(self, output_path="airspace_vertices.csv"):
         """
         Exporta les coordenades dels vèrtexs en format CSV.
@@ -339,46 +763,25 @@ class AirspaceVertexDetector:
             # Escriure capçalera
             writer.writerow(['Airspace_Type', 'Polygon_ID', 'Vertex_Index', 'X', 'Y', 'Area', 'Perimeter'])
             
-            # Escriure dades
-            for airspace_type, polygons in self.vertex_data.items():
-                for polygon in polygons:
-                    for i, (x, y) in enumerate(polygon['vertices']):
-                        writer.writerow([
-                            airspace_type,
-                            polygon['id'],
-                            i + 1,
-                            x,
-                            y,
-                            polygon['area'],
-                            polygon['perimeter']
-                        ])
+            # Escriure dades (columnes construïdes amb arrays, una fila per vèrtex)
+            table = self.polygons.vertex_table()
+            polygon_index = table["polygon_index"]
+            names = np.array(self.polygons.class_names, dtype=object)
+            writer.writerows(zip(
+                names[self.polygons.class_ids[polygon_index]].tolist(),
+                self.polygons.polygon_ids[polygon_index].tolist(),
+                table["vertex_index"].tolist(),
+                table["x"].tolist(),
+                table["y"].tolist(),
+                self.polygons.areas[polygon_index].tolist(),
+                self.polygons.perimeters[polygon_index].tolist()
+            ))
         
         print(f"✓ Coordenades exportades a CSV: {output_path}")
     
     def get_polygon_statistics(self):
         """Retorna estadístiques dels polígons detectats."""
-        stats = {}
-        
-        for airspace_type, polygons in self.vertex_data.items():
-            if not polygons:
-                continue
-            
-            areas = [p['area'] for p in polygons]
-            perimeters = [p['perimeter'] for p in polygons]
-            vertex_counts = [p['num_vertices'] for p in polygons]
-            
-            stats[airspace_type] = {
-                "num_polygons": len(polygons),
-                "avg_area": np.mean(areas),
-                "min_area": np.min(areas),
-                "max_area": np.max(areas),
-                "avg_perimeter": np.mean(perimeters),
-                "avg_vertices": np.mean(vertex_counts),
-                "min_vertices": np.min(vertex_counts),
-                "max_vertices": np.max(vertex_counts)
-            }
-        
-        return stats
+        return self.polygons.statistics()
     
     def print_statistics(self):
         """Imprimeix estadístiques dels polígons detectats."""
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Mapa d'Altures dels Espais Aeris
+
+Aquest mòdul rasteritza els polígons detectats, amb el límit inferior (floor) i
+superior (ceiling) de cada un, en dues graelles int16 (peus): el floor més baix
+i el ceiling més alt de tots els espais aeris que cobreixen cada cel·la. Les
+regles de combinació dels solapaments (min o max) són configurables.
+
+La mida de les graelles és independent de la de la carta (els polígons s'escalen
+amb precisió subpíxel), i les graelles es desen en disc per rajoles: cada rajola
+de TILE_SIZE x TILE_SIZE cel·les és contigua al fitxer .npy, que es torna a obrir
+mapejat en memòria; llegir una zona només toca les rajoles que la cobreixen.
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from geo_transform import GeoTransform, resolve_transform
+
+TILE_SIZE = 256
+FLOOR_FILE = "floor.npy"
+CEILING_FILE = "ceiling.npy"
+METADATA_FILE = "altitude.json"
+
+# Cel·les sense cap espai aeri; les altituds es retallen a [ALTITUDE_MIN, ALTITUDE_MAX]
+NODATA = np.iinfo(np.int16).min
+ALTITUDE_MIN = NODATA + 1
+ALTITUDE_MAX = np.iinfo(np.int16).max
+
+# Regles de combinació dels solapaments
+OVERLAP_RULES = {"min": np.minimum, "max": np.maximum}
+
+# Bits fraccionals de les coordenades passades a cv2.fillPoly
+FILL_SHIFT = 4
+
+
+def limit_arrays(store, limits):
+    """
+    Alinea els límits verticals donats per l'usuari amb els polígons del magatzem.
+
+    Args:
+        store (PolygonStore): Polígons detectats
+        limits: Array (P, 2) de (floor, ceiling) en l'ordre del magatzem, o diccionari
+            {(tipus d'espai aeri, id): (floor, ceiling)} amb els ids de vertex_data;
+            els polígons absents del diccionari queden sense límits (NaN)
+
+    Returns:
+        tuple: Arrays float64 (floors, ceilings), un element per polígon
+    """
+    if isinstance(limits, dict):
+        values = np.full((len(store), 2), np.nan)
+        for i, key in enumerate(store.polygon_keys(np.arange(len(store)))):
+            if key in limits:
+                values[i] = limits[key]
+    else:
+        values = np.asarray(limits, dtype=np.float64).reshape(-1, 2)
+        if len(values) != len(store):
+            raise ValueError(f"Cal un parell (floor, ceiling) per polígon: {len(values)} per a {len(store)}")
+    return values[:, 0], values[:, 1]
+
+
+class AltitudeRaster:
+    def __init__(self, floor, ceiling, shape, scale, tile_size=TILE_SIZE, rules=("min", "max"), transform=None,
+                 image_hash=None):
+        """
+        Inicialitza el mapa d'altures a partir de les graelles per rajoles (vegeu build i load).
+
+        Args:
+            floor, ceiling (np.ndarray): Graelles int16 (files de rajoles, columnes de rajoles,
+                tile_size, tile_size)
+            shape (tuple): Mida (alçada, amplada) de la graella en cel·les
+            scale (tuple): Cel·les per píxel de la carta (x, y)
+            tile_size (int): Costat de les rajoles en cel·les
+            rules (tuple): Regles (floor, ceiling) dels solapaments
+            transform (GeoTransform): Georeferenciació de la carta per a les consultes en lat/lon
+            image_hash (str): Hash de la imatge dels polígons
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.shape = tuple(shape)
+        self.scale = tuple(scale)
+        self.tile_size = tile_size
+        self.rules = tuple(rules)
+        self.transform = transform
+        self.image_hash = image_hash
+
+    @classmethod
+    def build(cls, store, chart_shape, limits, output_folder=None, output_shape=None, floor_rule="min",
+              ceiling_rule="max", tile_size=TILE_SIZE, transform=None, image_hash=None):
+        """
+        Rasteritza els límits verticals dels polígons, rajola a rajola.
+
+        Args:
+            store (PolygonStore): Polígons detectats
+            chart_shape (tuple): Forma (alçada, amplada) de la carta dels polígons
+            limits: Floor i ceiling de cada polígon en peus (vegeu limit_arrays)
+            output_folder (str): Si es dona, les graelles s'escriuen directament en fitxers
+                mapejats en memòria d'aquesta carpeta
+            output_shape (tuple): Mida (alçada, amplada) de les graelles; per defecte, la de la carta
+            floor_rule, ceiling_rule (str): Regla dels solapaments de cada graella (OVERLAP_RULES)
+            tile_size (int): Costat de les rajoles en cel·les
+            transform (GeoTransform): Georeferenciació opcional
+            image_hash (str): Hash opcional de la imatge dels polígons
+        """
+        for rule in (floor_rule, ceiling_rule):
+            if rule not in OVERLAP_RULES:
+                raise ValueError(f"Regla de solapament desconeguda: {rule} (vàlides: {list(OVERLAP_RULES)})")
+        chart_height, chart_width = chart_shape[:2]
+        height, width = output_shape if output_shape is not None else (chart_height, chart_width)
+        scale_x, scale_y = width / chart_width, height / chart_height
+        tiles_y, tiles_x = -(-height // tile_size), -(-width // tile_size)
+        grid_shape = (tiles_y, tiles_x, tile_size, tile_size)
+
+        if output_folder is not None:
+            output_folder = Path(output_folder)
+            output_folder.mkdir(parents=True, exist_ok=True)
+            floor = np.lib.format.open_memmap(output_folder / FLOOR_FILE, mode="w+", dtype=np.int16, shape=grid_shape)
+            ceiling = np.lib.format.open_memmap(output_folder / CEILING_FILE, mode="w+", dtype=np.int16,
+                                                shape=grid_shape)
+        else:
+            floor = np.empty(grid_shape, dtype=np.int16)
+            ceiling = np.empty(grid_shape, dtype=np.int16)
+
+        # Només els polígons amb els dos límits; valors retallats al rang int16 (NODATA per als altres)
+        floors, ceilings = limit_arrays(store, limits)
+        missing = np.isnan(floors) | np.isnan(ceilings)
+        valid = np.flatnonzero(~missing)
+        floors = np.where(missing, NODATA, np.clip(np.rint(np.nan_to_num(floors)), ALTITUDE_MIN, ALTITUDE_MAX))
+        ceilings = np.where(missing, NODATA, np.clip(np.rint(np.nan_to_num(ceilings)), ALTITUDE_MIN, ALTITUDE_MAX))
+        floors, ceilings = floors.astype(np.int16), ceilings.astype(np.int16)
+
+        # Anells escalats a la graella (centres de píxel alineats), en coordenades de punt fix;
+        # a escala 1 es rasteritzen els vèrtexs enters tal qual, com al ràster d'etiquetes
+        shift = 0 if (height, width) == (chart_height, chart_width) else FILL_SHIFT
+        factor = np.array([scale_x, scale_y]) * (1 << shift)
+        half = (np.array([scale_x, scale_y]) - 1) / 2 * (1 << shift)
+        rings = {i: [np.rint(ring * factor + half).astype(np.int32) for ring in store.polygon_rings(i)]
+                 for i in valid.tolist()}
+
+        # Cada polígon es rasteritza sencer dins de la seva caixa (retallar-lo a una rajola
+        # canviaria els píxels de la vora) i després es combina amb les rajoles que toca
+        floor[:] = NODATA
+        ceiling[:] = NODATA
+        floor_combine, ceiling_combine = OVERLAP_RULES[floor_rule], OVERLAP_RULES[ceiling_rule]
+        for i in valid.tolist():
+            outline = rings[i][0]
+            x0 = max(int(outline[:, 0].min()) >> shift, 0)
+            y0 = max(int(outline[:, 1].min()) >> shift, 0)
+            x1 = min((int(outline[:, 0].max()) >> shift) + 2, width)
+            y1 = min((int(outline[:, 1].max()) >> shift) + 2, height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, rings[i], 1, shift=shift, offset=(-x0 << shift, -y0 << shift))
+
+            for ty in range(y0 // tile_size, (y1 - 1) // tile_size + 1):
+                for tx in range(x0 // tile_size, (x1 - 1) // tile_size + 1):
+                    top, left = ty * tile_size, tx * tile_size
+                    ty0, ty1 = max(y0, top), min(y1, top + tile_size)
+                    tx0, tx1 = max(x0, left), min(x1, left + tile_size)
+                    inside = mask[ty0 - y0:ty1 - y0, tx0 - x0:tx1 - x0].view(bool)
+                    for grid, combine, value in ((floor, floor_combine, floors[i]),
+                                                 (ceiling, ceiling_combine, ceilings[i])):
+                        cells = grid[ty, tx, ty0 - top:ty1 - top, tx0 - left:tx1 - left]
+                        current = cells[inside]
+                        # Les cel·les encara buides prenen el valor del polígon sense combinar
+                        cells[inside] = np.where(current == NODATA, value, combine(current, value))
+
+        raster = cls(floor, ceiling, (height, width), (scale_x, scale_y), tile_size=tile_size,
+                     rules=(floor_rule, ceiling_rule), transform=transform, image_hash=image_hash)
+        if output_folder is not None:
+            floor.flush()
+            ceiling.flush()
+            raster._save_metadata(output_folder)
+            print(f"✓ Mapa d'altures desat: {output_folder} ({width}x{height} cel·les, "
+                  f"{tiles_x}x{tiles_y} rajoles)")
+        return raster
+
+    def _save_metadata(self, output_folder):
+        """Desa la mida, l'escala, les regles i la georeferenciació de les graelles."""
+        metadata = {
+            "shape": list(self.shape),
+            "scale": list(self.scale),
+            "tile_size": self.tile_size,
+            "rules": {"floor": self.rules[0], "ceiling": self.rules[1]},
+            "nodata": int(NODATA),
+            "units": "ft",
+            "transform": self.transform.to_dict() if self.transform is not None else None,
+            "image_sha256": self.image_hash,
+        }
+        with open(Path(output_folder) / METADATA_FILE, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
+
+    def save(self, output_folder):
+        """Desa les graelles i les metadades en una carpeta (vegeu load)."""
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        np.save(output_folder / FLOOR_FILE, self.floor)
+        np.save(output_folder / CEILING_FILE, self.ceiling)
+        self._save_metadata(output_folder)
+        print(f"✓ Mapa d'altures desat: {output_folder}")
+
+    @classmethod
+    def load(cls, input_folder, mmap=True):
+        """
+        Obre un mapa d'altures desat.
+
+        Args:
+            input_folder (str): Carpeta de build o save
+            mmap (bool): Mapejar les graelles en memòria (només es llegeixen les rajoles consultades)
+        """
+        input_folder = Path(input_folder)
+        with open(input_folder / METADATA_FILE, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        mmap_mode = "r" if mmap else None
+        transform = metadata["transform"]
+        return cls(np.load(input_folder / FLOOR_FILE, mmap_mode=mmap_mode),
+                   np.load(input_folder / CEILING_FILE, mmap_mode=mmap_mode),
+                   metadata["shape"], metadata["scale"], tile_size=metadata["tile_size"],
+                   rules=(metadata["rules"]["floor"], metadata["rules"]["ceiling"]),
+                   transform=GeoTransform.from_dict(transform) if transform else None,
+                   image_hash=metadata["image_sha256"])
+
+    def read_window(self, x0, y0, x1, y1, grid="floor"):
+        """
+        Llegeix una finestra de la graella com a imatge 2D, tocant només les seves rajoles.
+
+        Args:
+            x0, y0, x1, y1 (int): Finestra en cel·les (x1 i y1 exclusius)
+            grid (str): "floor" o "ceiling"
+        """
+        tiles = self.floor if grid == "floor" else self.ceiling
+        height, width = self.shape
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)
+        window = np.full((max(y1 - y0, 0), max(x1 - x0, 0)), NODATA, dtype=np.int16)
+        size = self.tile_size
+        for ty in range(y0 // size, -(-y1 // size)):
+            for tx in range(x0 // size, -(-x1 // size)):
+                top, left = ty * size, tx * size
+                sy0, sy1 = max(y0, top), min(y1, top + size)
+                sx0, sx1 = max(x0, left), min(x1, left + size)
+                window[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = tiles[ty, tx, sy0 - top:sy1 - top, sx0 - left:sx1 - left]
+        return window
+
+    def to_image(self, grid="floor"):
+        """Retorna la graella sencera com a imatge 2D (còpia)."""
+        return self.read_window(0, 0, self.shape[1], self.shape[0], grid)
+
+    def lookup(self, points):
+        """
+        Floor i ceiling de la cel·la de cada punt.
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel de la carta
+
+        Returns:
+            tuple: Arrays int16 (floors, ceilings); NODATA fora de tot espai aeri o de la graella
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        height, width = self.shape
+        x = np.floor((points[:, 0] + 0.5) * self.scale[0]).astype(np.int64)
+        y = np.floor((points[:, 1] + 0.5) * self.scale[1]).astype(np.int64)
+        valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        floors = np.full(len(points), NODATA, dtype=np.int16)
+        ceilings = np.full(len(points), NODATA, dtype=np.int16)
+        x, y = x[valid], y[valid]
+        size = self.tile_size
+        floors[valid] = self.floor[y // size, x // size, y % size, x % size]
+        ceilings[valid] = self.ceiling[y // size, x // size, y % size, x % size]
+        return floors, ceilings
+
+    def query_latlon(self, latlon, transform=None):
+        """
+        Com lookup, amb punts (lat, lon) en graus.
+
+        Args:
+            latlon (array): Array (N, 2) de (lat, lon)
+            transform (GeoTransform): Georeferenciació (per defecte, la del mapa)
+        """
+        return self.lookup(resolve_transform(transform, self.transform).latlon_to_points(latlon))
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Escriptor Asíncron d'Artefactes
+
+Aquest mòdul codifica i desa les imatges intermèdies en un grup de fils en
+segon pla, de manera que la codificació PNG i l'escriptura a disc se solapen
+amb el següent pas de processament. cv2.imencode allibera el GIL, de manera que
+els fils codifiquen realment en paral·lel.
+
+Cada imatge pertany a una classe d'artefacte ("final", "intermediate",
+"preview", "archival"...) i cada classe pot tenir la seva codificació: nivell de
+compressió PNG, o WebP/JPEG amb una qualitat donada.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+import cv2
+
+# Codificacions predefinides; les classes sense codificació pròpia fan servir "default"
+ENCODING_PRESETS = {
+    "default": {"format": None},                          # Format del camí, paràmetres d'OpenCV
+    "preview": {"format": "png", "compression": 1},       # Ràpida
+    "archival": {"format": "png", "compression": 9},      # Mida mínima sense pèrdua
+    "webp": {"format": "webp", "quality": 90},
+    "jpeg": {"format": "jpeg", "quality": 90},
+}
+FORMAT_SUFFIXES = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+
+def resolve_encoding(path, image, encoding):
+    """
+    Retorna el camí final i els paràmetres de cv2.imencode d'una imatge.
+
+    Args:
+        path (str): Camí demanat; l'extensió es canvia segons el format
+        image (np.ndarray): Imatge (les imatges amb canal alfa no es desen en JPEG)
+        encoding (dict or str): Codificació o nom d'ENCODING_PRESETS
+
+    Returns:
+        tuple: (camí, extensió, llista de paràmetres)
+    """
+    if isinstance(encoding, str):
+        encoding = ENCODING_PRESETS[encoding]
+    path = Path(path)
+    image_format = encoding.get("format")
+    if image_format == "jpeg" and image.ndim == 3 and image.shape[2] == 4:
+        # JPEG no admet transparència: es manté PNG
+        image_format = "png"
+    if image_format is not None:
+        path = path.with_suffix(FORMAT_SUFFIXES[image_format])
+
+    params = []
+    if image_format == "png" and "compression" in encoding:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, encoding["compression"]]
+    elif image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, encoding.get("quality", 90)]
+    elif image_format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, encoding.get("quality", 90)]
+    return str(path), path.suffix, params
+
+
+class ArtifactWriter:
+    def __init__(self, max_workers=2, max_in_flight=4, encodings=None):
+        """
+        Inicialitza l'escriptor d'artefactes.
+
+        Args:
+            max_workers (int): Nombre de fils de codificació (0 = escriptura síncrona)
+            max_in_flight (int): Nombre màxim d'imatges pendents de desar. Quan s'arriba
+                al límit, write_image es bloqueja fins que se n'allibera una (contrapressió),
+                de manera que la memòria retinguda queda acotada
+            encodings (dict): Codificació de cada classe d'artefacte, com a diccionari
+                ({"format": "png", "compression": 9}) o nom d'ENCODING_PRESETS; p. ex.
+                {"intermediate": "preview", "final": "archival"}
+        """
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.encodings = dict(encodings or {})
+        self.written = 0
+        self.failures = []
+        self.stats = {}
+
+        self._executor = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                                thread_name_prefix="artifact_writer")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def encoding_for(self, artifact_class):
+        """Retorna la codificació (diccionari o nom de preset) d'una classe d'artefacte."""
+        return self.encodings.get(artifact_class, self.encodings.get("default", "default"))
+
+    def write_image(self, path, image, params=None, artifact_class="default"):
+        """
+        Encua una imatge per desar-la.
+
+        La imatge no s'ha de modificar fins que no s'hagi desat (vegeu flush).
+
+        Args:
+            path (str): Camí del fitxer de sortida
+            image (np.ndarray): Imatge a codificar
+            params (list): Paràmetres explícits de cv2.imencode; si es donen, no s'aplica
+                la codificació de la classe i es manté el camí
+            artifact_class (str): Classe d'artefacte que tria la codificació
+
+        Returns:
+            str: Camí on es desarà la imatge (l'extensió depèn del format)
+        """
+        if params is not None:
+            path, suffix = str(path), Path(path).suffix
+        else:
+            path, suffix, params = resolve_encoding(path, image, self.encoding_for(artifact_class))
+
+        if self._executor is None:
+            self._write(path, suffix, image, params, artifact_class)
+            return path
+
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, path, suffix, image, params, artifact_class)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._release)
+        return path
+
+    def _write(self, path, suffix, image, params, artifact_class):
+        """Codifica i desa una imatge, registrant-ne les fallades i el rendiment."""
+        try:
+            start = time.perf_counter()
+            ok, buffer = cv2.imencode(suffix, image, params)
+            if not ok:
+                raise IOError("cv2.imencode ha retornat False")
+            encoded = time.perf_counter()
+            with open(path, "wb") as f:
+                f.write(buffer)
+            written = time.perf_counter()
+        except Exception as e:
+            with self._lock:
+                self.failures.append((path, str(e)))
+        else:
+            with self._lock:
+                self.written += 1
+                stats = self.stats.setdefault(artifact_class, {"images": 0, "megapixels": 0.0, "bytes": 0,
+                                                               "encode_seconds": 0.0, "write_seconds": 0.0})
+                stats["images"] += 1
+                stats["megapixels"] += image.shape[0] * image.shape[1] / 1e6
+                stats["bytes"] += buffer.nbytes
+                stats["encode_seconds"] += encoded - start
+                stats["write_seconds"] += written - encoded
+
+    def _release(self, future):
+        """Allibera la plaça d'una escriptura acabada."""
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def flush(self):
+        """
+        Espera que acabin totes les escriptures pendents.
+
+        Returns:
+            list: Tuples (camí, error) de les escriptures fallides des de l'últim flush
+        """
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+        with self._lock:
+            failures = self.failures
+            self.failures = []
+
+        for path, error in failures:
+            print(f"❌ Error desant {path}: {error}")
+        return failures
+
+    def report(self):
+        """
+        Imprimeix el rendiment de codificació per classe d'artefacte.
+
+        Els temps són la suma dels fils; amb diversos fils, el rendiment real és més alt.
+
+        Returns:
+            dict: Estadístiques per classe (imatges, megapíxels, bytes, segons de
+                codificació i d'escriptura, Mpx/s i MB/s de codificació)
+        """
+        with self._lock:
+            report = {name: dict(stats) for name, stats in self.stats.items()}
+
+        if report:
+            print("\n🗜  CODIFICACIÓ D'IMATGES")
+            print(f"{'Classe':<16} {'Imatges':>8} {'Mpx':>8} {'MB':>8} {'Mpx/s':>8} {'MB/s':>8}")
+        for name, stats in sorted(report.items()):
+            seconds = stats["encode_seconds"]
+            stats["megapixels_per_second"] = stats["megapixels"] / seconds if seconds else 0.0
+            stats["megabytes_per_second"] = stats["bytes"] / 1e6 / seconds if seconds else 0.0
+            print(f"{name:<16} {stats['images']:>8} {stats['megapixels']:>8.1f} {stats['bytes'] / 1e6:>8.1f} "
+                  f"{stats['megapixels_per_second']:>8.1f} {stats['megabytes_per_second']:>8.1f}")
+        return report
+
+    def close(self):
+        """Buida la cua i atura els fils de codificació."""
+        failures = self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        return failures
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Processament per Lots de Cartes VFR
+
+Aquest script processa una sèrie completa de cartes (una carpeta, un patró glob
+o una llista de fitxers) repartint-les entre un grup de processos. Cada carta
+s'executa aïllada: una fallada no atura la resta del lot, i al final es mostra
+un resum agregat amb el rendiment obtingut.
+
+Ús:
+    python batch_processing.py cartes/ --pipeline vertices --workers 8
+    python batch_processing.py "cartes/VFR-*.png" --pipeline preprocess --persist final
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+from airspace_vertex_detector import AirspaceVertexDetector, DEFAULT_COLOR_RANGES
+from chart_preprocessing import ChartPreprocessor, PERSIST_POLICIES
+from polygon_superimposer import PolygonSuperimposer
+from stage_profiler import StageProfiler
+from step_cache import StepCache
+
+CHART_EXTENSIONS = (".png", ".tif", ".tiff")
+PIPELINES = ("preprocess", "vertices", "polygons")
+
+
+def find_charts(inputs):
+    """
+    Retorna la llista ordenada de cartes a partir de carpetes, patrons glob o fitxers.
+
+    Args:
+        inputs (list): Carpetes, patrons glob o camins de fitxers
+    """
+    charts = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in os.listdir(item):
+                if name.lower().endswith(CHART_EXTENSIONS):
+                    charts.add(os.path.join(item, name))
+        elif os.path.isfile(item):
+            charts.add(item)
+        else:
+            charts.update(path for path in glob.glob(item) if path.lower().endswith(CHART_EXTENSIONS))
+    return sorted(charts)
+
+
+def chart_folder_names(charts):
+    """
+    Retorna el nom de la carpeta de resultats de cada carta.
+
+    És el nom del fitxer sense extensió; si diverses cartes el comparteixen (p. ex.
+    a/VFR.png i b/VFR.png), s'hi afegeix un sufix derivat del seu camí absolut.
+
+    Args:
+        charts (list): Camins de les cartes
+    """
+    stems = [Path(chart).stem for chart in charts]
+    counts = {}
+    for stem in stems:
+        counts[stem] = counts.get(stem, 0) + 1
+    return [stem if counts[stem] == 1 else
+            f"{stem}_{hashlib.sha1(str(Path(chart).resolve()).encode()).hexdigest()[:8]}"
+            for chart, stem in zip(charts, stems)]
+
+
+def _init_worker(opencv_threads):
+    """Limita els fils d'OpenCV de cada procés per evitar la sobresubscripció."""
+    cv2.setNumThreads(opencv_threads)
+
+
+def process_chart(chart_path, output_folder, pipeline="vertices", persist="final", cache_dir=None,
+                  profile=False, folder_name=None):
+    """
+    Processa una carta en el procés actual.
+
+    La sortida de consola de la carta es desa a log.txt dins la seva carpeta.
+
+    Args:
+        chart_path (str): Camí a la carta
+        output_folder (str): Carpeta base dels resultats del lot
+        pipeline (str): "preprocess", "vertices" o "polygons"
+        persist (str): Política de persistència del preprocessament
+        cache_dir (str): Carpeta opcional de la memòria cau de passos
+        profile (bool): Desar el perfil per etapes (profile.json/csv) a la carpeta de la carta
+        folder_name (str): Nom de la carpeta de la carta (per defecte, el nom del fitxer;
+            vegeu chart_folder_names)
+
+    Returns:
+        dict: Resultat de la carta (estat, carpeta, temps, megapíxels i error si n'hi ha)
+    """
+    chart_folder = Path(output_folder) / (folder_name or Path(chart_path).stem)
+    chart_folder.mkdir(parents=True, exist_ok=True)
+    cache = StepCache(cache_dir) if cache_dir else None
+    profiler = StageProfiler(enabled=profile)
+    result = {"chart": chart_path, "folder": str(chart_folder), "pipeline": pipeline, "status": "ok",
+              "megapixels": 0.0}
+
+    start = time.perf_counter()
+    try:
+        with open(chart_folder / "log.txt", "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+            if pipeline == "preprocess":
+                preprocessor = ChartPreprocessor(chart_path, output_folder=chart_folder / "preprocessing",
+                                                 persist=persist, cache=cache, profiler=profiler)
+                preprocessor.run_full_pipeline(color_ranges=DEFAULT_COLOR_RANGES)
+                image = preprocessor.original_image
+            elif pipeline == "vertices":
+                detector = AirspaceVertexDetector(image_path=chart_path, cache=cache, profiler=profiler)
+                detector.detect_airspace_areas()
+                detector.extract_polygon_vertices()
+                detector.save_vertex_data(str(chart_folder / "vertex_data.json"))
+                detector.save_spatial_index(str(chart_folder / "spatial_index.npz"))
+                detector.export_vertices_csv(str(chart_folder / "vertex_coordinates.csv"))
+                image = detector.original_image
+                result["polygons"] = len(detector.polygons)
+                profiler.save(chart_folder)
+            elif pipeline == "polygons":
+                superimposer = PolygonSuperimposer(image_path=chart_path, output_base_folder=chart_folder,
+                                                   profiler=profiler)
+                superimposer.run_complete_analysis()
+                image = superimposer.original_image
+                result["polygons"] = sum(len(polygons) for polygons in superimposer.vertex_data.values())
+            else:
+                raise ValueError(f"Pipeline desconegut: {pipeline}")
+        result["megapixels"] = image.shape[0] * image.shape[1] / 1e6
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        profiler.close()
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(charts, output_folder, pipeline="vertices", workers=None, opencv_threads=1,
+              persist="final", cache_dir=None, profile=False):
+    """
+    Processa un lot de cartes en paral·lel.
+
+    Args:
+        charts (list): Camins de les cartes
+        output_folder (str): Carpeta base dels resultats
+        pipeline (str): "preprocess", "vertices" o "polygons"
+        workers (int): Nombre de processos (per defecte, nombre de CPU)
+        opencv_threads (int): Fils d'OpenCV per procés
+        persist (str): Política de persistència del preprocessament
+        cache_dir (str): Carpeta opcional de la memòria cau de passos
+        profile (bool): Desar un perfil per etapes de cada carta
+
+    Returns:
+        dict: Resum agregat del lot
+    """
+    workers = workers or os.cpu_count() or 1
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+
+    print(f"🚀 Processant {len(charts)} cartes amb {workers} processos ({opencv_threads} fils OpenCV cadascun)")
+    results = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(opencv_threads,)) as executor:
+        futures = {executor.submit(process_chart, chart, str(output_folder), pipeline, persist, cache_dir,
+                                   profile, folder_name): chart
+                   for chart, folder_name in zip(charts, chart_folder_names(charts))}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # El procés ha mort (p. ex. per memòria): només falla aquesta carta
+                result = {"chart": futures[future], "pipeline": pipeline, "status": "error",
+                          "error": f"{type(e).__name__}: {e}", "seconds": 0.0, "megapixels": 0.0}
+            results.append(result)
+
+            if result["status"] == "ok":
+                print(f"✓ [{len(results)}/{len(charts)}] {result['chart']}: {result['seconds']:.1f} s")
+            else:
+                print(f"❌ [{len(results)}/{len(charts)}] {result['chart']}: {result['error']}")
+
+    elapsed = time.perf_counter() - start
+    succeeded = [r for r in results if r["status"] == "ok"]
+    megapixels = sum(r["megapixels"] for r in succeeded)
+    summary = {
+        "timestamp": datetime.now().isoformat(),
+        "pipeline": pipeline,
+        "workers": workers,
+        "opencv_threads": opencv_threads,
+        "total_charts": len(charts),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "elapsed_seconds": elapsed,
+        "charts_per_minute": len(succeeded) / elapsed * 60 if elapsed else 0.0,
+        "megapixels_per_second": megapixels / elapsed if elapsed else 0.0,
+        "charts": sorted(results, key=lambda r: r["chart"]),
+    }
+
+    with open(output_folder / "batch_summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print("\n📊 RESUM DEL LOT")
+    print("=" * 50)
+    print(f"   Cartes correctes: {summary['succeeded']} / {summary['total_charts']}")
+    print(f"   Cartes fallides: {summary['failed']}")
+    print(f"   Temps total: {elapsed:.1f} s")
+    print(f"   Rendiment: {summary['charts_per_minute']:.1f} cartes/min, "
+          f"{summary['megapixels_per_second']:.1f} Mpx/s")
+    print(f"   Resum desat a: {output_folder / 'batch_summary.json'}")
+    return summary
+
+
+def main():
+    """Funció principal de la línia d'ordres."""
+    parser = argparse.ArgumentParser(description="Processament per lots de cartes VFR")
+    parser.add_argument("inputs", nargs="+", help="Carpetes, patrons glob o fitxers de cartes")
+    parser.add_argument("--pipeline", choices=PIPELINES, default="vertices",
+                        help="Procés a executar per a cada carta (per defecte: vertices)")
+    parser.add_argument("--output", default=f"batch_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                        help="Carpeta base dels resultats")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processos (per defecte: CPU)")
+    parser.add_argument("--opencv-threads", type=int, default=1, help="Fils d'OpenCV per procés")
+    parser.add_argument("--persist", default="final", choices=PERSIST_POLICIES,
+                        help="Política de persistència del preprocessament")
+    parser.add_argument("--cache", default=None, help="Carpeta de la memòria cau de passos")
+    parser.add_argument("--profile", action="store_true",
+                        help="Desar el perfil de temps i memòria per etapes de cada carta")
+    args = parser.parse_args()
+
+    charts = find_charts(args.inputs)
+    if not charts:
+        print("⚠️  No s'han trobat cartes a processar.")
+        return 1
+
+    summary = run_batch(charts, args.output, pipeline=args.pipeline, workers=args.workers,
+                        opencv_threads=args.opencv_threads, persist=args.persist, cache_dir=args.cache,
+                        profile=args.profile)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,18 +3,159 @@ import numpy as np
 import os
 from pathlib import Path
 import json
+import tempfile
 from datetime import datetime
 
+from artifact_writer import ArtifactWriter
+from color_classifier import HSVColorClassifier
+from geo_transform import GeoTransform
+from stage_profiler import StageProfiler, profiled
+
+
+def iter_tiles(height, width, tile_size, halo=0):
+    """
+    Split an image into square tiles surrounded by a halo of context pixels.
+    
+    Args:
+        height (int): Image height in pixels
+        width (int): Image width in pixels
+        tile_size (int): Side of each (core) tile in pixels
+        halo (int): Extra pixels read around each tile, clipped at the image border
+    
+    Yields:
+        tuple: ((y0, y1, x0, x1), (py0, py1, px0, px1)) core and padded windows
+    """
+    for y0 in range(0, height, tile_size):
+        y1 = min(y0 + tile_size, height)
+        for x0 in range(0, width, tile_size):
+            x1 = min(x0 + tile_size, width)
+            padded = (max(y0 - halo, 0), min(y1 + halo, height),
+                      max(x0 - halo, 0), min(x1 + halo, width))
+            yield (y0, y1, x0, x1), padded
+
+
+# Declared preprocessing graph, in topological order:
+# output name -> (input names, description printed when the step runs)
+PIPELINE_GRAPH = {
+    "grayscale": (("original",), "Convertint a escala de grisos"),
+    "hsv": (("original",), "Convertint a HSV"),
+    "gaussian": (("grayscale",), "Aplicant desenfocament gaussià"),
+    "median": (("gaussian",), "Aplicant desenfocament de mediana"),
+    "threshold": (("gaussian",), "Aplicant umbralització"),
+    "adaptive_threshold": (("gaussian",), "Aplicant umbralització adaptativa"),
+    "edges": (("gaussian",), "Detectant vores"),
+    "dilated": (("gaussian",), "Aplicant dilatació"),
+    "eroded": (("gaussian",), "Aplicant erosió"),
+    "opened": (("gaussian",), "Aplicant obertura morfològica"),
+    "closed": (("gaussian",), "Aplicant tancament morfològic"),
+    "contours": (("gaussian",), "Detectant contorns"),
+    "polygons": (("contours",), "Aproximant polígons"),
+    "segmentation": (("hsv",), "Realitzant segmentació de color"),
+    "info_boxes": (("original",), "Retallant caixes d'informació"),
+    "text_enhancement": (("gaussian",), "Millorant text per a OCR"),
+    "coordinate_mapping": ((), "Configurant mapatge de coordenades"),
+}
+
+# Default parameters of the parameterised steps (overridable per run with step_params)
+DEFAULT_STEP_PARAMS = {
+    "gaussian": {"kernel_size": (5, 5), "sigma": 0},
+    "median": {"kernel_size": 5},
+    "threshold": {"threshold_value": 127, "max_value": 255, "threshold_type": cv2.THRESH_BINARY},
+    "adaptive_threshold": {"max_value": 255, "adaptive_method": cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                           "threshold_type": cv2.THRESH_BINARY, "block_size": 11, "C": 2},
+    "edges": {"low_threshold": 50, "high_threshold": 150},
+    "dilated": {"kernel_size": (5, 5), "iterations": 1},
+    "eroded": {"kernel_size": (5, 5), "iterations": 1},
+    "opened": {"kernel_size": (5, 5), "iterations": 1},
+    "closed": {"kernel_size": (5, 5), "iterations": 1},
+    "contours": {"mode": cv2.RETR_EXTERNAL, "method": cv2.CHAIN_APPROX_SIMPLE},
+    "polygons": {"epsilon_factor": 0.02},
+    "segmentation": {"single_pass": False},
+}
+
+# Outputs that are cheap to recompute and never stored in the step cache
+UNCACHED_OUTPUTS = {"info_boxes", "coordinate_mapping"}
+
+# Pixel-local outputs that the tiled mode can produce
+TILED_OUTPUTS = {"grayscale", "hsv", "gaussian", "median", "threshold", "adaptive_threshold",
+                 "dilated", "eroded", "opened", "closed", "segmentation"}
+
+
+# Output folder of each preprocessing step
+STEP_FOLDERS = [
+    "01_original",
+    "02_grayscale",
+    "03_hsv",
+    "04_noise_reduction_gaussian",
+    "05_noise_reduction_median",
+    "06_thresholding",
+    "07_binarization",
+    "08_edge_detection",
+    "09_morphological_dilate",
+    "10_morphological_erode",
+    "11_morphological_open",
+    "12_morphological_close",
+    "13_contours",
+    "14_polygon_approximation",
+    "15_color_segmentation",
+    "16_cropped_info_boxes",
+    "17_text_enhancement",
+    "18_coordinate_mapping"
+]
+
+# Steps whose artifacts are final products; everything else is an intermediate
+FINAL_STEPS = {
+    "13_contours",
+    "14_polygon_approximation",
+    "15_color_segmentation",
+    "16_cropped_info_boxes",
+    "17_text_enhancement",
+    "18_coordinate_mapping"
+}
+
+# Intermediates only worth writing when debugging (HSV is meaningless as a PNG)
+DEBUG_ONLY_STEPS = {"03_hsv"}
+
+# Artifact persistence policies:
+#   off     - write nothing
+#   final   - write only final products
+#   debug   - write every step (default)
+#   sampled - write final products plus downscaled thumbnails of intermediates
+PERSIST_POLICIES = ("off", "final", "debug", "sampled")
+
+
 class ChartPreprocessor:
-    def __init__(self, input_image_path, output_folder=None):
+    def __init__(self, input_image_path, output_folder=None, tile_size=None, writer=None,
+                 persist="debug", thumbnail_size=512, cache=None, profiler=None):
         """
         Initialize the chart preprocessor with input image and output folder.
         
         Args:
             input_image_path (str): Path to the input PNG/TIFF image
             output_folder (str): Folder to save preprocessing steps (if None, creates timestamped folder)
+            tile_size (int): If set, run the pixel-local steps tile by tile on disk-backed
+                arrays so peak memory depends on the tile size instead of the chart size
+            writer (ArtifactWriter): Writer used to encode and save images; pass one with
+                worker threads to overlap PNG encoding with processing, and per-class
+                encodings ("final", "intermediate", "thumbnail") to trade size for speed
+                (default: synchronous, OpenCV PNG defaults)
+            persist (str): Artifact persistence policy, one of PERSIST_POLICIES
+            thumbnail_size (int): Longest side of intermediate thumbnails in "sampled" mode
+            cache (StepCache): Optional content-addressed cache of step results
+            profiler (StageProfiler): Optional per-step timing and memory instrumentation;
+                run_full_pipeline saves its profile next to the step folders
         """
+        if persist not in PERSIST_POLICIES:
+            raise ValueError(f"Unknown persistence policy '{persist}', expected one of {PERSIST_POLICIES}")
+        
         self.input_path = input_image_path
+        self.persist = persist
+        self.thumbnail_size = thumbnail_size
+        self.cache = cache
+        self.tile_size = tile_size
+        self.writer = writer if writer is not None else ArtifactWriter(max_workers=0)
+        self.profiler = profiler if profiler is not None else StageProfiler(enabled=False)
+        self._scratch_dir = None
         
         # Create timestamped output folder if none specified
         if output_folder is None:
@@ -34,38 +175,71 @@ class ChartPreprocessor:
         self._load_image()
     
     def _create_output_folders(self):
-        """Create folder structure for each preprocessing step."""
-        folders = [
-            "01_original",
-            "02_grayscale",
-            "03_hsv",
-            "04_noise_reduction_gaussian",
-            "05_noise_reduction_median",
-            "06_thresholding",
-            "07_binarization",
-            "08_edge_detection",
-            "09_morphological_dilate",
-            "10_morphological_erode",
-            "11_morphological_open",
-            "12_morphological_close",
-            "13_contours",
-            "14_polygon_approximation",
-            "15_color_segmentation",
-            "16_cropped_info_boxes",
-            "17_text_enhancement",
-            "18_coordinate_mapping"
-        ]
-        
-        for folder in folders:
-            (self.output_folder / folder).mkdir(parents=True, exist_ok=True)
+        """Create folder structure for each preprocessing step kept by the persistence policy."""
+        for folder in STEP_FOLDERS:
+            if self._artifact_mode(folder):
+                (self.output_folder / folder).mkdir(parents=True, exist_ok=True)
+    
+    def _artifact_mode(self, step_name):
+        """
+        Return how the artifacts of a step are persisted under the current policy.
+        
+        Returns:
+            str: "full", "thumbnail" or None (not written)
+        """
+        step_folder = step_name.split("/")[0]
+        if self.persist == "debug":
+            return "full"
+        if self.persist == "off" or step_folder in DEBUG_ONLY_STEPS:
+            return None
+        if step_folder in FINAL_STEPS:
+            return "full"
+        return "thumbnail" if self.persist == "sampled" else None
+    
+    def _persist_image(self, step_name, file_path, image):
+        """
+        Write a step image according to the persistence policy.
+        
+        The writer encodes it by artifact class: "final" (FINAL_STEPS), "intermediate"
+        or "thumbnail" (downscaled intermediates in "sampled" mode).
+        
+        Returns:
+            str: Path of the written file (its extension follows the class encoding), or None
+        """
+        mode = self._artifact_mode(step_name)
+        if mode is None:
+            return None
+        
+        if mode == "thumbnail":
+            height, width = image.shape[:2]
+            scale = self.thumbnail_size / max(height, width)
+            if scale < 1:
+                image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        
+        if mode == "thumbnail":
+            artifact_class = "thumbnail"
+        else:
+            artifact_class = "final" if step_name.split("/")[0] in FINAL_STEPS else "intermediate"
+        
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        return self.writer.write_image(file_path, image, artifact_class=artifact_class)
     
+    @profiled("load_image", output=lambda self, result: self.original_image)
     def _load_image(self):
         """Load the input image and store basic information."""
         self.original_image = cv2.imread(self.input_path)
         if self.original_image is None:
             raise ValueError(f"Could not load image from {self.input_path}")
         
-        self.current_image = self.original_image.copy()
+        if self.tile_size:
+            # Keep the decoded chart on disk; tiles are paged in on demand
+            original = self._scratch_array("original", self.original_image.shape)
+            original[:] = self.original_image
+            self.original_image = original
+            self.current_image = self.original_image
+        else:
+            self.current_image = self.original_image.copy()
         
         # Store image information
         self.image_info = {
@@ -76,14 +250,23 @@ class ChartPreprocessor:
         }
         
         # Save original image
-        cv2.imwrite(str(self.output_folder / "01_original" / "original.png"), self.original_image)
+        self._persist_image("01_original", self.output_folder / "01_original" / "original.png",
+                            self.original_image)
         print(f"✓ Imatge carregada: {self.image_info['width']}x{self.image_info['height']} píxels")
     
+    def _scratch_array(self, name, shape, dtype=np.uint8):
+        """Create a disk-backed array in the temporary tile folder."""
+        if self._scratch_dir is None:
+            self._scratch_dir = tempfile.TemporaryDirectory(prefix="chart_tiles_")
+        path = os.path.join(self._scratch_dir.name, f"{name}.npy")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    
     def save_step(self, image, step_name, filename="result.png", additional_info=None):
         """Save the current processing step."""
         folder_path = self.output_folder / step_name
-        file_path = folder_path / filename
-        cv2.imwrite(str(file_path), image)
+        file_path = self._persist_image(step_name, folder_path / filename, image)
+        if file_path is None:
+            return
         
         if additional_info:
             info_path = folder_path / "info.json"
@@ -92,40 +275,44 @@ class ChartPreprocessor:
         
         print(f"✓ Desat {step_name}: {file_path}")
     
-    def convert_to_grayscale(self):
-        """Convert image to grayscale."""
-        gray = cv2.cvtColor(self.current_image, cv2.COLOR_BGR2GRAY)
+    def convert_to_grayscale(self, image=None):
+        """Convert image to grayscale (the current image unless one is given)."""
+        gray = cv2.cvtColor(self.current_image if image is None else image, cv2.COLOR_BGR2GRAY)
         self.save_step(gray, "02_grayscale", "grayscale.png")
-        self.current_image = gray
+        if image is None:
+            self.current_image = gray
         return gray
     
-    def convert_to_hsv(self):
-        """Convert image to HSV color space."""
-        hsv = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2HSV)
+    def convert_to_hsv(self, image=None):
+        """Convert image to HSV color space (the original image unless one is given)."""
+        hsv = cv2.cvtColor(self.original_image if image is None else image, cv2.COLOR_BGR2HSV)
         self.save_step(hsv, "03_hsv", "hsv.png")
         return hsv
     
-    def apply_gaussian_blur(self, kernel_size=(5, 5), sigma=0):
+    def apply_gaussian_blur(self, kernel_size=(5, 5), sigma=0, image=None):
         """Apply Gaussian blur for noise reduction."""
-        blurred = cv2.GaussianBlur(self.current_image, kernel_size, sigma)
+        blurred = cv2.GaussianBlur(self.current_image if image is None else image, kernel_size, sigma)
         self.save_step(blurred, "04_noise_reduction_gaussian", "gaussian_blur.png", 
                       {"kernel_size": kernel_size, "sigma": sigma})
-        self.current_image = blurred
+        if image is None:
+            self.current_image = blurred
         return blurred
     
-    def apply_median_blur(self, kernel_size=5):
+    def apply_median_blur(self, kernel_size=5, image=None):
         """Apply median blur for noise reduction."""
-        blurred = cv2.medianBlur(self.current_image, kernel_size)
+        blurred = cv2.medianBlur(self.current_image if image is None else image, kernel_size)
         self.save_step(blurred, "05_noise_reduction_median", "median_blur.png",
                       {"kernel_size": kernel_size})
         return blurred
     
-    def apply_thresholding(self, threshold_value=127, max_value=255, threshold_type=cv2.THRESH_BINARY):
+    def apply_thresholding(self, threshold_value=127, max_value=255, threshold_type=cv2.THRESH_BINARY,
+                           image=None):
         """Apply thresholding to the image."""
-        if len(self.current_image.shape) == 3:
-            gray = cv2.cvtColor(self.current_image, cv2.COLOR_BGR2GRAY)
+        image = self.current_image if image is None else image
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
-            gray = self.current_image
+            gray = image
         
         _, thresh = cv2.threshold(gray, threshold_value, max_value, threshold_type)
         self.save_step(thresh, "06_thresholding", "threshold.png",
@@ -134,12 +321,13 @@ class ChartPreprocessor:
         return thresh
     
     def apply_adaptive_thresholding(self, max_value=255, adaptive_method=cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                  threshold_type=cv2.THRESH_BINARY, block_size=11, C=2):
+                                  threshold_type=cv2.THRESH_BINARY, block_size=11, C=2, image=None):
         """Apply adaptive thresholding for better binarization."""
-        if len(self.current_image.shape) == 3:
-            gray = cv2.cvtColor(self.current_image, cv2.COLOR_BGR2GRAY)
+        image = self.current_image if image is None else image
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
-            gray = self.current_image
+            gray = image
         
         adaptive_thresh = cv2.adaptiveThreshold(gray, max_value, adaptive_method, 
                                               threshold_type, block_size, C)
@@ -148,50 +336,59 @@ class ChartPreprocessor:
                        "threshold_type": threshold_type, "block_size": block_size, "C": C})
         return adaptive_thresh
     
-    def detect_edges_canny(self, low_threshold=50, high_threshold=150):
+    def detect_edges_canny(self, low_threshold=50, high_threshold=150, image=None):
         """Apply Canny edge detection."""
-        if len(self.current_image.shape) == 3:
-            gray = cv2.cvtColor(self.current_image, cv2.COLOR_BGR2GRAY)
+        image = self.current_image if image is None else image
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
-            gray = self.current_image
+            gray = image
         
         edges = cv2.Canny(gray, low_threshold, high_threshold)
         self.save_step(edges, "08_edge_detection", "canny_edges.png",
                       {"low_threshold": low_threshold, "high_threshold": high_threshold})
         return edges
     
-    def apply_morphological_operations(self, kernel_size=(5, 5), iterations=1):
-        """Apply various morphological operations."""
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
-        
-        # Dilation
-        dilated = cv2.dilate(self.current_image, kernel, iterations=iterations)
-        self.save_step(dilated, "09_morphological_dilate", "dilated.png",
-                      {"kernel_size": kernel_size, "iterations": iterations})
-        
-        # Erosion
-        eroded = cv2.erode(self.current_image, kernel, iterations=iterations)
-        self.save_step(eroded, "10_morphological_erode", "eroded.png",
-                      {"kernel_size": kernel_size, "iterations": iterations})
-        
-        # Opening (erosion followed by dilation)
-        opened = cv2.morphologyEx(self.current_image, cv2.MORPH_OPEN, kernel, iterations=iterations)
-        self.save_step(opened, "11_morphological_open", "opened.png",
-                      {"kernel_size": kernel_size, "iterations": iterations})
-        
-        # Closing (dilation followed by erosion)
-        closed = cv2.morphologyEx(self.current_image, cv2.MORPH_CLOSE, kernel, iterations=iterations)
-        self.save_step(closed, "12_morphological_close", "closed.png",
-                      {"kernel_size": kernel_size, "iterations": iterations})
+    def apply_morphological_operations(self, kernel_size=(5, 5), iterations=1, image=None,
+                                       operations=("dilate", "erode", "open", "close")):
+        """
+        Apply various morphological operations.
         
-        return dilated, eroded, opened, closed
+        Returns one result per requested operation, in the order given.
+        """
+        image = self.current_image if image is None else image
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+        info = {"kernel_size": kernel_size, "iterations": iterations}
+        results = []
+        
+        for operation in operations:
+            if operation == "dilate":
+                result = cv2.dilate(image, kernel, iterations=iterations)
+                self.save_step(result, "09_morphological_dilate", "dilated.png", info)
+            elif operation == "erode":
+                result = cv2.erode(image, kernel, iterations=iterations)
+                self.save_step(result, "10_morphological_erode", "eroded.png", info)
+            elif operation == "open":
+                # Opening (erosion followed by dilation)
+                result = cv2.morphologyEx(image, cv2.MORPH_OPEN, kernel, iterations=iterations)
+                self.save_step(result, "11_morphological_open", "opened.png", info)
+            elif operation == "close":
+                # Closing (dilation followed by erosion)
+                result = cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel, iterations=iterations)
+                self.save_step(result, "12_morphological_close", "closed.png", info)
+            else:
+                raise ValueError(f"Unknown morphological operation: {operation}")
+            results.append(result)
+        
+        return tuple(results)
     
-    def detect_contours(self, mode=cv2.RETR_EXTERNAL, method=cv2.CHAIN_APPROX_SIMPLE):
+    def detect_contours(self, mode=cv2.RETR_EXTERNAL, method=cv2.CHAIN_APPROX_SIMPLE, image=None):
         """Detect contours in the image."""
-        if len(self.current_image.shape) == 3:
-            gray = cv2.cvtColor(self.current_image, cv2.COLOR_BGR2GRAY)
+        image = self.current_image if image is None else image
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
-            gray = self.current_image
+            gray = image
         
         contours, hierarchy = cv2.findContours(gray, mode, method)
         
@@ -222,28 +419,43 @@ class ChartPreprocessor:
         
         return approximated_contours
     
-    def segment_colors(self, hsv_image, color_ranges):
-        """Segment image based on color ranges for airspace classes."""
+    def segment_colors(self, hsv_image, color_ranges, single_pass=False):
+        """
+        Segment image based on color ranges for airspace classes.
+        
+        With single_pass, all ranges are compiled into an HSV lookup table and the
+        masks are derived from one label image; pixels in overlapping ranges go to
+        the first class in color_ranges.
+        """
         segmented_images = {}
         
+        if single_pass:
+            classifier = HSVColorClassifier(color_ranges)
+            labels = classifier.classify(hsv_image)
+        
         for color_name, (lower, upper) in color_ranges.items():
             # Create mask for the color range
-            mask = cv2.inRange(hsv_image, np.array(lower), np.array(upper))
+            if single_pass:
+                mask = classifier.mask(labels, color_name)
+            else:
+                mask = cv2.inRange(hsv_image, np.array(lower), np.array(upper))
             
             # Apply mask to original image
             segmented = cv2.bitwise_and(self.original_image, self.original_image, mask=mask)
             
-            # Save segmented image
-            folder_name = f"15_color_segmentation/{color_name}"
-            (self.output_folder / folder_name).mkdir(parents=True, exist_ok=True)
-            cv2.imwrite(str(self.output_folder / folder_name / f"{color_name}_segmented.png"), segmented)
-            cv2.imwrite(str(self.output_folder / folder_name / f"{color_name}_mask.png"), mask)
-            
+            self._save_segmentation(color_name, segmented, mask)
             segmented_images[color_name] = segmented
-            print(f"✓ Segmentació de color per a {color_name}")
         
         return segmented_images
     
+    def _save_segmentation(self, color_name, segmented, mask):
+        """Save the segmented image and mask of one airspace class."""
+        folder_name = f"15_color_segmentation/{color_name}"
+        self._persist_image(folder_name, self.output_folder / folder_name / f"{color_name}_segmented.png",
+                            segmented)
+        self._persist_image(folder_name, self.output_folder / folder_name / f"{color_name}_mask.png", mask)
+        print(f"✓ Segmentació de color per a {color_name}")
+    
     def crop_info_boxes(self, boxes):
         """Crop information boxes from the image."""
         cropped_boxes = []
@@ -253,8 +465,7 @@ class ChartPreprocessor:
             
             # Save cropped box
             folder_name = f"16_cropped_info_boxes/box_{i+1}"
-            (self.output_folder / folder_name).mkdir(parents=True, exist_ok=True)
-            cv2.imwrite(str(self.output_folder / folder_name / f"box_{i+1}.png"), cropped)
+            self._persist_image(folder_name, self.output_folder / folder_name / f"box_{i+1}.png", cropped)
             
             cropped_boxes.append(cropped)
             print(f"✓ Caixa d'informació retallada {i+1}: {w}x{h} píxels")
@@ -279,111 +490,405 @@ class ChartPreprocessor:
         self.save_step(enhanced, "17_text_enhancement", "enhanced_text.png")
         return enhanced
     
-    def map_pixel_to_latlon(self, pixel_coords, chart_bounds):
+    def map_pixel_to_latlon(self, pixel_coords, chart_bounds=None, transform=None, save_mapping=True):
         """
         Map pixel coordinates to latitude/longitude.
         
         Args:
-            pixel_coords: List of (x, y) pixel coordinates
+            pixel_coords: List of (x, y) pixel coordinates, or an (N, 2) array
             chart_bounds: Dictionary with 'north', 'south', 'east', 'west' bounds
+                (linear lat/lon box, used when no transform is given)
+            transform: Optional geo_transform.GeoTransform (GCP affine and/or
+                Lambert conformal projection)
+            save_mapping: Write coordinate_mapping.json (subject to the persist policy)
+        
+        Returns:
+            List of (lat, lon) tuples, or an (N, 2) array if pixel_coords is an array
         """
         height, width = self.original_image.shape[:2]
+        if transform is None:
+            if chart_bounds is None:
+                raise ValueError("Cal chart_bounds o una transformació")
+            transform = GeoTransform.from_chart_bounds(chart_bounds, width, height)
+        
+        # Convert all pixel coordinates at once
+        latlon = transform.points_to_latlon(pixel_coords)
+        latlon_coords = latlon if isinstance(pixel_coords, np.ndarray) else [tuple(p) for p in latlon.tolist()]
+        
+        if save_mapping and self._artifact_mode("18_coordinate_mapping"):
+            mapping_info = {
+                "pixel_coords": np.asarray(pixel_coords).tolist(),
+                "latlon_coords": latlon.tolist(),
+                "chart_bounds": chart_bounds,
+                "image_dimensions": {"width": width, "height": height},
+                "transform": transform.to_dict()
+            }
+            if transform.projection is None and chart_bounds is not None:
+                mapping_info["scale_factors"] = {"lat_scale": -transform.affine[1, 1],
+                                                 "lon_scale": transform.affine[0, 0]}
+            
+            info_path = self.output_folder / "18_coordinate_mapping" / "coordinate_mapping.json"
+            with open(info_path, 'w') as f:
+                json.dump(mapping_info, f, indent=2)
         
-        # Calculate scale factors
-        lat_range = chart_bounds['north'] - chart_bounds['south']
-        lon_range = chart_bounds['east'] - chart_bounds['west']
-        
-        lat_scale = lat_range / height
-        lon_scale = lon_range / width
-        
-        # Convert pixel coordinates to lat/lon
-        latlon_coords = []
-        for x, y in pixel_coords:
-            lat = chart_bounds['north'] - (y * lat_scale)
-            lon = chart_bounds['west'] + (x * lon_scale)
-            latlon_coords.append((lat, lon))
-        
-        # Save coordinate mapping info
-        mapping_info = {
-            "pixel_coords": pixel_coords,
-            "latlon_coords": latlon_coords,
-            "chart_bounds": chart_bounds,
-            "image_dimensions": {"width": width, "height": height},
-            "scale_factors": {"lat_scale": lat_scale, "lon_scale": lon_scale}
-        }
-        
-        info_path = self.output_folder / "18_coordinate_mapping" / "coordinate_mapping.json"
-        with open(info_path, 'w') as f:
-            json.dump(mapping_info, f, indent=2)
-        
-        print(f"✓ Mapejades {len(pixel_coords)} coordenades a lat/lon")
+        print(f"✓ Mapejades {len(latlon)} coordenades a lat/lon")
         return latlon_coords
     
-    def run_full_pipeline(self, chart_bounds=None, color_ranges=None, info_boxes=None):
-        """Run the complete preprocessing pipeline."""
-        print("Iniciant pipeline de preprocessament de cartes...")
-        print("=" * 50)
-        
-        # Step 1: Already loaded original image
+    @staticmethod
+    def resolve_step_params(step_params=None):
+        """Merge per-step parameter overrides into DEFAULT_STEP_PARAMS."""
+        step_params = step_params or {}
+        unknown = set(step_params) - set(DEFAULT_STEP_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown step parameters for: {sorted(unknown)}")
+        return {name: {**defaults, **step_params.get(name, {})}
+                for name, defaults in DEFAULT_STEP_PARAMS.items()}
+    
+    @classmethod
+    def compute_tile_halo(cls, step_params=None):
+        """
+        Return the halo (in pixels) needed for bit-identical tiled results.
         
-        # Step 2: Grayscale conversion
-        print("\n2. Convertint a escala de grisos...")
-        self.convert_to_grayscale()
+        The Gaussian blur feeds every other local step, so its radius adds to the
+        largest radius among the steps that consume it. Opening and closing chain
+        two passes of the structuring element.
+        """
+        params = cls.resolve_step_params(step_params)
+        gaussian_radius = max(params["gaussian"]["kernel_size"]) // 2
+        radii = [params["median"]["kernel_size"] // 2, params["adaptive_threshold"]["block_size"] // 2]
+        for name, passes in [("dilated", 1), ("eroded", 1), ("opened", 2), ("closed", 2)]:
+            radii.append(passes * (max(params[name]["kernel_size"]) // 2) * params[name]["iterations"])
+        return gaussian_radius + max(radii)
+    
+    @profiled("tiled_sweep")
+    def run_tiled_steps(self, color_ranges=None, tile_size=None, outputs=None, step_params=None):
+        """
+        Run the pixel-local steps tile by tile and stitch the results.
         
-        # Step 3: HSV conversion
-        print("\n3. Convertint a HSV...")
-        hsv_image = self.convert_to_hsv()
+        Covers grayscale, HSV, Gaussian/median blur, thresholding, adaptive
+        binarization, the four morphological operations and color segmentation.
+        Each tile is read with a halo sized to the largest kernel, so the stitched
+        images are bit-identical to the full-frame steps. Results are written to
+        disk-backed arrays and saved exactly like the full-frame steps.
         
-        # Step 4: Noise reduction
-        print("\n4. Aplicant reducció de soroll...")
-        self.apply_gaussian_blur()
-        self.apply_median_blur()
+        Args:
+            color_ranges (dict): Optional HSV ranges for color segmentation
+            tile_size (int): Tile side in pixels (defaults to self.tile_size or 1024)
+            outputs (set): Names from TILED_OUTPUTS to produce (default: all of them)
+            step_params (dict): Per-step parameter overrides of DEFAULT_STEP_PARAMS
+        
+        Returns:
+            dict: Stitched outputs by step name; "segmentation" maps each color to
+            its segmented image and "segmentation_masks" to its mask
+        """
+        tile_size = tile_size or self.tile_size or 1024
+        height, width = self.image_info["height"], self.image_info["width"]
+        params = self.resolve_step_params(step_params)
+        halo = self.compute_tile_halo(step_params)
+        color_ranges = color_ranges or {}
+        wanted = set(TILED_OUTPUTS if outputs is None else outputs)
+        if not color_ranges:
+            wanted.discard("segmentation")
+        
+        def morphology(name, op):
+            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, params[name]["kernel_size"])
+            return lambda b: cv2.morphologyEx(b, op, kernel, iterations=params[name]["iterations"])
+        
+        # Steps computed from the blurred grayscale tile
+        blur_ops = {
+            "median": lambda b: cv2.medianBlur(b, params["median"]["kernel_size"]),
+            "threshold": lambda b: cv2.threshold(b, params["threshold"]["threshold_value"],
+                                                 params["threshold"]["max_value"],
+                                                 params["threshold"]["threshold_type"])[1],
+            "adaptive_threshold": lambda b: cv2.adaptiveThreshold(
+                b, maxValue=params["adaptive_threshold"]["max_value"],
+                adaptiveMethod=params["adaptive_threshold"]["adaptive_method"],
+                thresholdType=params["adaptive_threshold"]["threshold_type"],
+                blockSize=params["adaptive_threshold"]["block_size"], C=params["adaptive_threshold"]["C"]),
+            "dilated": morphology("dilated", cv2.MORPH_DILATE),
+            "eroded": morphology("eroded", cv2.MORPH_ERODE),
+            "opened": morphology("opened", cv2.MORPH_OPEN),
+            "closed": morphology("closed", cv2.MORPH_CLOSE),
+        }
+        needs_gray = bool(wanted & ({"grayscale", "gaussian"} | set(blur_ops)))
+        needs_hsv = bool(wanted & {"hsv", "segmentation"})
+        classifier = None
+        if "segmentation" in wanted and params["segmentation"]["single_pass"]:
+            classifier = HSVColorClassifier(color_ranges)
+        
+        stitched = {}
+        for name in wanted - {"segmentation"}:
+            shape = (height, width, 3) if name == "hsv" else (height, width)
+            stitched[name] = self._scratch_array(name, shape)
+        if "segmentation" in wanted:
+            for color_name in color_ranges:
+                stitched[f"{color_name}_mask"] = self._scratch_array(f"{color_name}_mask", (height, width))
+                stitched[f"{color_name}_segmented"] = self._scratch_array(f"{color_name}_segmented",
+                                                                          (height, width, 3))
+        
+        num_tiles = 0
+        for (y0, y1, x0, x1), (py0, py1, px0, px1) in iter_tiles(height, width, tile_size, halo):
+            tile = np.ascontiguousarray(self.original_image[py0:py1, px0:px1])
+            core = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+            results = {}
+            
+            if needs_gray:
+                results["grayscale"] = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+                results["gaussian"] = blurred = cv2.GaussianBlur(results["grayscale"],
+                                                                 params["gaussian"]["kernel_size"],
+                                                                 params["gaussian"]["sigma"])
+                for name, op in blur_ops.items():
+                    if name in wanted:
+                        results[name] = op(blurred)
+            if needs_hsv:
+                results["hsv"] = hsv = cv2.cvtColor(tile, cv2.COLOR_BGR2HSV)
+                if "segmentation" in wanted:
+                    labels = classifier.classify(hsv) if classifier is not None else None
+                    for color_name, (lower, upper) in color_ranges.items():
+                        if classifier is not None:
+                            mask = classifier.mask(labels, color_name)
+                        else:
+                            mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+                        results[f"{color_name}_mask"] = mask
+                        results[f"{color_name}_segmented"] = cv2.bitwise_and(tile, tile, mask=mask)
+            
+            for name, result in results.items():
+                if name in stitched:
+                    stitched[name][y0:y1, x0:x1] = result[core]
+            num_tiles += 1
+        
+        print(f"✓ Processades {num_tiles} teselles de {tile_size}px (marge {halo}px)")
+        
+        saves = {
+            "grayscale": ("02_grayscale", "grayscale.png"),
+            "hsv": ("03_hsv", "hsv.png"),
+            "gaussian": ("04_noise_reduction_gaussian", "gaussian_blur.png"),
+            "median": ("05_noise_reduction_median", "median_blur.png"),
+            "threshold": ("06_thresholding", "threshold.png"),
+            "adaptive_threshold": ("07_binarization", "adaptive_threshold.png"),
+            "dilated": ("09_morphological_dilate", "dilated.png"),
+            "eroded": ("10_morphological_erode", "eroded.png"),
+            "opened": ("11_morphological_open", "opened.png"),
+            "closed": ("12_morphological_close", "closed.png"),
+        }
+        for name, (step_name, filename) in saves.items():
+            if name in stitched:
+                self.save_step(stitched[name], step_name, filename, params.get(name))
+        
+        outputs = {name: stitched[name] for name in wanted - {"segmentation"}}
+        if "segmentation" in wanted:
+            outputs["segmentation"] = {}
+            outputs["segmentation_masks"] = {}
+            for color_name in color_ranges:
+                segmented = stitched[f"{color_name}_segmented"]
+                mask = stitched[f"{color_name}_mask"]
+                self._save_segmentation(color_name, segmented, mask)
+                outputs["segmentation"][color_name] = segmented
+                outputs["segmentation_masks"][color_name] = mask
+        return outputs
+    
+    def _pipeline_step_functions(self, params, chart_bounds=None, color_ranges=None, info_boxes=None):
+        """Map each PIPELINE_GRAPH output to the callable that computes it from its inputs."""
+        def morphology(name, operation):
+            return lambda blurred: self.apply_morphological_operations(image=blurred, operations=(operation,),
+                                                                       **params[name])[0]
+        
+        return {
+            "grayscale": lambda original: self.convert_to_grayscale(image=original),
+            "hsv": lambda original: self.convert_to_hsv(image=original),
+            "gaussian": lambda gray: self.apply_gaussian_blur(image=gray, **params["gaussian"]),
+            "median": lambda blurred: self.apply_median_blur(image=blurred, **params["median"]),
+            "threshold": lambda blurred: self.apply_thresholding(image=blurred, **params["threshold"]),
+            "adaptive_threshold": lambda blurred: self.apply_adaptive_thresholding(
+                image=blurred, **params["adaptive_threshold"]),
+            "edges": lambda blurred: self.detect_edges_canny(image=blurred, **params["edges"]),
+            "dilated": morphology("dilated", "dilate"),
+            "eroded": morphology("eroded", "erode"),
+            "opened": morphology("opened", "open"),
+            "closed": morphology("closed", "close"),
+            "contours": lambda blurred: self.detect_contours(image=blurred, **params["contours"]),
+            "polygons": lambda found: self.approximate_polygons(found[0], **params["polygons"]),
+            "segmentation": lambda hsv: self.segment_colors(hsv, color_ranges, **params["segmentation"]),
+            "info_boxes": lambda original: self.crop_info_boxes(info_boxes),
+            "text_enhancement": lambda blurred: self.enhance_text_for_ocr(blurred),
+            # Example pixel coordinates (you can modify these)
+            "coordinate_mapping": lambda: self.map_pixel_to_latlon([(100, 100), (500, 300), (800, 600)],
+                                                                   chart_bounds),
+        }
+    
+    @staticmethod
+    def resolve_pipeline(outputs, is_cached=None):
+        """
+        Return, in execution order, the steps needed to produce the requested outputs.
         
-        # Step 5: Thresholding
-        print("\n5. Aplicant umbralització...")
-        self.apply_thresholding()
-        self.apply_adaptive_thresholding()
+        Args:
+            outputs (iterable): Names from PIPELINE_GRAPH
+            is_cached (callable): Optional predicate; cached steps are loaded instead of
+                computed, so their ancestors are not needed for them
+        """
+        needed = set()
+        pending = list(outputs)
+        while pending:
+            name = pending.pop()
+            if name == "original" or name in needed:
+                continue
+            if name not in PIPELINE_GRAPH:
+                raise ValueError(f"Unknown pipeline output: {name}")
+            needed.add(name)
+            if is_cached is None or not is_cached(name):
+                pending.extend(PIPELINE_GRAPH[name][0])
+        # PIPELINE_GRAPH is declared in topological order
+        return [name for name in PIPELINE_GRAPH if name in needed]
+    
+    def _step_cache_keys(self, params, chart_bounds=None, color_ranges=None, info_boxes=None):
+        """Return the content-addressed cache key of every PIPELINE_GRAPH output."""
+        extra_params = {"segmentation": color_ranges, "info_boxes": info_boxes,
+                        "coordinate_mapping": chart_bounds}
+        keys = {"original": self.cache.hash_image(self.original_image)}
+        for name, (inputs, _) in PIPELINE_GRAPH.items():
+            step_params = {"params": params.get(name), "inputs": extra_params.get(name)}
+            keys[name] = self.cache.step_key(name, step_params, [keys[input_name] for input_name in inputs])
+        return keys
+    
+    @profiled()
+    def compute_outputs(self, outputs, chart_bounds=None, color_ranges=None, info_boxes=None,
+                        step_params=None):
+        """
+        Compute only the requested pipeline outputs and their ancestors.
         
-        # Step 6: Edge detection
-        print("\n6. Detectant vores...")
-        self.detect_edges_canny()
+        Each intermediate is computed once and released as soon as no pending
+        step consumes it. With a step cache, cached outputs are loaded instead and
+        computation restarts at the first invalidated step; cached steps do not
+        write their artifacts again.
         
-        # Step 7: Morphological operations
-        print("\n7. Aplicant operacions morfològiques...")
-        self.apply_morphological_operations()
+        Args:
+            outputs (iterable): Names from PIPELINE_GRAPH, e.g. {"contours", "segmentation"}
+            step_params (dict): Per-step parameter overrides of DEFAULT_STEP_PARAMS
         
-        # Step 8: Contour detection
-        print("\n8. Detectant contorns...")
-        contours, hierarchy = self.detect_contours()
+        Returns:
+            dict: Requested outputs by name
+        """
+        targets = set(outputs)
+        params = self.resolve_step_params(step_params)
+        
+        keys = {}
+        loaded = {}
+        is_cached = None
+        if self.cache is not None:
+            keys = self._step_cache_keys(params, chart_bounds, color_ranges, info_boxes)
+            unreadable = set()
+            is_cached = lambda name: name in loaded or (
+                name not in UNCACHED_OUTPUTS and name not in unreadable and self.cache.contains(keys[name]))
+        order = self.resolve_pipeline(targets, is_cached)
+        
+        if self.cache is not None:
+            # Cached outputs are loaded before anything is computed. An entry that cannot be
+            # read (corrupted, or evicted meanwhile) is recomputed, with its missing ancestors.
+            pending = [name for name in order if is_cached(name)]
+            while pending:
+                for name in pending:
+                    with self.profiler.stage(name, component="ChartPreprocessor", cached=True):
+                        value = self.cache.get(keys[name])
+                    if value is None:
+                        unreadable.add(name)
+                    else:
+                        loaded[name] = value
+                order = self.resolve_pipeline(targets, is_cached)
+                pending = [name for name in order if is_cached(name) and name not in loaded]
+        
+        requirements = {"segmentation": color_ranges, "info_boxes": info_boxes,
+                        "coordinate_mapping": chart_bounds}
+        for name, requirement in requirements.items():
+            if name in order and not requirement:
+                raise ValueError(f"Pipeline output '{name}' needs its parameters to be provided")
+        
+        cached = {name for name in order if name in loaded}
+        computed = [name for name in order if name not in cached]
+        
+        steps = self._pipeline_step_functions(params, chart_bounds, color_ranges, info_boxes)
+        tiled_names = TILED_OUTPUTS.intersection(computed)
+        if self.tile_size and tiled_names:
+            # Pixel-local steps are produced together by a single tiled sweep
+            tiled = self.run_tiled_steps(color_ranges, outputs=tiled_names, step_params=step_params)
+            for name in tiled_names:
+                steps[name] = lambda *inputs, name=name: tiled.pop(name)
+        
+        consumers = {}
+        for name in computed:
+            for input_name in PIPELINE_GRAPH[name][0]:
+                consumers[input_name] = consumers.get(input_name, 0) + 1
+        
+        # Entries this run relies on must survive the evictions triggered by its own writes
+        pinned = [keys[name] for name in cached]
+        if self.cache is not None:
+            self.cache.pin(pinned)
+        
+        results = {"original": self.original_image}
+        try:
+            for name in order:
+                inputs, description = PIPELINE_GRAPH[name]
+                if name in cached:
+                    results[name] = loaded.pop(name)
+                    print(f"\n♻ {description} (recuperat de la memòria cau)")
+                    continue
+                
+                print(f"\n→ {description}...")
+                with self.profiler.stage(name, component="ChartPreprocessor") as record:
+                    results[name] = steps[name](*(results[input_name] for input_name in inputs))
+                    self.profiler.record_output(record, results[name])
+                if self.cache is not None and name not in UNCACHED_OUTPUTS:
+                    self.cache.put(keys[name], results[name])
+                
+                for input_name in inputs:
+                    consumers[input_name] -= 1
+                    if consumers[input_name] == 0 and input_name not in targets and input_name != "original":
+                        del results[input_name]
+        finally:
+            if self.cache is not None:
+                self.cache.unpin(pinned)
+        
+        return {name: results[name] for name in targets}
+    
+    def run_full_pipeline(self, chart_bounds=None, color_ranges=None, info_boxes=None, outputs=None,
+                          step_params=None):
+        """
+        Run the complete preprocessing pipeline.
         
-        # Step 9: Polygon approximation
-        print("\n9. Aproximant polígons...")
-        approximated_contours = self.approximate_polygons(contours)
+        Args:
+            outputs (iterable): Optional subset of PIPELINE_GRAPH outputs; only these and
+                their ancestors are computed (default: every step whose parameters are given)
+            step_params (dict): Per-step parameter overrides of DEFAULT_STEP_PARAMS,
+                e.g. {"gaussian": {"kernel_size": (7, 7)}}
         
-        # Step 10: Color segmentation (if color ranges provided)
-        if color_ranges:
-            print("\n10. Realitzant segmentació de color...")
-            self.segment_colors(hsv_image, color_ranges)
+        Returns:
+            dict: Computed outputs by name
+        """
+        print("Iniciant pipeline de preprocessament de cartes...")
+        print("=" * 50)
         
-        # Step 11: Crop info boxes (if boxes provided)
-        if info_boxes:
-            print("\n11. Retallant caixes d'informació...")
-            self.crop_info_boxes(info_boxes)
+        if outputs is None:
+            optional = {"segmentation": color_ranges, "info_boxes": info_boxes,
+                        "coordinate_mapping": chart_bounds}
+            outputs = [name for name in PIPELINE_GRAPH if optional.get(name, True)]
         
-        # Step 12: Text enhancement
-        print("\n12. Millorant text per a OCR...")
-        self.enhance_text_for_ocr(self.current_image)
+        results = self.compute_outputs(outputs, chart_bounds, color_ranges, info_boxes, step_params)
         
-        # Step 13: Coordinate mapping (if chart bounds provided)
-        if chart_bounds:
-            print("\n13. Configurant mapatge de coordenades...")
-            # Example pixel coordinates (you can modify these)
-            sample_coords = [(100, 100), (500, 300), (800, 600)]
-            self.map_pixel_to_latlon(sample_coords, chart_bounds)
+        # Wait for pending background writes before reporting
+        with self.profiler.stage("flush_writes", component="ChartPreprocessor"):
+            failures = self.writer.flush()
+        if failures:
+            print(f"⚠ No s'han pogut desar {len(failures)} fitxers")
+        if self.writer.max_workers or self.writer.encodings:
+            self.writer.report()
         
         print("\n" + "=" * 50)
         print("Pipeline de preprocessament completat!")
         print(f"Resultats desats a: {self.output_folder}")
+        
+        if self.profiler.enabled:
+            self.profiler.print_summary()
+            self.profiler.save(self.output_folder)
+        return results
 
 
 def main():
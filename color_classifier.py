@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Classificador de Colors per Taula de Consulta HSV
+
+Aquest mòdul compila tots els rangs de color dels espais aeris en una única
+taula de consulta HSV → classe. Una sola passada per la imatge produeix una
+imatge d'etiquetes uint8 compacta, i les màscares de cada classe se'n deriven
+a demanda en lloc de cridar cv2.inRange una vegada per classe.
+"""
+
+import cv2
+import numpy as np
+
+
+class HSVColorClassifier:
+    def __init__(self, color_ranges, priority=None):
+        """
+        Compila els rangs de color en una taula de consulta.
+
+        Args:
+            color_ranges (dict): Rangs HSV (inferior, superior) inclusius per a cada classe
+            priority (list): Ordre de prioritat de les classes quan els rangs se
+                solapen; la primera guanya. Per defecte, l'ordre de color_ranges
+        """
+        self.class_names = list(priority) if priority is not None else list(color_ranges)
+        if set(self.class_names) != set(color_ranges):
+            raise ValueError("La prioritat ha de contenir exactament les classes de color_ranges")
+        if len(self.class_names) > 255:
+            raise ValueError("La imatge d'etiquetes uint8 admet com a màxim 255 classes")
+
+        # 0 = fons; les classes s'identifiquen per la seva posició a la prioritat
+        self.class_ids = {name: i + 1 for i, name in enumerate(self.class_names)}
+        bounds = {name: [np.clip(bound, 0, 255).astype(int) for bound in color_ranges[name]]
+                  for name in self.class_names}
+
+        if len(self.class_names) <= 8:
+            self.channel_lut, self.priority_lut = self._compile_separable(bounds)
+            self.lut = None
+        else:
+            self.channel_lut = self.priority_lut = None
+            self.lut = self._compile(bounds)
+
+    def _compile_separable(self, bounds):
+        """
+        Construeix les taules separables per a fins a 8 classes.
+
+        Com que cada rang és una caixa H×S×V, un píxel pertany a una classe si
+        cada canal cau dins del seu interval. Cada canal té una taula de 256
+        entrades amb un bit per classe; la intersecció dels tres bits es tradueix
+        a l'identificador de la classe prioritària amb una segona taula.
+        """
+        channel_lut = [np.zeros(256, dtype=np.uint8) for _ in range(3)]
+        for i, name in enumerate(self.class_names):
+            lower, upper = bounds[name]
+            for channel in range(3):
+                channel_lut[channel][lower[channel]:upper[channel] + 1] |= np.uint8(1 << i)
+
+        # Bits de classe → identificador de la classe prioritària (bit menys significatiu)
+        priority_lut = np.zeros(256, dtype=np.uint8)
+        for bits in range(1, 256):
+            priority_lut[bits] = (bits & -bits).bit_length()
+        return channel_lut, priority_lut
+
+    def _compile(self, bounds):
+        """Construeix la taula completa H×S×V → identificador de classe (més de 8 classes)."""
+        lut = np.zeros((256, 256, 256), dtype=np.uint8)
+
+        # Pintar de menor a major prioritat perquè la classe prioritària sobreescrigui
+        for name in reversed(self.class_names):
+            (h0, s0, v0), (h1, s1, v1) = bounds[name]
+            lut[h0:h1 + 1, s0:s1 + 1, v0:v1 + 1] = self.class_ids[name]
+
+        return lut.reshape(-1)
+
+    def classify(self, hsv_image):
+        """
+        Classifica tots els píxels d'una imatge HSV en una sola passada.
+
+        Args:
+            hsv_image (np.ndarray): Imatge HSV de 8 bits (com la de cv2.COLOR_BGR2HSV)
+
+        Returns:
+            np.ndarray: Imatge d'etiquetes uint8 (0 = fons, i = classe i)
+        """
+        h, s, v = cv2.split(hsv_image)
+
+        if self.lut is None:
+            bits = cv2.LUT(h, self.channel_lut[0])
+            cv2.bitwise_and(bits, cv2.LUT(s, self.channel_lut[1]), dst=bits)
+            cv2.bitwise_and(bits, cv2.LUT(v, self.channel_lut[2]), dst=bits)
+            return cv2.LUT(bits, self.priority_lut)
+
+        index = h.astype(np.uint32)
+        index <<= 16
+        index |= s.astype(np.uint32) << 8
+        index |= v
+        return self.lut[index]
+
+    def classify_bgr(self, image):
+        """Converteix una imatge BGR a HSV i la classifica."""
+        return self.classify(cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+
+    def mask(self, labels, class_name):
+        """
+        Retorna la màscara (0/255) d'una classe a partir de la imatge d'etiquetes.
+
+        Args:
+            labels (np.ndarray): Imatge d'etiquetes retornada per classify
+            class_name (str): Nom de la classe
+        """
+        return cv2.compare(labels, self.class_ids[class_name], cv2.CMP_EQ)
+
+    def masks(self, labels):
+        """Retorna un diccionari amb la màscara de cada classe."""
+        return {name: self.mask(labels, name) for name in self.class_names}
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Exportació Compacta dels Resultats de Detecció
+
+Aquest mòdul escriu els polígons d'un PolygonStore en formats pensats per a
+resultats grans, polígon a polígon, sense construir el document sencer en
+memòria:
+
+- JSON (el mateix esquema que vertex_data.json), indentat o minificat,
+- CSV normalitzat en dues taules: una fila per polígon i una fila per vèrtex
+  (sense repetir l'àrea ni el perímetre a cada vèrtex),
+- .npz binari amb els arrays columnars del magatzem, que es torna a carregar
+  en mil·lisegons sense analitzar cap text.
+
+DetectionReader fa el camí invers de manera incremental: recorre els polígons
+d'un JSON o d'un .npz desat un a un, com a arrays NumPy, i els filtra per tipus
+d'espai aeri o per rectangle sense carregar el document sencer.
+"""
+
+import csv
+import json
+import re
+
+import numpy as np
+
+from polygon_store import STORE_ARRAYS, PolygonStore
+
+# Columnes de les taules CSV normalitzades
+POLYGON_FIELDS = ("polygon_index", "airspace_type", "polygon_id", "parent_index", "num_vertices", "area",
+                  "perimeter", "bbox_x", "bbox_y", "bbox_width", "bbox_height", "centroid_x", "centroid_y")
+VERTEX_FIELDS = ("polygon_index", "ring", "vertex_index", "x", "y")
+
+# Files de la taula de vèrtexs escrites per bloc
+CSV_CHUNK = 65536
+
+# Caràcters llegits per bloc en recórrer un JSON
+READ_CHUNK = 1 << 16
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _dumps(value, indent):
+    """Serialitza un valor JSON, indentat o minificat."""
+    if indent is None:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(value, ensure_ascii=False, indent=indent)
+
+
+def _indented(text, level, indent):
+    """Desplaça les línies (menys la primera) d'un fragment JSON indentat al nivell donat."""
+    if indent is None:
+        return text
+    return text.replace("\n", "\n" + " " * (indent * level))
+
+
+def write_json(store, output_path, metadata, indent=None):
+    """
+    Escriu els polígons en JSON (esquema de vertex_data.json) polígon a polígon.
+
+    Amb indent=2 el fitxer és idèntic al de json.dump(..., indent=2) del document
+    sencer; amb indent=None és minificat.
+
+    Args:
+        store (PolygonStore): Polígons a escriure
+        output_path (str): Camí del fitxer JSON
+        metadata (dict): Metadades del resultat (clau "metadata")
+        indent (int): Indentació, o None per a JSON minificat
+    """
+    newline = "\n" if indent is not None else ""
+    pad = (lambda level: " " * (indent * level)) if indent is not None else (lambda level: "")
+    separator = ": " if indent is not None else ":"
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("{" + newline + pad(1) + '"metadata"' + separator)
+        f.write(_indented(_dumps(metadata, indent), 1, indent))
+        f.write("," + newline + pad(1) + '"airspace_polygons"' + separator)
+        if not store.class_names:
+            f.write("{}" + newline + "}")
+            return
+        f.write("{" + newline)
+
+        for class_id, class_name in enumerate(store.class_names):
+            if class_id:
+                f.write("," + newline)
+            f.write(pad(2) + _dumps(class_name, indent) + separator)
+            indices = store.class_indices(class_name)
+            if not len(indices):
+                f.write("[]")
+                continue
+            f.write("[" + newline)
+            for k, (_, polygon) in enumerate(store.iter_polygons(indices)):
+                if k:
+                    f.write("," + newline)
+                f.write(pad(3) + _indented(_dumps(polygon, indent), 3, indent))
+            f.write(newline + pad(2) + "]")
+
+        f.write(newline + pad(1) + "}" + newline + "}")
+
+
+def write_csv_tables(store, polygons_path, vertices_path):
+    """
+    Escriu els polígons en dues taules CSV normalitzades.
+
+    La taula de polígons té una fila per polígon (POLYGON_FIELDS) i la de vèrtexs
+    una fila per vèrtex (VERTEX_FIELDS); ring és 0 per al contorn exterior i k per
+    al k-èsim forat. Les dues taules s'enllacen per polygon_index.
+
+    Args:
+        store (PolygonStore): Polígons a escriure
+        polygons_path (str): Camí del CSV de polígons
+        vertices_path (str): Camí del CSV de vèrtexs
+    """
+    names = np.array(store.class_names, dtype=object)
+    with open(polygons_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(POLYGON_FIELDS)
+        for start in range(0, len(store), CSV_CHUNK):
+            rows = slice(start, start + CSV_CHUNK)
+            bboxes, centroids = store.bboxes[rows], store.centroids[rows]
+            writer.writerows(zip(
+                range(start, start + len(bboxes)),
+                names[store.class_ids[rows]].tolist(),
+                store.polygon_ids[rows].tolist(),
+                store.parents[rows].tolist(),
+                store.num_vertices[rows].tolist(),
+                store.areas[rows].tolist(),
+                store.perimeters[rows].tolist(),
+                bboxes[:, 0].tolist(), bboxes[:, 1].tolist(), bboxes[:, 2].tolist(), bboxes[:, 3].tolist(),
+                centroids[:, 0].tolist(), centroids[:, 1].tolist(),
+            ))
+
+    # Contorns exteriors (anell 0) i forats (anell k dins del seu polígon)
+    table = store.vertex_table()
+    hole_counts = np.diff(store.hole_offsets)
+    hole_starts = np.searchsorted(store.hole_polygons, store.hole_polygons)
+    hole_rings = np.arange(len(store.hole_polygons)) - hole_starts + 1
+    columns = {
+        "polygon_index": np.concatenate([table["polygon_index"], np.repeat(store.hole_polygons, hole_counts)]),
+        "ring": np.concatenate([np.zeros(len(store.vertices), dtype=np.int64), np.repeat(hole_rings, hole_counts)]),
+        "vertex_index": np.concatenate([table["vertex_index"],
+                                        np.arange(len(store.hole_vertices)) -
+                                        np.repeat(store.hole_offsets[:-1], hole_counts) + 1]),
+        "x": np.concatenate([store.vertices[:, 0], store.hole_vertices[:, 0]]),
+        "y": np.concatenate([store.vertices[:, 1], store.hole_vertices[:, 1]]),
+    }
+    with open(vertices_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(VERTEX_FIELDS)
+        for start in range(0, len(columns["x"]), CSV_CHUNK):
+            writer.writerows(zip(*(columns[field][start:start + CSV_CHUNK].tolist() for field in VERTEX_FIELDS)))
+
+
+def save_arrays(store, output_path, metadata):
+    """
+    Desa els arrays columnars del magatzem i les metadades en un .npz.
+
+    El fitxer no es comprimeix: carregar-lo és llegir els arrays directament.
+
+    Args:
+        store (PolygonStore): Polígons a desar
+        output_path (str): Camí del fitxer .npz
+        metadata (dict): Metadades del resultat
+    """
+    arrays = store.to_arrays()
+    arrays["class_names"] = np.array(arrays["class_names"], dtype=str)
+    np.savez(output_path, metadata=np.array(json.dumps(metadata)), **arrays)
+
+
+def load_arrays(input_path):
+    """
+    Carrega un .npz de save_arrays.
+
+    Returns:
+        tuple: (PolygonStore, metadades)
+    """
+    with np.load(input_path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        arrays = {name: data[name] for name in STORE_ARRAYS if name in data}
+        arrays["class_names"] = data["class_names"].tolist()
+    return PolygonStore.from_arrays(arrays), metadata
+
+
+def read_metadata(input_path):
+    """Retorna les metadades d'un resultat desat en JSON o en .npz."""
+    if str(input_path).endswith(".npz"):
+        with np.load(input_path, allow_pickle=False) as data:
+            return json.loads(str(data["metadata"]))
+    return DetectionReader(input_path).metadata
+
+
+class _JsonStream:
+    """Analitzador incremental dels valors d'un document JSON, amb una memòria intermèdia acotada."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ""
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Afegeix un bloc del fitxer a la memòria intermèdia (descartant la part ja llegida)."""
+        chunk = self.f.read(READ_CHUNK)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Retorna el següent caràcter que no és espai (o "" al final del fitxer)."""
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, char):
+        """Consumeix el caràcter esperat."""
+        if self.peek() != char:
+            raise ValueError(f"JSON inesperat: s'esperava '{char}' i s'ha trobat '{self.peek()}'")
+        self.position += 1
+
+    def skip(self, char):
+        """Consumeix el caràcter si és el següent; retorna si hi era."""
+        if self.peek() == char:
+            self.position += 1
+            return True
+        return False
+
+    def value(self):
+        """Descodifica el següent valor complet, llegint més blocs si està tallat."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self.position = end
+            return value
+
+
+def _overlaps(bbox, box):
+    """Indica si la caixa (x, y, amplada, alçada) d'un polígon toca un rectangle inclusiu (x0, y0, x1, y1)."""
+    x, y, width, height = bbox
+    x0, y0, x1, y1 = box
+    return x <= x1 and x + max(width - 1, 0) >= x0 and y <= y1 and y + max(height - 1, 0) >= y0
+
+
+class DetectionReader:
+    def __init__(self, input_path):
+        """
+        Prepara la lectura d'un resultat desat (JSON de save_vertex_data o .npz de save_arrays).
+
+        No es llegeix cap polígon fins que es recorren.
+
+        Args:
+            input_path (str): Fitxer del resultat
+        """
+        self.input_path = str(input_path)
+        self.binary = self.input_path.endswith(".npz")
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        """Metadades del resultat (en un JSON, només es llegeix fins a la clau "metadata")."""
+        if self._metadata is None:
+            if self.binary:
+                self._metadata = read_metadata(self.input_path)
+            else:
+                for _ in self._json_polygons(stop_at_metadata=True):
+                    pass
+                self._metadata = self._metadata or {}
+        return self._metadata
+
+    def _json_polygons(self, stop_at_metadata=False):
+        """Genera (tipus, polígon en format vertex_data) del JSON, un a un."""
+        with open(self.input_path, 'r', encoding='utf-8') as f:
+            stream = _JsonStream(f)
+            stream.expect("{")
+            while not stream.skip("}"):
+                key = stream.value()
+                stream.expect(":")
+                if key != "airspace_polygons":
+                    value = stream.value()
+                    if key == "metadata":
+                        self._metadata = value
+                        if stop_at_metadata:
+                            return
+                else:
+                    stream.expect("{")
+                    while not stream.skip("}"):
+                        airspace_type = stream.value()
+                        stream.expect(":")
+                        stream.expect("[")
+                        while not stream.skip("]"):
+                            yield airspace_type, stream.value()
+                            stream.skip(",")
+                        stream.skip(",")
+                stream.skip(",")
+
+    def _npz_polygons(self, airspace_types, box):
+        """Genera els polígons del .npz que passen els filtres, avaluats sobre les columnes."""
+        with np.load(self.input_path, allow_pickle=False) as data:
+            class_names = data["class_names"].tolist()
+            class_ids, bboxes = data["class_ids"], data["bboxes"]
+            selected = np.ones(len(class_ids), dtype=bool)
+            if airspace_types is not None:
+                selected &= np.isin(class_ids, [class_names.index(name) for name in airspace_types
+                                                if name in class_names])
+            if box is not None:
+                x0, y0, x1, y1 = box
+                selected &= (bboxes[:, 0] <= x1) & (bboxes[:, 0] + np.maximum(bboxes[:, 2] - 1, 0) >= x0) & \
+                    (bboxes[:, 1] <= y1) & (bboxes[:, 1] + np.maximum(bboxes[:, 3] - 1, 0) >= y0)
+            indices = np.flatnonzero(selected)
+            if not len(indices):
+                return
+
+            vertices, offsets = data["vertices"], data["offsets"]
+            polygon_ids, parents = data["polygon_ids"], data["parents"] if "parents" in data else None
+            areas, perimeters, centroids = data["areas"], data["perimeters"], data["centroids"]
+            hole_polygons = data["hole_polygons"] if "hole_polygons" in data else np.empty(0, dtype=np.int32)
+            hole_offsets = data["hole_offsets"] if "hole_polygons" in data else np.zeros(1, dtype=np.int64)
+            hole_vertices = data["hole_vertices"] if "hole_polygons" in data else np.empty((0, 2), dtype=np.int32)
+
+            for i in indices.tolist():
+                hole_start, hole_end = np.searchsorted(hole_polygons, [i, i + 1])
+                parent = int(parents[i]) if parents is not None else -1
+                yield {
+                    "airspace_type": class_names[class_ids[i]],
+                    "id": int(polygon_ids[i]),
+                    "vertices": vertices[offsets[i]:offsets[i + 1]],
+                    "holes": [hole_vertices[hole_offsets[k]:hole_offsets[k + 1]] for k in range(hole_start, hole_end)],
+                    "area": float(areas[i]),
+                    "perimeter": float(perimeters[i]),
+                    "bbox": bboxes[i],
+                    "centroid": centroids[i],
+                    "parent": int(polygon_ids[parent]) if parent >= 0 else None,
+                }
+
+    def polygons(self, airspace_types=None, bbox=None):
+        """
+        Recorre els polígons un a un, amb els vèrtexs com a arrays NumPy.
+
+        Args:
+            airspace_types (list): Tipus d'espai aeri a conservar (per defecte, tots)
+            bbox (tuple): Rectangle (x0, y0, x1, y1) en píxels, inclusiu; només es
+                conserven els polígons amb la caixa contenidora dins o tocant-lo
+
+        Yields:
+            dict: "airspace_type", "id", "vertices" (array (N, 2) int32), "holes"
+                (llista d'arrays), "area", "perimeter", "bbox" (x, y, amplada, alçada),
+                "centroid" i "parent" (id del polígon pare o None)
+        """
+        if airspace_types is not None:
+            airspace_types = list(airspace_types)
+        if self.binary:
+            yield from self._npz_polygons(airspace_types, bbox)
+            return
+
+        for airspace_type, polygon in self._json_polygons():
+            if airspace_types is not None and airspace_type not in airspace_types:
+                continue
+            box = polygon["bounding_box"]
+            polygon_bbox = (box["x"], box["y"], box["width"], box["height"])
+            if bbox is not None and not _overlaps(polygon_bbox, bbox):
+                continue
+            yield {
+                "airspace_type": airspace_type,
+                "id": polygon["id"],
+                "vertices": np.array(polygon["vertices"], dtype=np.int32).reshape(-1, 2),
+                "holes": [np.array(hole, dtype=np.int32).reshape(-1, 2) for hole in polygon.get("holes", [])],
+                "area": polygon["area"],
+                "perimeter": polygon["perimeter"],
+                "bbox": np.array(polygon_bbox, dtype=np.int32),
+                "centroid": np.array(polygon["centroid"], dtype=np.float64),
+                "parent": polygon.get("parent"),
+            }
+
+    __iter__ = polygons
+
+    def read_store(self, airspace_types=None, bbox=None):
+        """
+        Llegeix només els polígons que passen els filtres en un PolygonStore.
+
+        Els pares que queden fora de la selecció passen a -1.
+        """
+        class_names = []
+        vertices, counts, class_ids, polygon_ids = [], [], [], []
+        areas, perimeters, bboxes, centroids, parent_ids = [], [], [], [], []
+        hole_vertices, hole_counts, hole_polygons = [], [], []
+        for polygon in self.polygons(airspace_types, bbox):
+            if polygon["airspace_type"] not in class_names:
+                class_names.append(polygon["airspace_type"])
+            for hole in polygon["holes"]:
+                hole_vertices.append(hole)
+                hole_counts.append(len(hole))
+                hole_polygons.append(len(counts))
+            vertices.append(polygon["vertices"])
+            counts.append(len(polygon["vertices"]))
+            class_ids.append(class_names.index(polygon["airspace_type"]))
+            polygon_ids.append(polygon["id"])
+            areas.append(polygon["area"])
+            perimeters.append(polygon["perimeter"])
+            bboxes.append(polygon["bbox"])
+            centroids.append(polygon["centroid"])
+            parent_ids.append(polygon["parent"])
+
+        if not counts:
+            return PolygonStore.empty(class_names)
+        index_of = {(class_id, polygon_id): i for i, (class_id, polygon_id) in enumerate(zip(class_ids, polygon_ids))}
+        parents = [index_of.get((class_id, parent_id), -1) for class_id, parent_id in zip(class_ids, parent_ids)]
+        return PolygonStore(class_names, np.concatenate(vertices), np.concatenate([[0], np.cumsum(counts)]),
+                            class_ids, polygon_ids, areas, perimeters, bboxes, centroids=centroids, parents=parents,
+                            hole_vertices=np.concatenate(hole_vertices) if hole_vertices else None,
+                            hole_offsets=np.concatenate([[0], np.cumsum(hole_counts, dtype=np.int64)]),
+                            hole_polygons=hole_polygons)
+
+    def vertex_arrays(self, airspace_types=None, bbox=None):
+        """
+        Equivalent en arrays de AirspaceVertexDetector.get_vertex_coordinates_list.
+
+        Returns:
+            dict: Arrays "airspace_type", "polygon_id", "vertex_index" (1-based), "x" i "y",
+                una fila per vèrtex dels polígons seleccionats
+        """
+        store = self.read_store(airspace_types, bbox)
+        table = store.vertex_table()
+        polygon_index = table["polygon_index"]
+        return {
+            "airspace_type": np.array(store.class_names, dtype=str)[store.class_ids[polygon_index]]
+            if len(store.class_names) else np.empty(0, dtype=str),
+            "polygon_id": store.polygon_ids[polygon_index],
+            "vertex_index": table["vertex_index"],
+            "x": table["x"],
+            "y": table["y"],
+        }
+
+
+def iter_detections(input_paths, airspace_types=None, bbox=None):
+    """
+    Recorre els polígons de diversos resultats desats (p. ex. una sèrie de cartes), un a un.
+
+    Yields:
+        tuple: (camí del resultat, polígon de DetectionReader.polygons)
+    """
+    for input_path in input_paths:
+        for polygon in DetectionReader(input_path).polygons(airspace_types, bbox):
+            yield input_path, polygon
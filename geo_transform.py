@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Transformació Vectoritzada de Píxels a Coordenades Geogràfiques
+
+Aquest mòdul converteix coordenades de píxel de la carta a latitud/longitud (i
+a la inversa) sobre arrays NumPy de qualsevol mida. Suporta:
+
+- la caixa lineal lat/lon que feia servir map_pixel_to_latlon (chart_bounds),
+- una transformació afí ajustada amb punts de control (GCP),
+- la projecció cònica conforme de Lambert (2 paral·lels) de les cartes VFR,
+  combinada amb l'afí entre píxels i coordenades projectades.
+"""
+
+import numpy as np
+
+# El·lipsoides (semieix major en metres, aplanament invers)
+ELLIPSOIDS = {
+    "WGS84": (6378137.0, 298.257223563),
+    "GRS80": (6378137.0, 298.257222101),
+    "CLARKE1866": (6378206.4, 294.9786982),
+}
+
+# Lambert-93 (RGF93), la cònica conforme oficial de França
+LAMBERT_93 = {
+    "lat_1": 49.0, "lat_2": 44.0, "lat_0": 46.5, "lon_0": 3.0,
+    "false_easting": 700000.0, "false_northing": 6600000.0, "ellipsoid": "GRS80",
+}
+
+
+def resolve_transform(transform, default=None):
+    """
+    Retorna la GeoTransform d'una consulta en lat/lon: la donada o, si és None, default.
+
+    Raises:
+        ValueError: Si no n'hi ha cap
+    """
+    transform = transform or default
+    if transform is None:
+        raise ValueError("Cal una GeoTransform per a les consultes en lat/lon")
+    return transform
+
+
+class LambertConformalConic:
+    def __init__(self, lat_1, lat_2, lat_0, lon_0, false_easting=0.0, false_northing=0.0,
+                 ellipsoid="WGS84"):
+        """
+        Inicialitza una projecció cònica conforme de Lambert amb dos paral·lels (EPSG 9802).
+
+        Args:
+            lat_1, lat_2 (float): Paral·lels estàndard en graus
+            lat_0, lon_0 (float): Latitud i longitud de l'origen en graus
+            false_easting, false_northing (float): Desplaçaments de l'origen en metres
+            ellipsoid (str): Nom de l'el·lipsoide a ELLIPSOIDS
+        """
+        self.params = {"lat_1": lat_1, "lat_2": lat_2, "lat_0": lat_0, "lon_0": lon_0,
+                       "false_easting": false_easting, "false_northing": false_northing,
+                       "ellipsoid": ellipsoid}
+        a, inverse_flattening = ELLIPSOIDS[ellipsoid]
+        f = 1.0 / inverse_flattening
+        self.a = a
+        self.e = np.sqrt(2 * f - f * f)
+        self.lon_0 = np.radians(lon_0)
+        self.false_easting = false_easting
+        self.false_northing = false_northing
+
+        phi_1, phi_2, phi_0 = np.radians([lat_1, lat_2, lat_0])
+        m_1, m_2 = self._m(phi_1), self._m(phi_2)
+        t_1, t_2, t_0 = self._t(phi_1), self._t(phi_2), self._t(phi_0)
+        if np.isclose(lat_1, lat_2):
+            self.n = np.sin(phi_1)
+        else:
+            self.n = (np.log(m_1) - np.log(m_2)) / (np.log(t_1) - np.log(t_2))
+        self.F = m_1 / (self.n * t_1 ** self.n)
+        self.r_0 = self.a * self.F * t_0 ** self.n
+
+    def _m(self, phi):
+        return np.cos(phi) / np.sqrt(1 - (self.e * np.sin(phi)) ** 2)
+
+    def _t(self, phi):
+        e_sin = self.e * np.sin(phi)
+        return np.tan(np.pi / 4 - phi / 2) / ((1 - e_sin) / (1 + e_sin)) ** (self.e / 2)
+
+    def forward(self, lat, lon):
+        """
+        Projecta latitud/longitud (graus) a coordenades planes (metres).
+
+        Returns:
+            tuple: Arrays (easting, northing)
+        """
+        phi = np.radians(np.asarray(lat, dtype=np.float64))
+        lam = np.radians(np.asarray(lon, dtype=np.float64))
+        r = self.a * self.F * self._t(phi) ** self.n
+        theta = self.n * (lam - self.lon_0)
+        easting = self.false_easting + r * np.sin(theta)
+        northing = self.false_northing + self.r_0 - r * np.cos(theta)
+        return easting, northing
+
+    def inverse(self, easting, northing, iterations=8):
+        """
+        Converteix coordenades planes (metres) a latitud/longitud (graus).
+
+        Returns:
+            tuple: Arrays (lat, lon)
+        """
+        dx = np.asarray(easting, dtype=np.float64) - self.false_easting
+        dy = self.r_0 - (np.asarray(northing, dtype=np.float64) - self.false_northing)
+        sign = np.sign(self.n)
+        r = sign * np.hypot(dx, dy)
+        theta = np.arctan2(sign * dx, sign * dy)
+        t = (r / (self.a * self.F)) ** (1 / self.n)
+
+        # La latitud no té forma tancada: iteració de punt fix (convergeix en poques passes)
+        phi = np.pi / 2 - 2 * np.arctan(t)
+        for _ in range(iterations):
+            e_sin = self.e * np.sin(phi)
+            phi = np.pi / 2 - 2 * np.arctan(t * ((1 - e_sin) / (1 + e_sin)) ** (self.e / 2))
+
+        lam = theta / self.n + self.lon_0
+        return np.degrees(phi), np.degrees(lam)
+
+
+class GeoTransform:
+    def __init__(self, affine, projection=None):
+        """
+        Inicialitza la transformació píxel ↔ geogràfica.
+
+        Args:
+            affine (array): Matriu 2x3 que porta (x, y, 1) de píxel a (lon, lat) en graus,
+                o a (easting, northing) en metres si hi ha projecció
+            projection (LambertConformalConic): Projecció opcional de la carta
+        """
+        self.affine = np.asarray(affine, dtype=np.float64).reshape(2, 3)
+        self.projection = projection
+        self.inverse_affine = np.linalg.inv(np.vstack([self.affine, [0, 0, 1]]))[:2]
+        self.residual_rms = None
+
+    @classmethod
+    def from_chart_bounds(cls, chart_bounds, width, height):
+        """
+        Crea la transformació lineal equivalent a map_pixel_to_latlon.
+
+        Args:
+            chart_bounds (dict): Límits 'north', 'south', 'east', 'west'
+            width, height (int): Mida de la carta en píxels
+        """
+        lat_scale = (chart_bounds['north'] - chart_bounds['south']) / height
+        lon_scale = (chart_bounds['east'] - chart_bounds['west']) / width
+        return cls([[lon_scale, 0.0, chart_bounds['west']],
+                    [0.0, -lat_scale, chart_bounds['north']]])
+
+    @classmethod
+    def from_control_points(cls, pixel_points, latlon_points, projection=None):
+        """
+        Ajusta una transformació afí per mínims quadrats a partir de punts de control.
+
+        Args:
+            pixel_points (array): Array (N, 2) de coordenades (x, y) de píxel, N >= 3
+            latlon_points (array): Array (N, 2) de coordenades (lat, lon) en graus
+            projection (LambertConformalConic): Si es dona, l'afí s'ajusta en
+                coordenades projectades, de manera que la transformació segueix la
+                projecció de la carta en lloc d'una caixa lineal lat/lon
+        """
+        pixel_points = np.asarray(pixel_points, dtype=np.float64)
+        latlon_points = np.asarray(latlon_points, dtype=np.float64)
+        if len(pixel_points) < 3 or len(pixel_points) != len(latlon_points):
+            raise ValueError("Calen almenys 3 parelles de punts de control")
+
+        if projection is not None:
+            targets = np.column_stack(projection.forward(latlon_points[:, 0], latlon_points[:, 1]))
+        else:
+            targets = latlon_points[:, ::-1]
+
+        design = np.column_stack([pixel_points, np.ones(len(pixel_points))])
+        solution, _, _, _ = np.linalg.lstsq(design, targets, rcond=None)
+        transform = cls(solution.T, projection)
+
+        residuals = design @ solution - targets
+        transform.residual_rms = float(np.sqrt(np.mean(np.sum(residuals ** 2, axis=1))))
+        return transform
+
+    def pixel_to_latlon(self, x, y):
+        """
+        Converteix coordenades de píxel a latitud/longitud.
+
+        Args:
+            x, y (array): Coordenades de píxel de qualsevol forma
+
+        Returns:
+            tuple: Arrays (lat, lon) amb la mateixa forma que x i y
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        u = self.affine[0, 0] * x + self.affine[0, 1] * y + self.affine[0, 2]
+        v = self.affine[1, 0] * x + self.affine[1, 1] * y + self.affine[1, 2]
+        if self.projection is not None:
+            return self.projection.inverse(u, v)
+        return v, u
+
+    def latlon_to_pixel(self, lat, lon):
+        """
+        Converteix latitud/longitud a coordenades de píxel (amb decimals).
+
+        Returns:
+            tuple: Arrays (x, y) amb la mateixa forma que lat i lon
+        """
+        if self.projection is not None:
+            u, v = self.projection.forward(lat, lon)
+        else:
+            u = np.asarray(lon, dtype=np.float64)
+            v = np.asarray(lat, dtype=np.float64)
+        x = self.inverse_affine[0, 0] * u + self.inverse_affine[0, 1] * v + self.inverse_affine[0, 2]
+        y = self.inverse_affine[1, 0] * u + self.inverse_affine[1, 1] * v + self.inverse_affine[1, 2]
+        return x, y
+
+    def latlon_to_points(self, latlon):
+        """Converteix un array (N, 2) de (lat, lon) a un array (N, 2) de punts (x, y)."""
+        latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+        x, y = self.latlon_to_pixel(latlon[:, 0], latlon[:, 1])
+        return np.column_stack([x, y])
+
+    def points_to_latlon(self, points):
+        """Converteix un array (N, 2) de punts (x, y) a un array (N, 2) de (lat, lon)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        lat, lon = self.pixel_to_latlon(points[:, 0], points[:, 1])
+        return np.column_stack([lat, lon])
+
+    def to_dict(self):
+        """Retorna una representació serialitzable en JSON."""
+        return {
+            "affine": self.affine.tolist(),
+            "projection": self.projection.params if self.projection is not None else None,
+            "residual_rms": self.residual_rms,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Reconstrueix una transformació des de to_dict."""
+        projection = LambertConformalConic(**data["projection"]) if data.get("projection") else None
+        transform = cls(data["affine"], projection)
+        transform.residual_rms = data.get("residual_rms")
+        return transform
@@ -7,6 +7,7 @@ dels polígons d'espais aeris en format net i llegible.
 """
 
 from airspace_vertex_detector import AirspaceVertexDetector
+from detection_io import DetectionReader
 import os
 
 def get_coordinates_from_image(image_path):
@@ -85,6 +86,30 @@ def get_coordinates_from_preprocessed(folder_path):
         print(f"❌ Error: {e}")
         return []
 
+def get_coordinates_from_results(results_path, airspace_types=None, bbox=None):
+    """
+    Obté les coordenades dels vèrtexs d'un resultat desat, sense tornar a detectar.
+    
+    Els polígons es llegeixen un a un (vegeu DetectionReader), de manera que només
+    els seleccionats es carreguen en memòria.
+    
+    Args:
+        results_path (str): JSON de save_vertex_data o .npz de save_polygon_arrays
+        airspace_types (list): Tipus d'espai aeri a conservar (per defecte, tots)
+        bbox (tuple): Rectangle (x0, y0, x1, y1) en píxels (opcional)
+    
+    Returns:
+        dict: Arrays "airspace_type", "polygon_id", "vertex_index", "x" i "y"
+    """
+    print(f"🔍 Llegint resultat desat: {results_path}")
+    
+    coordinates = DetectionReader(results_path).vertex_arrays(airspace_types, bbox)
+    
+    print(f"\n📊 RESUM:")
+    print(f"   Total vèrtexs llegits: {len(coordinates['x'])}")
+    
+    return coordinates
+
 def print_coordinates_simple(coordinates):
     """
     Imprimeix les coordenades en format simple.
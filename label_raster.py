@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Ràster d'Etiquetes d'Espais Aeris
+
+Aquest mòdul rasteritza els polígons d'un PolygonStore en una imatge int32 de la
+mida de la carta, de manera que saber en quins espais aeris cau un punt és una
+simple lectura de píxel (O(1)), sense proves geomètriques.
+
+Com que els espais aeris se superposen, cada píxel no guarda un polígon sinó un
+identificador de conjunt: el conjunt 0 és buit i cada altre identifica una
+combinació de polígons diferent (una taula CSR en dona els membres). Així el
+ràster manté 4 bytes per píxel sigui quin sigui el nombre de polígons, a
+diferència d'un mapa de bits per polígon.
+
+El ràster es pot desar en una carpeta (labels.npy + tables.npz) i es torna a
+obrir mapejat en memòria, sense llegir-lo sencer.
+"""
+
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from geo_transform import GeoTransform, resolve_transform
+from polygon_store import STORE_ARRAYS, PolygonStore, expand_ranges
+
+LABELS_FILE = "labels.npy"
+TABLES_FILE = "tables.npz"
+
+
+class LabelRaster:
+    def __init__(self, labels, set_offsets, set_members, store, transform=None, image_hash=None):
+        """
+        Inicialitza el ràster a partir de les seves taules (vegeu build i load).
+
+        Args:
+            labels (np.ndarray): Imatge (alçada, amplada) int32 d'identificadors de conjunt
+            set_offsets (array): Inici dels membres de cada conjunt (CSR, conjunts + 1 elements)
+            set_members (array): Índexs de polígon (del magatzem) de tots els conjunts
+            store (PolygonStore): Polígons rasteritzats
+            transform (GeoTransform): Georeferenciació per a les consultes en lat/lon
+            image_hash (str): Hash de la imatge dels polígons
+        """
+        self.labels = labels
+        self.set_offsets = np.asarray(set_offsets, dtype=np.int64)
+        self.set_members = np.asarray(set_members, dtype=np.int32)
+        self.store = store
+        self.transform = transform
+        self.image_hash = image_hash
+
+    @classmethod
+    def build(cls, store, shape, output_folder=None, transform=None, image_hash=None):
+        """
+        Rasteritza els polígons, amb un cv2.fillPoly per polígon retallat a la seva caixa.
+
+        Args:
+            store (PolygonStore): Polígons a rasteritzar
+            shape (tuple): Forma (alçada, amplada) de la carta
+            output_folder (str): Si es dona, el ràster s'escriu directament en un fitxer
+                mapejat en memòria d'aquesta carpeta (i s'hi desen les taules)
+            transform (GeoTransform): Georeferenciació opcional
+            image_hash (str): Hash opcional de la imatge dels polígons
+        """
+        height, width = shape[:2]
+        if output_folder is not None:
+            output_folder = Path(output_folder)
+            output_folder.mkdir(parents=True, exist_ok=True)
+            labels = np.lib.format.open_memmap(output_folder / LABELS_FILE, mode="w+", dtype=np.int32,
+                                               shape=(height, width))
+            labels[:] = 0
+        else:
+            labels = np.zeros((height, width), dtype=np.int32)
+
+        # Conjunts de polígons vistos fins ara; el conjunt 0 és el buit
+        sets = [()]
+        set_ids = {(): 0}
+        for index in range(len(store)):
+            x, y, w, h = store.bboxes[index].tolist()
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + w, width), min(y + h, height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(mask, store.polygon_rings(index), 1, offset=(-x0, -y0))
+            inside = mask.view(bool)
+            region = labels[y0:y1, x0:x1]
+
+            # Cada conjunt present a la regió passa a incloure aquest polígon
+            old_ids, inverse = np.unique(region[inside], return_inverse=True)
+            new_ids = np.empty_like(old_ids)
+            for k, old_id in enumerate(old_ids.tolist()):
+                members = sets[old_id] + (index,)
+                if members not in set_ids:
+                    set_ids[members] = len(sets)
+                    sets.append(members)
+                new_ids[k] = set_ids[members]
+            region[inside] = new_ids[inverse]
+
+        set_offsets = np.zeros(len(sets) + 1, dtype=np.int64)
+        np.cumsum([len(members) for members in sets], out=set_offsets[1:])
+        set_members = np.fromiter((i for members in sets for i in members), dtype=np.int32,
+                                  count=int(set_offsets[-1]))
+
+        raster = cls(labels, set_offsets, set_members, store, transform=transform, image_hash=image_hash)
+        if output_folder is not None:
+            labels.flush()
+            raster._save_tables(output_folder)
+            print(f"✓ Ràster d'etiquetes desat: {output_folder} ({len(sets) - 1} conjunts de polígons)")
+        return raster
+
+    def _save_tables(self, output_folder):
+        """Desa les taules de conjunts, els polígons i les metadades."""
+        arrays = self.store.to_arrays()
+        arrays["class_names"] = np.array(arrays["class_names"], dtype=str)
+        metadata = {
+            "transform": self.transform.to_dict() if self.transform is not None else None,
+            "image_sha256": self.image_hash,
+        }
+        np.savez_compressed(Path(output_folder) / TABLES_FILE, set_offsets=self.set_offsets,
+                            set_members=self.set_members, metadata=np.array(json.dumps(metadata)), **arrays)
+
+    def save(self, output_folder):
+        """Desa el ràster i les taules en una carpeta (vegeu load)."""
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        np.save(output_folder / LABELS_FILE, self.labels)
+        self._save_tables(output_folder)
+        print(f"✓ Ràster d'etiquetes desat: {output_folder}")
+
+    @classmethod
+    def load(cls, input_folder, mmap=True):
+        """
+        Obre un ràster desat.
+
+        Args:
+            input_folder (str): Carpeta de build o save
+            mmap (bool): Mapejar el ràster en memòria (només es llegeixen les pàgines consultades)
+        """
+        input_folder = Path(input_folder)
+        labels = np.load(input_folder / LABELS_FILE, mmap_mode="r" if mmap else None)
+        with np.load(input_folder / TABLES_FILE, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            arrays = {name: data[name] for name in STORE_ARRAYS if name in data}
+            arrays["class_names"] = data["class_names"].tolist()
+            set_offsets, set_members = data["set_offsets"], data["set_members"]
+
+        transform = metadata["transform"]
+        return cls(labels, set_offsets, set_members, PolygonStore.from_arrays(arrays),
+                   transform=GeoTransform.from_dict(transform) if transform else None,
+                   image_hash=metadata["image_sha256"])
+
+    @property
+    def num_sets(self):
+        """Nombre de conjunts de polígons (sense comptar el buit)."""
+        return len(self.set_offsets) - 2
+
+    def lookup(self, points):
+        """
+        Identificador de conjunt del píxel de cada punt (0 si és fora de tot polígon o de la carta).
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel; s'arrodoneixen al píxel
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        height, width = self.labels.shape
+        x = np.rint(points[:, 0]).astype(np.int64)
+        y = np.rint(points[:, 1]).astype(np.int64)
+        valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        set_ids = np.zeros(len(points), dtype=np.int32)
+        set_ids[valid] = self.labels[y[valid], x[valid]]
+        return set_ids
+
+    def polygon_counts(self, points):
+        """Nombre de polígons que cobreixen el píxel de cada punt."""
+        set_ids = self.lookup(points)
+        return (self.set_offsets[set_ids + 1] - self.set_offsets[set_ids]).astype(np.int32)
+
+    def query_points(self, points):
+        """
+        Troba els polígons que cobreixen cada punt (com PolygonIndex.query_points).
+
+        Returns:
+            tuple: Arrays (índexs de punt, índexs de polígon), ordenats per punt
+        """
+        set_ids = self.lookup(points)
+        starts = self.set_offsets[set_ids]
+        counts = self.set_offsets[set_ids + 1] - starts
+        point_indices = np.repeat(np.arange(len(set_ids)), counts)
+        return point_indices, self.set_members[expand_ranges(starts, counts)]
+
+    def query_latlon(self, latlon, transform=None):
+        """
+        Com query_points, amb punts (lat, lon) en graus.
+
+        Args:
+            latlon (array): Array (N, 2) de (lat, lon)
+            transform (GeoTransform): Georeferenciació (per defecte, la del ràster)
+        """
+        return self.query_points(resolve_transform(transform, self.transform).latlon_to_points(latlon))
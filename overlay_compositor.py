@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Compositor de Capes de Polígons
+
+Aquest mòdul superposa polígons semitransparents sobre una imatge fent una sola
+barreja per capa (tipus d'espai aeri) en lloc d'una barreja de tota la imatge
+per cada polígon. Els emplenaments de cada capa s'acumulen en una màscara de
+cobertura retallada a la caixa contenidora de cada polígon; després es
+dibuixen a sobre els contorns, els vèrtexs i les etiquetes.
+"""
+
+import cv2
+import numpy as np
+
+# Colors BGR de cada tipus d'espai aeri
+AIRSPACE_COLORS = {
+    "restricted_airspace": (0, 0, 255),      # Vermell
+    "controlled_airspace": (255, 0, 0),      # Blau
+    "uncontrolled_airspace": (0, 255, 0),    # Verd
+    "danger_areas": (0, 255, 255),           # Groc
+    "prohibited_areas": (255, 0, 255)        # Magenta
+}
+DEFAULT_COLOR = (128, 128, 128)
+
+
+def _polygon_rings(polygon):
+    """Anells d'un polígon: un array de vèrtexs, o una llista [exterior, forats...]."""
+    return polygon if isinstance(polygon, (list, tuple)) else [polygon]
+
+
+def _all_rings(polygons):
+    """Tots els anells (exteriors i forats) d'una llista de polígons."""
+    return [ring for polygon in polygons for ring in _polygon_rings(polygon)]
+
+
+def coverage_counts(polygons, shape):
+    """
+    Compta quants polígons cobreixen cada píxel.
+
+    Cada polígon es rasteritza només dins de la seva caixa contenidora, de
+    manera que el cost depèn de la mida dels polígons i no de la de la imatge.
+
+    Args:
+        polygons (list): Arrays (N, 2) int32 de vèrtexs, o llistes [exterior, forats...]
+            d'arrays per als polígons amb forats (els forats no es compten)
+        shape (tuple): Forma (alçada, amplada) de la imatge
+
+    Returns:
+        tuple: (màscara uint8 de cobertura, caixa (x, y, amplada, alçada) que la conté
+            o None si és buida)
+    """
+    counts = np.zeros(shape[:2], dtype=np.uint8)
+    union = None
+    for polygon in polygons:
+        rings = _polygon_rings(polygon)
+        x, y, w, h = cv2.boundingRect(rings[0])
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, shape[1]), min(y + h, shape[0])
+        if x1 <= x0 or y1 <= y0:
+            continue
+
+        polygon_mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(polygon_mask, rings, 1, offset=(-x0, -y0))
+        region = counts[y0:y1, x0:x1]
+        cv2.add(region, polygon_mask, dst=region)
+
+        union = (x0, y0, x1, y1) if union is None else (min(union[0], x0), min(union[1], y0),
+                                                        max(union[2], x1), max(union[3], y1))
+    if union is None:
+        return counts, None
+    return counts, (union[0], union[1], union[2] - union[0], union[3] - union[1])
+
+
+class OverlayCompositor:
+    def __init__(self, base_image):
+        """
+        Inicialitza el compositor sobre una còpia de la imatge base.
+
+        Args:
+            base_image (np.ndarray): Imatge BGR sobre la qual es dibuixa
+        """
+        self.image = base_image.copy()
+
+    def fill_layer(self, polygons, color, alpha):
+        """
+        Emplena tots els polígons d'una capa amb una sola barreja.
+
+        Equival a barrejar cada polígon per separat amb opacitat alpha: un píxel
+        cobert per k polígons rep un pes 1 - (1 - alpha)^k.
+
+        Args:
+            polygons (list): Polígons com a coverage_counts
+            color (tuple): Color BGR de la capa
+            alpha (float): Opacitat de cada emplenament
+        """
+        counts, box = coverage_counts(polygons, self.image.shape)
+        if box is None:
+            return
+
+        x, y, w, h = box
+        region = self.image[y:y + h, x:x + w]
+        region_counts = counts[y:y + h, x:x + w]
+        color_plane = np.empty_like(region)
+        color_plane[:] = color
+
+        # Pes de cada píxel segons quants polígons el cobreixen; una sola barreja de la regió
+        weights = (1 - (1 - alpha) ** np.arange(256)).astype(np.float32)
+        weight = cv2.LUT(region_counts, weights)
+        region[:] = cv2.blendLinear(region, color_plane, 1 - weight, weight)
+
+    def outlines(self, polygons, color, thickness):
+        """Dibuixa els contorns (inclosos els dels forats) de tots els polígons d'una capa."""
+        cv2.polylines(self.image, _all_rings(polygons), True, color, thickness)
+
+    def vertex_dots(self, polygons, color, radius):
+        """Dibuixa un punt a cada vèrtex dels polígons."""
+        for vertices in _all_rings(polygons):
+            for vertex in vertices:
+                cv2.circle(self.image, (int(vertex[0]), int(vertex[1])), radius, color, -1)
+
+    def labels(self, texts, positions, color, font_scale, thickness):
+        """
+        Dibuixa etiquetes de text.
+
+        Args:
+            texts (list): Textos
+            positions (list): Posicions (x, y) de l'origen de cada text
+        """
+        for text, (x, y) in zip(texts, positions):
+            cv2.putText(self.image, text, (int(x), int(y)), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, color, thickness)
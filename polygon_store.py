@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Magatzem Columnar de Polígons
+
+Aquest mòdul desa tots els polígons d'espais aeris detectats en arrays NumPy
+paral·lels en lloc d'un diccionari per polígon:
+
+- vertices: un únic array (V, 2) int32 amb els vèrtexs de tots els polígons,
+- offsets: array (P + 1,) amb l'inici de cada polígon a vertices,
+- class_ids, polygon_ids, areas, perimeters, bboxes, centroids i parents: un element per polígon,
+- hole_vertices, hole_offsets i hole_polygons: els forats (anells interiors) de
+  cada polígon, amb el mateix esquema que vertices/offsets.
+
+Les estadístiques, exportacions i consultes operen directament sobre aquests
+arrays; el diccionari per tipus d'espai aeri (vertex_data) es construeix només
+quan es demana, per compatibilitat.
+"""
+
+import numpy as np
+
+# Arrays que defineixen el magatzem (en l'ordre de to_arrays)
+STORE_ARRAYS = ("vertices", "offsets", "class_ids", "polygon_ids", "areas", "perimeters",
+                "bboxes", "centroids", "parents", "hole_vertices", "hole_offsets", "hole_polygons")
+
+
+def group_positions(counts):
+    """
+    Posició de cada element dins del seu grup, per a grups consecutius de mida counts.
+
+    Per exemple, counts [2, 0, 3] dona [0, 1, 0, 1, 2].
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def expand_ranges(starts, counts):
+    """Índexs de tots els elements dels intervals [start, start + count) (p. ex. files CSR), en ordre."""
+    return np.repeat(starts, counts) + group_positions(counts)
+
+
+class PolygonStore:
+    def __init__(self, class_names, vertices, offsets, class_ids, polygon_ids, areas, perimeters,
+                 bboxes, centroids=None, parents=None, hole_vertices=None, hole_offsets=None, hole_polygons=None):
+        """
+        Inicialitza el magatzem a partir dels seus arrays.
+
+        Args:
+            class_names (list): Tipus d'espai aeri; class_ids en són índexs
+            vertices (array): Vèrtexs (V, 2) de tots els polígons, consecutius
+            offsets (array): Inici de cada polígon a vertices (P + 1 elements)
+            class_ids (array): Índex del tipus d'espai aeri de cada polígon
+            polygon_ids (array): Identificador de cada polígon dins del seu tipus
+            areas, perimeters (array): Àrea (px²) i perímetre (px) de cada polígon
+            bboxes (array): Caixes contenidores (P, 4) en format (x, y, amplada, alçada)
+            centroids (array): Centroides (P, 2); per defecte, la mitjana dels vèrtexs
+            parents (array): Índex del polígon que conté cada polígon (dins d'un forat),
+                o -1; per defecte, cap
+            hole_vertices (array): Vèrtexs (H_V, 2) de tots els forats, consecutius
+            hole_offsets (array): Inici de cada forat a hole_vertices (H + 1 elements)
+            hole_polygons (array): Índex del polígon de cada forat (ordenat)
+        """
+        self.class_names = list(class_names)
+        self.vertices = np.asarray(vertices, dtype=np.int32).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.class_ids = np.asarray(class_ids, dtype=np.int16)
+        self.polygon_ids = np.asarray(polygon_ids, dtype=np.int32)
+        self.areas = np.asarray(areas, dtype=np.float64)
+        self.perimeters = np.asarray(perimeters, dtype=np.float64)
+        self.bboxes = np.asarray(bboxes, dtype=np.int32).reshape(-1, 4)
+        self.centroids = (np.asarray(centroids, dtype=np.float64).reshape(-1, 2) if centroids is not None
+                          else self._vertex_means())
+        self.parents = (np.asarray(parents, dtype=np.int32) if parents is not None
+                        else np.full(len(self.polygon_ids), -1, dtype=np.int32))
+        self.hole_vertices = np.asarray(hole_vertices if hole_vertices is not None else np.empty((0, 2)),
+                                        dtype=np.int32).reshape(-1, 2)
+        self.hole_offsets = np.asarray(hole_offsets if hole_offsets is not None else [0], dtype=np.int64)
+        self.hole_polygons = np.asarray(hole_polygons if hole_polygons is not None else [], dtype=np.int32)
+
+    @classmethod
+    def empty(cls, class_names=()):
+        """Retorna un magatzem sense polígons."""
+        return cls(class_names, np.empty((0, 2)), [0], [], [], [], [], np.empty((0, 4)), np.empty((0, 2)))
+
+    @classmethod
+    def from_vertex_data(cls, vertex_data):
+        """
+        Construeix el magatzem a partir del diccionari clàssic {tipus: [polígon, ...]}.
+
+        Args:
+            vertex_data (dict): Diccionari com el de AirspaceVertexDetector.vertex_data
+                o el de la clau "airspace_polygons" de vertex_data.json
+        """
+        polygons = [(class_id, polygon) for class_id, class_polygons in enumerate(vertex_data.values())
+                    for polygon in class_polygons]
+        if not polygons:
+            return cls.empty(vertex_data)
+
+        counts = [len(polygon["vertices"]) for _, polygon in polygons]
+        vertices = [vertex for _, polygon in polygons for vertex in polygon["vertices"]]
+
+        # Els pares es desen per id dins del mateix tipus; aquí es tradueixen a índexs
+        index_of = {(class_id, polygon["id"]): i for i, (class_id, polygon) in enumerate(polygons)}
+        parents = [index_of.get((class_id, polygon.get("parent")), -1) for class_id, polygon in polygons]
+        holes = [(i, hole) for i, (_, polygon) in enumerate(polygons) for hole in polygon.get("holes", [])]
+        return cls(
+            vertex_data,
+            np.array(vertices, dtype=np.int32).reshape(-1, 2),
+            np.concatenate([[0], np.cumsum(counts)]),
+            [class_id for class_id, _ in polygons],
+            [polygon["id"] for _, polygon in polygons],
+            [polygon["area"] for _, polygon in polygons],
+            [polygon["perimeter"] for _, polygon in polygons],
+            [[polygon["bounding_box"][key] for key in ("x", "y", "width", "height")] for _, polygon in polygons],
+            [polygon["centroid"] for _, polygon in polygons],
+            parents,
+            np.array([vertex for _, hole in holes for vertex in hole], dtype=np.int32).reshape(-1, 2),
+            np.concatenate([[0], np.cumsum([len(hole) for _, hole in holes], dtype=np.int64)]),
+            [i for i, _ in holes],
+        )
+
+    def to_arrays(self):
+        """Retorna els arrays del magatzem (per a la memòria cau o np.savez)."""
+        arrays = {name: getattr(self, name) for name in STORE_ARRAYS}
+        arrays["class_names"] = list(self.class_names)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Reconstrueix el magatzem des de to_arrays (els arrays de jerarquia són opcionals)."""
+        return cls(arrays["class_names"], *(arrays.get(name) for name in STORE_ARRAYS))
+
+    def __len__(self):
+        return len(self.polygon_ids)
+
+    @property
+    def num_vertices(self):
+        """Nombre de vèrtexs de cada polígon."""
+        return np.diff(self.offsets)
+
+    def _vertex_means(self):
+        """Mitjana dels vèrtexs de cada polígon, calculada amb una sola reducció."""
+        if len(self.offsets) <= 1:
+            return np.empty((0, 2))
+        sums = np.add.reduceat(self.vertices.astype(np.int64), self.offsets[:-1], axis=0)
+        return sums / self.num_vertices[:, None]
+
+    @property
+    def num_hole_vertices(self):
+        """Nombre total de vèrtexs dels forats de cada polígon."""
+        return np.bincount(self.hole_polygons, weights=np.diff(self.hole_offsets),
+                           minlength=len(self)).astype(np.int64)
+
+    @property
+    def has_hierarchy(self):
+        """Indica si algun polígon té pare o forats (contour_mode "ccomp" o "tree")."""
+        return bool(len(self.hole_polygons)) or bool((self.parents >= 0).any())
+
+    def polygon_vertices(self, index):
+        """Retorna els vèrtexs (vista, sense còpia) del polígon d'índex index."""
+        return self.vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    def polygon_holes(self, index):
+        """Retorna els vèrtexs (vistes) dels forats del polígon d'índex index."""
+        start, end = np.searchsorted(self.hole_polygons, [index, index + 1])
+        return [self.hole_vertices[self.hole_offsets[i]:self.hole_offsets[i + 1]] for i in range(start, end)]
+
+    def _ring_vertices(self):
+        """Vèrtexs dels contorns seguits dels dels forats (la concatenació es fa una sola vegada)."""
+        if not len(self.hole_vertices):
+            return self.vertices
+        if getattr(self, "_all_vertices", None) is None:
+            self._all_vertices = np.concatenate([self.vertices, self.hole_vertices])
+        return self._all_vertices
+
+    def polygon_rings(self, index):
+        """Retorna el contorn exterior i els forats d'un polígon (apte per a cv2.fillPoly)."""
+        return [self.polygon_vertices(index)] + self.polygon_holes(index)
+
+    def edges(self, polygons):
+        """
+        Arestes (contorn exterior i forats) d'una llista de polígons, vectoritzades.
+
+        Args:
+            polygons (array): Índexs de polígon (poden repetir-se)
+
+        Returns:
+            tuple: (posició a polygons de cada aresta, x1, y1, x2, y2); les arestes
+                de cada posició són consecutives
+        """
+        polygons = np.asarray(polygons, dtype=np.int64)
+        ring_owner, ring_starts, ring_counts = [np.arange(len(polygons))], [self.offsets[polygons]], \
+            [self.num_vertices[polygons]]
+
+        if len(self.hole_polygons):
+            # Forats de cada polígon demanat (hole_polygons està ordenat)
+            first = np.searchsorted(self.hole_polygons, polygons)
+            counts = np.searchsorted(self.hole_polygons, polygons, side="right") - first
+            owner = np.repeat(np.arange(len(polygons)), counts)
+            hole = expand_ranges(first, counts)
+            ring_owner.append(owner)
+            ring_starts.append(len(self.vertices) + self.hole_offsets[hole])
+            ring_counts.append(np.diff(self.hole_offsets)[hole])
+
+        ring_owner, ring_starts, ring_counts = (np.concatenate(values) for values in
+                                                (ring_owner, ring_starts, ring_counts))
+        order = np.argsort(ring_owner, kind="stable")
+        ring_owner, ring_starts, ring_counts = ring_owner[order], ring_starts[order], ring_counts[order]
+
+        all_vertices = self._ring_vertices()
+        pair = np.repeat(ring_owner, ring_counts)
+        local = group_positions(ring_counts)
+        starts = np.repeat(ring_starts, ring_counts)
+        first = all_vertices[starts + local].astype(np.float64)
+        second = all_vertices[starts + (local + 1) % np.repeat(ring_counts, ring_counts)].astype(np.float64)
+        return pair, first[:, 0], first[:, 1], second[:, 0], second[:, 1]
+
+    def class_indices(self, class_name):
+        """Retorna els índexs dels polígons d'un tipus d'espai aeri."""
+        return np.flatnonzero(self.class_ids == self.class_names.index(class_name))
+
+    def class_polygons(self, class_name):
+        """Retorna la llista de vèrtexs (vistes) dels polígons d'un tipus, apta per a cv2.polylines."""
+        return [self.polygon_vertices(i) for i in self.class_indices(class_name)]
+
+    def polygon_keys(self, polygon_indices):
+        """Retorna el (tipus d'espai aeri, id) de cada índex de polígon."""
+        polygon_indices = np.asarray(polygon_indices, dtype=np.int64)
+        return [(self.class_names[class_id], polygon_id) for class_id, polygon_id in
+                zip(self.class_ids[polygon_indices].tolist(), self.polygon_ids[polygon_indices].tolist())]
+
+    def vertex_table(self):
+        """
+        Retorna una fila per vèrtex, sense bucles Python.
+
+        Returns:
+            dict: Arrays 'polygon_index', 'vertex_index' (1-based), 'x' i 'y'; 'x' i 'y'
+                són vistes de vertices
+        """
+        counts = self.num_vertices
+        polygon_index = np.repeat(np.arange(len(self)), counts)
+        vertex_index = np.arange(len(self.vertices)) - np.repeat(self.offsets[:-1], counts) + 1
+        return {
+            "polygon_index": polygon_index,
+            "vertex_index": vertex_index,
+            "x": self.vertices[:, 0],
+            "y": self.vertices[:, 1],
+        }
+
+    def statistics(self):
+        """
+        Calcula les estadístiques per tipus d'espai aeri amb reduccions agrupades.
+
+        Returns:
+            dict: Per a cada tipus amb polígons, nombre de polígons i mitjana/mínim/màxim
+                d'àrea, perímetre i vèrtexs
+        """
+        if not len(self):
+            return {}
+
+        order = np.argsort(self.class_ids, kind="stable")
+        class_ids = self.class_ids[order]
+        starts = np.flatnonzero(np.r_[True, class_ids[1:] != class_ids[:-1]])
+        counts = np.diff(np.r_[starts, len(order)])
+        areas = self.areas[order]
+        perimeters = self.perimeters[order]
+        vertex_counts = self.num_vertices[order]
+
+        columns = {
+            "num_polygons": counts.tolist(),
+            "avg_area": np.add.reduceat(areas, starts) / counts,
+            "min_area": np.minimum.reduceat(areas, starts),
+            "max_area": np.maximum.reduceat(areas, starts),
+            "avg_perimeter": np.add.reduceat(perimeters, starts) / counts,
+            "avg_vertices": np.add.reduceat(vertex_counts, starts) / counts,
+            "min_vertices": np.minimum.reduceat(vertex_counts, starts),
+            "max_vertices": np.maximum.reduceat(vertex_counts, starts),
+        }
+        return {self.class_names[class_ids[start]]: {name: values[i] for name, values in columns.items()}
+                for i, start in enumerate(starts)}
+
+    def iter_polygons(self, indices=None):
+        """
+        Genera els polígons un a un, en el format de to_vertex_data, sense construir-los tots.
+
+        Args:
+            indices (array): Índexs dels polígons a generar (per defecte, tots, en ordre)
+
+        Yields:
+            tuple: (tipus d'espai aeri, diccionari del polígon)
+        """
+        indices = range(len(self)) if indices is None else np.asarray(indices, dtype=np.int64).tolist()
+        hierarchical = self.has_hierarchy
+        for i in indices:
+            class_id, polygon_id = self.class_ids[i].item(), self.polygon_ids[i].item()
+            parent = self.parents[i].item()
+            x, y, width, height = self.bboxes[i].tolist()
+            polygon_vertices = [tuple(vertex) for vertex in self.polygon_vertices(i).tolist()]
+            polygon = {
+                "id": polygon_id,
+                "vertices": polygon_vertices,
+                "num_vertices": len(polygon_vertices),
+                "area": self.areas[i].item(),
+                "perimeter": self.perimeters[i].item(),
+                "bounding_box": {"x": x, "y": y, "width": width, "height": height},
+                "centroid": tuple(self.centroids[i].tolist()),
+            }
+            # Les claus de jerarquia només apareixen si n'hi ha (sortida idèntica en mode "external")
+            if hierarchical:
+                polygon["parent"] = self.polygon_ids[parent].item() if parent >= 0 else None
+                polygon["holes"] = [[tuple(vertex) for vertex in hole.tolist()] for hole in self.polygon_holes(i)]
+            yield self.class_names[class_id], polygon
+
+    def to_vertex_data(self):
+        """
+        Construeix el diccionari clàssic {tipus: [polígon, ...]} (capa de compatibilitat).
+        """
+        vertex_data = {name: [] for name in self.class_names}
+        for class_name, polygon in self.iter_polygons():
+            vertex_data[class_name].append(polygon)
+        return vertex_data
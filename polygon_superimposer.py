@@ -13,9 +13,26 @@ import os
 from pathlib import Path
 from datetime import datetime
 from airspace_vertex_detector import AirspaceVertexDetector
+from artifact_writer import ArtifactWriter
+from detection_io import read_metadata
+from geo_transform import GeoTransform
+from overlay_compositor import AIRSPACE_COLORS, DEFAULT_COLOR, OverlayCompositor
+from stage_profiler import StageProfiler, profiled
+from tile_exporter import TileExporter
+
+# Modes de les imatges individuals dels polígons (vegeu create_individual_polygon_images)
+INDIVIDUAL_MODES = ("full", "cropped", "atlas")
+
+# Estil de les imatges individuals
+INDIVIDUAL_VERTEX_RADIUS = 6
+INDIVIDUAL_OUTLINE_THICKNESS = 3
+INDIVIDUAL_FONT_SCALE = 0.7
+INDIVIDUAL_FONT_THICKNESS = 2
+
 
 class PolygonSuperimposer:
-    def __init__(self, image_path=None, preprocessed_folder=None, output_base_folder="polygon_results"):
+    def __init__(self, image_path=None, preprocessed_folder=None, output_base_folder="polygon_results",
+                 profiler=None, detector=None, writer=None):
         """
         Inicialitza el superposador de polígons.
         
@@ -23,6 +40,13 @@ class PolygonSuperimposer:
             image_path (str): Camí a la imatge original
             preprocessed_folder (str): Carpeta amb resultats de preprocessament
             output_base_folder (str): Carpeta base per als resultats
+            profiler (StageProfiler): Instrumentació opcional del temps i la memòria de cada
+                etapa (també del detector); el perfil es desa a 07_data
+            detector (AirspaceVertexDetector): Detector amb els polígons ja extrets; si es
+                dona, no es torna a carregar la imatge ni a detectar (vegeu from_detector)
+            writer (ArtifactWriter): Escriptor compartit que codifica les imatges (amb fils i
+                codificació per classe: "original", "individual", "by_airspace_type",
+                "superimposed", "visualization"); per defecte, síncron amb PNG d'OpenCV
         """
         self.image_path = image_path
         self.preprocessed_folder = preprocessed_folder
@@ -30,12 +54,55 @@ class PolygonSuperimposer:
         self.original_image = None
         self.vertex_detector = None
         self.vertex_data = {}
+        self.profiler = profiler if profiler is not None else StageProfiler(enabled=False)
+        self.writer = writer if writer is not None else ArtifactWriter(max_workers=0)
         
         # Crear estructura de carpetes
         self._create_folder_structure()
         
-        # Carregar imatge i detectar polígons
-        self._load_and_detect()
+        # Carregar imatge i detectar polígons, o reutilitzar els d'un detector existent
+        if detector is not None:
+            self._use_detector(detector)
+        else:
+            self._load_and_detect()
+    
+    @classmethod
+    def from_detector(cls, detector, output_base_folder="polygon_results", profiler=None, writer=None):
+        """
+        Crea el superposador a partir d'un detector en memòria, sense tornar a detectar.
+        
+        Args:
+            detector (AirspaceVertexDetector): Detector amb la imatge i els polígons
+        """
+        return cls(image_path=detector.image_path, output_base_folder=output_base_folder,
+                   profiler=profiler if profiler is not None else detector.profiler, detector=detector,
+                   writer=writer if writer is not None else detector.writer)
+    
+    @classmethod
+    def from_detection_file(cls, detection_path, image_path=None, output_base_folder="polygon_results",
+                            profiler=None, verify=True, writer=None):
+        """
+        Crea el superposador a partir d'un resultat desat (vertex_data.json o similar).
+        
+        Només es carrega la imatge; els polígons es llegeixen del fitxer i es validen
+        amb el hash de la imatge, de manera que tornar a renderitzar no repeteix la detecció.
+        
+        Args:
+            detection_path (str): Fitxer JSON de AirspaceVertexDetector.save_vertex_data o .npz
+                de save_polygon_arrays
+            image_path (str): Imatge original (per defecte, la registrada al fitxer)
+            verify (bool): Validar el hash de la imatge (vegeu load_vertex_data)
+        """
+        if image_path is None:
+            image_path = read_metadata(detection_path).get("image_path")
+            if not image_path or image_path == "preprocessed":
+                raise ValueError(f"{detection_path} no indica la imatge original; passa image_path")
+        
+        profiler = profiler if profiler is not None else StageProfiler(enabled=False)
+        detector = AirspaceVertexDetector(image_path=image_path, profiler=profiler, writer=writer)
+        detector.load_vertex_data(detection_path, verify=verify)
+        return cls.from_detector(detector, output_base_folder=output_base_folder, profiler=profiler,
+                                 writer=writer)
     
     def _create_folder_structure(self):
         """Crea l'estructura de carpetes per organitzar els resultats."""
@@ -62,53 +129,67 @@ class PolygonSuperimposer:
         
         print(f"✓ Estructura de carpetes creada: {self.main_folder}")
     
+    @profiled("load_and_detect")
     def _load_and_detect(self):
         """Carrega la imatge i detecta els polígons."""
         try:
             # Inicialitzar detector de vèrtexs
             if self.preprocessed_folder:
-                self.vertex_detector = AirspaceVertexDetector(preprocessed_folder=self.preprocessed_folder)
+                self.vertex_detector = AirspaceVertexDetector(preprocessed_folder=self.preprocessed_folder,
+                                                              profiler=self.profiler, writer=self.writer)
             elif self.image_path:
-                self.vertex_detector = AirspaceVertexDetector(image_path=self.image_path)
+                self.vertex_detector = AirspaceVertexDetector(image_path=self.image_path,
+                                                              profiler=self.profiler, writer=self.writer)
             else:
                 raise ValueError("Cal proporcionar image_path o preprocessed_folder")
             
-            # Carregar imatge original
-            self.original_image = self.vertex_detector.original_image
-            if self.original_image is None:
+            if self.vertex_detector.original_image is None:
                 raise ValueError("No s'ha pogut carregar la imatge original")
             
-            # Desa imatge original
-            cv2.imwrite(str(self.folders["original"] / "original_image.png"), self.original_image)
-            
             # Detecta àrees d'espais aeris
             self.vertex_detector.detect_airspace_areas()
             
             # Extreu vèrtexs
             self.vertex_detector.extract_polygon_vertices()
             
-            # Obté dades dels vèrtexs
-            self.vertex_data = self.vertex_detector.vertex_data
-            
+            self._use_detector(self.vertex_detector)
             print(f"✓ Imatge carregada i polígons detectats: {len(self.vertex_data)} tipus d'espai aeri")
             
         except Exception as e:
             print(f"❌ Error carregant imatge o detectant polígons: {e}")
             raise
     
-    def create_individual_polygon_images(self):
-        """Crea imatges individuals per a cada polígon detectat."""
-        print("\n🎨 Creant imatges individuals dels polígons...")
+    def _use_detector(self, detector):
+        """Pren la imatge i els polígons d'un detector i desa la imatge original."""
+        if detector.original_image is None:
+            raise ValueError("El detector no té imatge original")
+        
+        self.vertex_detector = detector
+        self.original_image = detector.original_image
+        self.vertex_data = detector.vertex_data
+        
+        # Desa imatge original
+        self.writer.write_image(self.folders["original"] / "original_image.png", self.original_image,
+                                artifact_class="original")
+    
+    @profiled()
+    def create_individual_polygon_images(self, mode="full", atlas_width=4096):
+        """
+        Crea imatges individuals per a cada polígon detectat.
         
-        colors = {
-            "restricted_airspace": (0, 0, 255),      # Vermell
-            "controlled_airspace": (255, 0, 0),      # Blau
-            "uncontrolled_airspace": (0, 255, 0),    # Verd
-            "danger_areas": (0, 255, 255),           # Groc
-            "prohibited_areas": (255, 0, 255)        # Magenta
-        }
+        Args:
+            mode (str): "full" (llenç RGBA de la mida de la carta per polígon),
+                "cropped" (llenç retallat a la caixa del polígon, amb el desplaçament a
+                polygon_offsets.json) o "atlas" (tots els retalls en un sol atlas.png
+                amb l'índex atlas.json)
+            atlas_width (int): Amplada màxima de l'atlas en mode "atlas"
+        """
+        if mode not in INDIVIDUAL_MODES:
+            raise ValueError(f"Mode desconegut '{mode}', s'esperava un de {INDIVIDUAL_MODES}")
+        print("\n🎨 Creant imatges individuals dels polígons...")
         
-        polygon_count = 0
+        height, width = self.original_image.shape[:2]
+        sprites = []
         
         for airspace_type, polygons in self.vertex_data.items():
             if not polygons:
@@ -116,154 +197,267 @@ class PolygonSuperimposer:
             
             # Crear carpeta per tipus d'espai aeri
             airspace_folder = self.folders["individual_polygons"] / airspace_type
-            airspace_folder.mkdir(exist_ok=True)
+            if mode != "atlas":
+                airspace_folder.mkdir(exist_ok=True)
             
-            color = colors.get(airspace_type, (128, 128, 128))
+            color = AIRSPACE_COLORS.get(airspace_type, DEFAULT_COLOR)
             
             for polygon in polygons:
-                # Crear imatge amb fons transparent
-                polygon_image = np.zeros((*self.original_image.shape[:2], 4), dtype=np.uint8)
-                
-                # Dibuixar polígon
-                vertices = np.array(polygon['vertices'], np.int32)
-                cv2.fillPoly(polygon_image, [vertices], (*color, 255))
-                
-                # Dibuixar vèrtexs
-                for vertex in vertices:
-                    cv2.circle(polygon_image, tuple(vertex), 6, (*color, 255), -1)
-                
-                # Dibuixar contorn
-                cv2.polylines(polygon_image, [vertices], True, (*color, 255), 3)
-                
-                # Dibuixar ID i informació
-                centroid = polygon['centroid']
-                cv2.putText(polygon_image, f"ID: {polygon['id']}", 
-                           (int(centroid[0]) + 10, int(centroid[1]) - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (*color, 255), 2)
+                # Llenç complet o retallat a la caixa que conté tot el que es dibuixa
+                if mode == "full":
+                    x0, y0, x1, y1 = 0, 0, width, height
+                else:
+                    x0, y0, x1, y1 = self._individual_polygon_box(polygon)
+                polygon_image = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+                self._draw_individual_polygon(polygon_image, polygon, (*color, 255), (x0, y0))
                 
-                # Desa imatge individual
                 filename = f"{airspace_type}_polygon_{polygon['id']:03d}.png"
-                cv2.imwrite(str(airspace_folder / filename), polygon_image)
+                sprite = {"airspace_type": airspace_type, "id": polygon['id'],
+                          "x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0}
                 
-                polygon_count += 1
+                if mode == "atlas":
+                    sprites.append((sprite, polygon_image))
+                else:
+                    # Desa imatge individual
+                    path = self.writer.write_image(airspace_folder / filename, polygon_image,
+                                                   artifact_class="individual")
+                    sprite["file"] = f"{airspace_type}/{Path(path).name}"
+                    sprites.append((sprite, None))
+        
+        index = {"chart_width": width, "chart_height": height, "polygons": [sprite for sprite, _ in sprites]}
+        if mode == "atlas":
+            atlas, positions = self._pack_atlas([image for _, image in sprites], atlas_width)
+            for (sprite, _), (atlas_x, atlas_y) in zip(sprites, positions):
+                sprite["atlas_x"], sprite["atlas_y"] = atlas_x, atlas_y
+            path = self.writer.write_image(self.folders["individual_polygons"] / "atlas.png", atlas,
+                                           artifact_class="individual")
+            index["atlas"] = Path(path).name
+            index_path = self.folders["individual_polygons"] / "atlas.json"
+        else:
+            index_path = self.folders["individual_polygons"] / "polygon_offsets.json"
+        
+        if mode != "full":
+            with open(index_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2, ensure_ascii=False)
         
-        print(f"✓ Creat {polygon_count} imatges individuals dels polígons")
+        print(f"✓ Creat {len(sprites)} imatges individuals dels polígons")
     
+    @staticmethod
+    def _individual_label(polygon):
+        """Retorna el text i l'origen de l'etiqueta d'un polígon individual."""
+        centroid = polygon['centroid']
+        return f"ID: {polygon['id']}", (int(centroid[0]) + 10, int(centroid[1]) - 10)
+    
+    def _draw_individual_polygon(self, canvas, polygon, color, origin=(0, 0)):
+        """
+        Dibuixa un polígon individual (emplenament, vèrtexs, contorn i ID).
+        
+        Args:
+            canvas (np.ndarray): Llenç RGBA
+            polygon (dict): Polígon de vertex_data
+            color (tuple): Color BGRA
+            origin (tuple): Posició (x, y) del llenç dins de la carta
+        """
+        rings = [np.array(ring, np.int32) - np.array(origin, np.int32)
+                 for ring in [polygon['vertices'], *polygon.get('holes', [])]]
+        
+        # Dibuixar polígon (els forats queden buits)
+        cv2.fillPoly(canvas, rings, color)
+        
+        # Dibuixar vèrtexs
+        for vertices in rings:
+            for vertex in vertices:
+                cv2.circle(canvas, tuple(int(v) for v in vertex), INDIVIDUAL_VERTEX_RADIUS, color, -1)
+        
+        # Dibuixar contorn
+        cv2.polylines(canvas, rings, True, color, INDIVIDUAL_OUTLINE_THICKNESS)
+        
+        # Dibuixar ID i informació
+        text, (x, y) = self._individual_label(polygon)
+        cv2.putText(canvas, text, (x - origin[0], y - origin[1]), cv2.FONT_HERSHEY_SIMPLEX,
+                    INDIVIDUAL_FONT_SCALE, color, INDIVIDUAL_FONT_THICKNESS)
+    
+    def _individual_polygon_box(self, polygon):
+        """
+        Retorna la caixa (x0, y0, x1, y1) que conté tot el dibuix d'un polígon individual.
+        
+        Inclou el gruix del contorn, el radi dels vèrtexs i l'etiqueta, i es retalla
+        als límits de la carta, de manera que el retall és idèntic a la mateixa zona
+        del llenç complet.
+        """
+        height, width = self.original_image.shape[:2]
+        x, y, w, h = cv2.boundingRect(np.array(polygon['vertices'], np.int32))
+        margin = max(INDIVIDUAL_VERTEX_RADIUS, INDIVIDUAL_OUTLINE_THICKNESS) + 2
+        x0, y0, x1, y1 = x - margin, y - margin, x + w + margin, y + h + margin
+        
+        text, (text_x, text_y) = self._individual_label(polygon)
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX,
+                                                              INDIVIDUAL_FONT_SCALE, INDIVIDUAL_FONT_THICKNESS)
+        text_margin = INDIVIDUAL_FONT_THICKNESS + 2
+        x0, y0 = min(x0, text_x - text_margin), min(y0, text_y - text_height - text_margin)
+        x1, y1 = max(x1, text_x + text_width + text_margin), max(y1, text_y + baseline + text_margin)
+        
+        return max(x0, 0), max(y0, 0), max(min(x1, width), 1), max(min(y1, height), 1)
+    
+    @staticmethod
+    def _pack_atlas(images, max_width):
+        """
+        Empaqueta imatges en un atlas per prestatges (les més altes primer).
+        
+        Returns:
+            tuple: (atlas RGBA, llista de posicions (x, y) de cada imatge)
+        """
+        if not images:
+            return np.zeros((1, 1, 4), dtype=np.uint8), []
+        
+        max_width = max(max_width, max(image.shape[1] for image in images))
+        positions = [None] * len(images)
+        x = y = shelf_height = atlas_width = 0
+        for i in sorted(range(len(images)), key=lambda i: -images[i].shape[0]):
+            image_height, image_width = images[i].shape[:2]
+            if x + image_width > max_width:
+                x, y, shelf_height = 0, y + shelf_height, 0
+            positions[i] = (x, y)
+            x += image_width
+            shelf_height = max(shelf_height, image_height)
+            atlas_width = max(atlas_width, x)
+        
+        atlas = np.zeros((y + shelf_height, atlas_width, 4), dtype=np.uint8)
+        for image, (x, y) in zip(images, positions):
+            atlas[y:y + image.shape[0], x:x + image.shape[1]] = image
+        return atlas, positions
+    
+    @staticmethod
+    def _polygon_layer(polygons):
+        """
+        Retorna els vèrtexs, els IDs i els centroides dels polígons d'un tipus.
+        
+        Els vèrtexs de cada polígon són un array int32 o, si té forats, una llista
+        [exterior, forats...] (vegeu overlay_compositor.coverage_counts).
+        """
+        vertices = [[np.array(ring, np.int32) for ring in [polygon['vertices'], *polygon['holes']]]
+                    if polygon.get('holes') else np.array(polygon['vertices'], np.int32)
+                    for polygon in polygons]
+        ids = [polygon['id'] for polygon in polygons]
+        label_positions = [(int(polygon['centroid'][0]) + 10, int(polygon['centroid'][1]) - 10)
+                           for polygon in polygons]
+        return vertices, ids, label_positions
+    
+    @profiled()
     def create_airspace_type_images(self):
         """Crea imatges separades per cada tipus d'espai aeri."""
         print("\n🎨 Creant imatges per tipus d'espai aeri...")
         
-        colors = {
-            "restricted_airspace": (0, 0, 255),      # Vermell
-            "controlled_airspace": (255, 0, 0),      # Blau
-            "uncontrolled_airspace": (0, 255, 0),    # Verd
-            "danger_areas": (0, 255, 255),           # Groc
-            "prohibited_areas": (255, 0, 255)        # Magenta
-        }
-        
         for airspace_type, polygons in self.vertex_data.items():
             if not polygons:
                 continue
             
-            # Crear imatge base
-            airspace_image = self.original_image.copy()
-            color = colors.get(airspace_type, (128, 128, 128))
+            color = AIRSPACE_COLORS.get(airspace_type, DEFAULT_COLOR)
+            vertices, ids, label_positions = self._polygon_layer(polygons)
             
-            # Dibuixar tots els polígons d'aquest tipus
-            for polygon in polygons:
-                vertices = np.array(polygon['vertices'], np.int32)
-                
-                # Dibuixar polígon omplert amb transparència
-                overlay = airspace_image.copy()
-                cv2.fillPoly(overlay, [vertices], color)
-                cv2.addWeighted(airspace_image, 0.7, overlay, 0.3, 0, airspace_image)
-                
-                # Dibuixar contorn
-                cv2.polylines(airspace_image, [vertices], True, color, 3)
-                
-                # Dibuixar vèrtexs
-                for vertex in vertices:
-                    cv2.circle(airspace_image, tuple(vertex), 4, color, -1)
-                
-                # Dibuixar ID
-                centroid = polygon['centroid']
-                cv2.putText(airspace_image, f"{polygon['id']}", 
-                           (int(centroid[0]) + 10, int(centroid[1]) - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            # Emplenaments semitransparents en una sola barreja; contorns, vèrtexs i IDs a sobre
+            compositor = OverlayCompositor(self.original_image)
+            compositor.fill_layer(vertices, color, 0.3)
+            compositor.outlines(vertices, color, 3)
+            compositor.vertex_dots(vertices, color, 4)
+            compositor.labels([f"{polygon_id}" for polygon_id in ids], label_positions, color, 0.6, 2)
             
             # Desa imatge del tipus d'espai aeri
             filename = f"{airspace_type}_all_polygons.png"
-            cv2.imwrite(str(self.folders["by_airspace_type"] / filename), airspace_image)
+            self.writer.write_image(self.folders["by_airspace_type"] / filename, compositor.image,
+                                    artifact_class="by_airspace_type")
             
             print(f"✓ Creat imatge per {airspace_type}: {len(polygons)} polígons")
     
+    def _superimposed_layers(self):
+        """Retorna (color, tipus, vèrtexs, IDs, posicions d'etiqueta) de cada tipus amb polígons."""
+        return [(AIRSPACE_COLORS.get(airspace_type, DEFAULT_COLOR), airspace_type,
+                 *self._polygon_layer(polygons))
+                for airspace_type, polygons in self.vertex_data.items() if polygons]
+    
+    def _compose_all_polygons(self, layers, labels=True):
+        """
+        Compon tots els polígons sobre la imatge original: una barreja per capa i,
+        a sobre, contorns i (opcionalment) etiquetes.
+        """
+        all_polygons = OverlayCompositor(self.original_image)
+        for color, _, vertices, _, _ in layers:
+            all_polygons.fill_layer(vertices, color, 0.2)
+        for color, airspace_type, vertices, ids, label_positions in layers:
+            all_polygons.outlines(vertices, color, 2)
+            if labels:
+                all_polygons.labels([f"{airspace_type}_{polygon_id}" for polygon_id in ids], label_positions,
+                                    color, 0.5, 1)
+        return all_polygons
+    
+    @profiled()
     def create_superimposed_images(self):
         """Crea imatges amb tots els polígons superposats."""
         print("\n🎨 Creant imatges superposades...")
         
-        colors = {
-            "restricted_airspace": (0, 0, 255),      # Vermell
-            "controlled_airspace": (255, 0, 0),      # Blau
-            "uncontrolled_airspace": (0, 255, 0),    # Verd
-            "danger_areas": (0, 255, 255),           # Groc
-            "prohibited_areas": (255, 0, 255)        # Magenta
-        }
+        layers = self._superimposed_layers()
         
         # Imatge amb tots els polígons
-        all_polygons_image = self.original_image.copy()
+        all_polygons = self._compose_all_polygons(layers)
         
-        # Imatge amb contorns només
-        outlines_image = self.original_image.copy()
+        # Imatges amb contorns només i amb vèrtexs només
+        outlines = OverlayCompositor(self.original_image)
+        vertex_dots = OverlayCompositor(self.original_image)
+        for color, _, vertices, _, _ in layers:
+            outlines.outlines(vertices, color, 3)
+            vertex_dots.vertex_dots(vertices, color, 5)
         
-        # Imatge amb vèrtexs només
-        vertices_image = self.original_image.copy()
-        
-        total_polygons = 0
-        
-        for airspace_type, polygons in self.vertex_data.items():
-            if not polygons:
-                continue
-            
-            color = colors.get(airspace_type, (128, 128, 128))
-            
-            for polygon in polygons:
-                vertices = np.array(polygon['vertices'], np.int32)
-                
-                # Imatge amb tots els polígons (omplerts)
-                overlay = all_polygons_image.copy()
-                cv2.fillPoly(overlay, [vertices], color)
-                cv2.addWeighted(all_polygons_image, 0.8, overlay, 0.2, 0, all_polygons_image)
-                cv2.polylines(all_polygons_image, [vertices], True, color, 2)
-                
-                # Imatge amb contorns només
-                cv2.polylines(outlines_image, [vertices], True, color, 3)
-                
-                # Imatge amb vèrtexs només
-                for vertex in vertices:
-                    cv2.circle(vertices_image, tuple(vertex), 5, color, -1)
-                
-                # Dibuixar etiquetes
-                centroid = polygon['centroid']
-                label = f"{airspace_type}_{polygon['id']}"
-                cv2.putText(all_polygons_image, label, 
-                           (int(centroid[0]) + 10, int(centroid[1]) - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                
-                total_polygons += 1
+        total_polygons = sum(len(layer[3]) for layer in layers)
         
         # Desa imatges superposades
-        cv2.imwrite(str(self.folders["superimposed"] / "all_polygons_filled.png"), all_polygons_image)
-        cv2.imwrite(str(self.folders["superimposed"] / "all_polygons_outlines.png"), outlines_image)
-        cv2.imwrite(str(self.folders["superimposed"] / "all_polygons_vertices.png"), vertices_image)
+        for filename, image in (("all_polygons_filled.png", all_polygons.image),
+                                ("all_polygons_outlines.png", outlines.image),
+                                ("all_polygons_vertices.png", vertex_dots.image)):
+            self.writer.write_image(self.folders["superimposed"] / filename, image, artifact_class="superimposed")
         
         print(f"✓ Creat imatges superposades: {total_polygons} polígons totals")
     
+    @profiled()
+    def export_tiles(self, transform=None, chart_bounds=None, output_folder=None, min_zoom=None, max_zoom=None,
+                     scheme="xyz", labels=False, max_workers=4):
+        """
+        Exporta la carta amb tots els polígons com a piràmide de tessel·les per a un mapa web.
+        
+        Args:
+            transform (GeoTransform): Georeferenciació de la carta
+            chart_bounds (dict): Límits 'north', 'south', 'east', 'west' (caixa lineal
+                lat/lon, si no es dona transform)
+            output_folder (str): Carpeta de la piràmide; per defecte, tiles/ dins de la
+                carpeta base (fixa entre execucions, per reutilitzar les tessel·les sense canvis)
+            min_zoom, max_zoom (int): Rang de zoom (per defecte, de la carta sencera en
+                una tessel·la fins a la resolució de la carta)
+            scheme (str): "xyz" o "tms"
+            labels (bool): Dibuixar les etiquetes dels polígons (mida fixa en píxels de la carta)
+            max_workers (int): Fils de renderització
+        
+        Returns:
+            dict: Manifest de la piràmide (vegeu TileExporter.export)
+        """
+        if transform is None:
+            if chart_bounds is None:
+                raise ValueError("Cal chart_bounds o una transformació")
+            height, width = self.original_image.shape[:2]
+            transform = GeoTransform.from_chart_bounds(chart_bounds, width, height)
+        
+        image = self._compose_all_polygons(self._superimposed_layers(), labels=labels).image
+        exporter = TileExporter(image, transform, output_folder or self.output_base_folder / "tiles",
+                                scheme=scheme, max_workers=max_workers, writer=self.writer,
+                                profiler=self.profiler)
+        return exporter.export(min_zoom=min_zoom, max_zoom=max_zoom)
+    
+    @profiled()
     def save_coordinate_files(self):
         """Desa fitxers de coordenades en diferents formats."""
         print("\n💾 Desant fitxers de coordenades...")
         
         # JSON complet
         self.vertex_detector.save_vertex_data(str(self.folders["data"] / "vertex_data.json"))
+        self.vertex_detector.save_spatial_index(str(self.folders["data"] / "spatial_index.npz"))
         
         # Coordenades llegibles
         self.vertex_detector.save_vertex_coordinates(str(self.folders["coordinates"] / "vertex_coordinates.txt"))
@@ -289,6 +483,7 @@ class PolygonSuperimposer:
         
         print("✓ Fitxers de coordenades desats")
     
+    @profiled()
     def create_visualization_summary(self):
         """Crea un resum visual de tots els resultats."""
         print("\n📊 Creant resum visual...")
@@ -337,7 +532,8 @@ class PolygonSuperimposer:
                     cv2.circle(summary_image, tuple(vertex), 3, color, -1)
         
         # Desa resum
-        cv2.imwrite(str(self.folders["visualizations"] / "summary_with_legend.png"), summary_image)
+        self.writer.write_image(self.folders["visualizations"] / "summary_with_legend.png", summary_image,
+                                artifact_class="visualization")
         
         # Crear fitxer de resum de text
         with open(self.folders["visualizations"] / "summary.txt", 'w', encoding='utf-8') as f:
@@ -354,6 +550,7 @@ class PolygonSuperimposer:
         
         print("✓ Resum visual creat")
     
+    @profiled()
     def create_readme(self):
         """Crea un fitxer README amb informació sobre els resultats."""
         readme_path = self.main_folder / "README.md"
@@ -378,7 +575,8 @@ class PolygonSuperimposer:
             f.write("- `all_polygons_vertices.png` - Només vèrtexs dels polígons\n")
             f.write("- `vertex_coordinates.txt` - Coordenades en format llegible\n")
             f.write("- `vertex_coordinates.csv` - Coordenades en format CSV\n")
-            f.write("- `vertex_data.json` - Dades completes en JSON\n\n")
+            f.write("- `vertex_data.json` - Dades completes en JSON\n")
+            f.write("- `spatial_index.npz` - Índex espacial per a consultes de punts i rectangles\n\n")
             
             f.write("## Estadístiques\n\n")
             total_polygons = sum(len(polygons) for polygons in self.vertex_data.values())
@@ -390,14 +588,19 @@ class PolygonSuperimposer:
         
         print("✓ Fitxer README creat")
     
-    def run_complete_analysis(self):
-        """Executa l'anàlisi complet i crea tots els resultats."""
+    def run_complete_analysis(self, individual_mode="full"):
+        """
+        Executa l'anàlisi complet i crea tots els resultats.
+        
+        Args:
+            individual_mode (str): Mode de les imatges individuals (vegeu INDIVIDUAL_MODES)
+        """
         print("\n🚀 INICIANT ANÀLISI COMPLET DE POLÍGONS")
         print("=" * 50)
         
         try:
             # Crear imatges individuals
-            self.create_individual_polygon_images()
+            self.create_individual_polygon_images(mode=individual_mode)
             
             # Crear imatges per tipus d'espai aeri
             self.create_airspace_type_images()
@@ -414,10 +617,22 @@ class PolygonSuperimposer:
             # Crear README
             self.create_readme()
             
+            # Esperar les imatges pendents de codificar
+            with self.profiler.stage("flush_writes", component="PolygonSuperimposer"):
+                failures = self.writer.flush()
+            if failures:
+                print(f"⚠ No s'han pogut desar {len(failures)} fitxers")
+            if self.writer.max_workers or self.writer.encodings:
+                self.writer.report()
+            
             print(f"\n✅ ANÀLISI COMPLETAT!")
             print(f"📁 Resultats desats a: {self.main_folder}")
             print(f"📊 Total polígons detectats: {sum(len(polygons) for polygons in self.vertex_data.values())}")
             
+            if self.profiler.enabled:
+                self.profiler.print_summary()
+                self.profiler.save(self.folders["data"])
+            
             return self.main_folder
             
         except Exception as e:
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Perfil Vertical dels Espais Aeris al llarg d'una Ruta
+
+Aquest mòdul mostreja una ruta (llista de punts de pas lat/lon) a intervals
+regulars i creua totes les mostres amb els polígons detectats en una sola
+consulta vectoritzada, per obtenir la pila de floors i ceilings que travessa
+la ruta. El perfil es pot dibuixar com a imatge (distància en horitzontal,
+altitud en vertical, una banda per espai aeri).
+
+La ruta se situa a la carta amb la mateixa correspondència que
+map_pixel_to_latlon: una GeoTransform explícita o els límits chart_bounds.
+"""
+
+import numpy as np
+
+from altitude_raster import limit_arrays
+from artifact_writer import ArtifactWriter
+from geo_transform import GeoTransform, resolve_transform
+from overlay_compositor import AIRSPACE_COLORS, DEFAULT_COLOR, OverlayCompositor
+
+# Radi terrestre mitjà en milles nàutiques
+EARTH_RADIUS_NM = 3440.065
+
+# Mida i marges (esquerre, dalt, dret, baix) de la imatge del perfil
+PROFILE_SIZE = (1200, 500)
+PROFILE_MARGINS = (70, 30, 30, 50)
+
+# Altitud mínima de l'eix vertical del perfil, en peus
+MIN_PROFILE_ALTITUDE = 1000.0
+
+
+def _haversine_nm(lat1, lon1, lat2, lon2):
+    """Distància ortodròmica en milles nàutiques entre parells de punts (graus)."""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def waypoint_distances(waypoints):
+    """Distància acumulada en milles nàutiques de cada punt de pas (lat, lon) des de l'inici de la ruta."""
+    waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 2)
+    legs = _haversine_nm(waypoints[:-1, 0], waypoints[:-1, 1], waypoints[1:, 0], waypoints[1:, 1])
+    return np.concatenate([[0.0], np.cumsum(legs)])
+
+
+def sample_route(waypoints, spacing_nm=1.0):
+    """
+    Mostreja una ruta a intervals regulars de distància.
+
+    Cada tram segueix l'ortodròmica entre els seus punts de pas (interpolació
+    esfèrica), de manera que les mostres queden equiespaiades sobre la ruta
+    volada. Els punts de pas sempre són mostres.
+
+    Args:
+        waypoints (array): Array (W, 2) de punts de pas (lat, lon) en graus, W >= 2
+        spacing_nm (float): Separació entre mostres en milles nàutiques
+
+    Returns:
+        tuple: Arrays (distàncies en NM, lat, lon) de les mostres
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 2)
+    if len(waypoints) < 2:
+        raise ValueError("Una ruta necessita almenys dos punts de pas")
+    if spacing_nm <= 0:
+        raise ValueError("La separació entre mostres ha de ser positiva")
+
+    cumulative = waypoint_distances(waypoints)
+    legs = np.diff(cumulative)
+    distances = np.union1d(np.arange(0.0, cumulative[-1], spacing_nm), cumulative)
+
+    leg = np.clip(np.searchsorted(cumulative, distances, side="right") - 1, 0, len(legs) - 1)
+    fraction = np.divide(distances - cumulative[leg], legs[leg], out=np.zeros(len(distances)), where=legs[leg] > 0)
+    # Interpolació esfèrica entre els vectors unitaris dels extrems del tram
+    lat, lon = np.radians(waypoints[:, 0]), np.radians(waypoints[:, 1])
+    unit = np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    angle = legs[leg] / EARTH_RADIUS_NM
+    sin_angle = np.sin(angle)
+    straight = sin_angle == 0
+    weight_start = np.where(straight, 1 - fraction, np.sin((1 - fraction) * angle) / np.where(straight, 1, sin_angle))
+    weight_end = np.where(straight, fraction, np.sin(fraction * angle) / np.where(straight, 1, sin_angle))
+    point = weight_start[:, None] * unit[leg] + weight_end[:, None] * unit[leg + 1]
+    lat = np.degrees(np.arctan2(point[:, 2], np.hypot(point[:, 0], point[:, 1])))
+    lon = np.degrees(np.arctan2(point[:, 1], point[:, 0]))
+    return distances, lat, lon
+
+
+class RouteProfiler:
+    def __init__(self, index, limits, transform=None):
+        """
+        Inicialitza el generador de perfils.
+
+        Args:
+            index (PolygonIndex): Índex dels polígons de la carta
+            limits: Floor i ceiling de cada polígon en peus (vegeu altitude_raster.limit_arrays)
+            transform (GeoTransform): Georeferenciació de la carta (per defecte, la de l'índex)
+        """
+        self.index = index
+        self.store = index.store
+        self.floors, self.ceilings = limit_arrays(index.store, limits)
+        self.transform = resolve_transform(transform, index.transform)
+
+    @classmethod
+    def from_detector(cls, detector, limits, chart_bounds=None, transform=None):
+        """
+        Crea el generador sobre els polígons d'un AirspaceVertexDetector.
+
+        Args:
+            detector (AirspaceVertexDetector): Detector amb els polígons i la imatge
+            limits: Floor i ceiling de cada polígon (vegeu limit_arrays)
+            chart_bounds (dict): Límits 'north', 'south', 'east', 'west' de la carta, com a
+                map_pixel_to_latlon (si no es dona transform)
+            transform (GeoTransform): Georeferenciació de la carta
+        """
+        if transform is None and chart_bounds is not None:
+            height, width = detector.original_image.shape[:2]
+            transform = GeoTransform.from_chart_bounds(chart_bounds, width, height)
+        return cls(detector.spatial_index, limits, transform)
+
+    def profile(self, waypoints, spacing_nm=1.0):
+        """
+        Calcula el perfil vertical dels espais aeris al llarg d'una ruta.
+
+        Args:
+            waypoints (array): Array (W, 2) de punts de pas (lat, lon) en graus
+            spacing_nm (float): Separació entre mostres en milles nàutiques
+
+        Returns:
+            dict: "distance", "lat" i "lon" de cada mostra; "sample", "polygon", "floor" i
+                "ceiling" de cada parell (mostra, espai aeri), ordenats per mostra;
+                "lowest_floor" i "highest_ceiling" de cada mostra (NaN si no n'hi ha cap); i
+                "waypoint_distance", la distància de cada punt de pas
+        """
+        distances, lat, lon = sample_route(waypoints, spacing_nm)
+        samples, polygons = self.index.query_points(self.transform.latlon_to_points(np.column_stack([lat, lon])))
+
+        # Només els espais aeris amb límits verticals
+        limited = ~np.isnan(self.floors[polygons]) & ~np.isnan(self.ceilings[polygons])
+        samples, polygons = samples[limited], polygons[limited]
+        floors, ceilings = self.floors[polygons], self.ceilings[polygons]
+
+        lowest_floor = np.full(len(distances), np.inf)
+        np.minimum.at(lowest_floor, samples, floors)
+        highest_ceiling = np.full(len(distances), -np.inf)
+        np.maximum.at(highest_ceiling, samples, ceilings)
+        lowest_floor[np.isinf(lowest_floor)] = np.nan
+        highest_ceiling[np.isinf(highest_ceiling)] = np.nan
+
+        return {
+            "distance": distances,
+            "lat": lat,
+            "lon": lon,
+            "waypoint_distance": waypoint_distances(waypoints),
+            "sample": samples,
+            "polygon": polygons,
+            "floor": floors,
+            "ceiling": ceilings,
+            "lowest_floor": lowest_floor,
+            "highest_ceiling": highest_ceiling,
+        }
+
+    def _bands(self, profile):
+        """
+        Agrupa els parells (mostra, espai aeri) en trams continus de cada espai aeri.
+
+        Returns:
+            tuple: Arrays (polígon, distància inicial, distància final) de cada tram
+        """
+        samples, polygons = profile["sample"], profile["polygon"]
+        if not len(samples):
+            return np.empty(0, dtype=np.int32), np.empty(0), np.empty(0)
+        order = np.lexsort((samples, polygons))
+        samples, polygons = samples[order], polygons[order]
+        starts = np.flatnonzero(np.r_[True, (polygons[1:] != polygons[:-1]) | (samples[1:] != samples[:-1] + 1)])
+        ends = np.r_[starts[1:], len(samples)] - 1
+
+        # Cada tram s'estén fins a mig camí de les mostres veïnes
+        distance = profile["distance"]
+        midpoints = np.concatenate([[distance[0]], (distance[1:] + distance[:-1]) / 2, [distance[-1]]])
+        return polygons[starts], midpoints[samples[starts]], midpoints[samples[ends] + 1]
+
+    def render(self, profile, output_path, max_altitude=None, size=PROFILE_SIZE, writer=None):
+        """
+        Dibuixa el perfil: una banda semitransparent per espai aeri entre el seu floor i el seu ceiling.
+
+        Args:
+            profile (dict): Resultat de profile
+            output_path (str): Camí de la imatge
+            max_altitude (float): Altitud màxima de l'eix vertical en peus (per defecte,
+                el ceiling més alt del perfil amb un 10 % de marge; com a mínim
+                MIN_PROFILE_ALTITUDE)
+            size (tuple): Mida (amplada, alçada) de la imatge
+            writer (ArtifactWriter): Escriptor de la imatge (per defecte, síncron)
+
+        Returns:
+            np.ndarray: Imatge BGR del perfil
+        """
+        width, height = size
+        left, top, right, bottom = PROFILE_MARGINS
+        total_distance = max(profile["distance"][-1], 1e-9)
+        ceilings = profile["ceiling"][np.isfinite(profile["ceiling"])]
+        if max_altitude is None:
+            max_altitude = ceilings.max() * 1.1 if len(ceilings) else 10000.0
+        max_altitude = max(max_altitude, MIN_PROFILE_ALTITUDE)
+
+        def to_x(distance):
+            return left + np.asarray(distance) / total_distance * (width - left - right)
+
+        def to_y(altitude):
+            return top + (1 - np.minimum(np.asarray(altitude), max_altitude) / max_altitude) * (height - top - bottom)
+
+        compositor = OverlayCompositor(np.full((height, width, 3), 255, dtype=np.uint8))
+        axis_color, grid_color = (0, 0, 0), (220, 220, 220)
+
+        # Graella d'altituds i de distàncies
+        altitude_step = 10 ** np.floor(np.log10(max_altitude / 2))
+        altitudes = np.arange(0, max_altitude + 1, altitude_step)
+        distance_step = 10 ** np.floor(np.log10(total_distance / 2)) if total_distance > 1 else 1
+        distances = np.arange(0, total_distance + 1e-9, distance_step)
+        grid_lines = [np.array([[left, y], [width - right, y]], np.int32) for y in np.rint(to_y(altitudes))]
+        grid_lines += [np.array([[x, top], [x, height - bottom]], np.int32) for x in np.rint(to_x(distances))]
+        compositor.outlines(grid_lines, grid_color, 1)
+
+        # Bandes dels espais aeris, per tipus
+        polygons, band_starts, band_ends = self._bands(profile)
+        class_ids = self.store.class_ids[polygons]
+        for class_id, class_name in enumerate(self.store.class_names):
+            in_class = class_ids == class_id
+            if not in_class.any():
+                continue
+            rectangles = [np.array([[x0, y1], [x1, y1], [x1, y0], [x0, y0]], np.int32) for x0, x1, y0, y1 in zip(
+                np.rint(to_x(band_starts[in_class])).tolist(), np.rint(to_x(band_ends[in_class])).tolist(),
+                np.rint(to_y(self.floors[polygons[in_class]])).tolist(),
+                np.rint(to_y(self.ceilings[polygons[in_class]])).tolist())]
+            color = AIRSPACE_COLORS.get(class_name, DEFAULT_COLOR)
+            compositor.fill_layer(rectangles, color, 0.35)
+            compositor.outlines(rectangles, color, 1)
+
+        # Punts de pas, eixos i etiquetes
+        waypoint_lines = [np.array([[x, top], [x, height - bottom]], np.int32)
+                          for x in np.rint(to_x(profile["waypoint_distance"]))]
+        compositor.outlines(waypoint_lines, (90, 90, 90), 1)
+        compositor.outlines([np.array([[left, top], [left, height - bottom]], np.int32),
+                             np.array([[left, height - bottom], [width - right, height - bottom]], np.int32)],
+                            axis_color, 1)
+        compositor.labels([f"{altitude:.0f}" for altitude in altitudes],
+                          [(5, y + 4) for y in to_y(altitudes)], axis_color, 0.4, 1)
+        compositor.labels([f"{distance:g}" for distance in distances],
+                          [(x - 8, height - bottom + 18) for x in to_x(distances)], axis_color, 0.4, 1)
+        compositor.labels(["ft", "NM"], [(5, top - 10), (width - right - 20, height - 10)], axis_color, 0.45, 1)
+
+        writer = writer if writer is not None else ArtifactWriter(max_workers=0)
+        writer.write_image(output_path, compositor.image, artifact_class="visualization")
+        print(f"✓ Perfil vertical desat: {output_path}")
+        return compositor.image
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Índex Espacial de Polígons d'Espais Aeris
+
+Aquest mòdul indexa els polígons d'un PolygonStore en una graella uniforme
+sobre les seves caixes contenidores: cada cel·la guarda (en format CSR) els
+polígons la caixa dels quals la toca. Sobre aquest índex es resolen, per lots
+de punts i sense bucles Python per punt:
+
+- quins polígons contenen cada punt (en píxels o en lat/lon),
+- quins polígons tenen la caixa dins d'un rectangle,
+- quin és el polígon més proper a cada punt.
+
+Els forats dels polígons formen part de la vora: un punt dins d'un forat és fora
+del polígon.
+
+L'índex (magatzem inclòs) es desa en un .npz al costat del JSON de vèrtexs.
+"""
+
+import json
+
+import numpy as np
+
+from geo_transform import GeoTransform, resolve_transform
+from polygon_store import STORE_ARRAYS, PolygonStore, expand_ranges, group_positions
+
+# Màxim de cel·les per costat de la graella
+MAX_GRID_SIDE = 512
+
+# Arestes processades per bloc en les proves punt-polígon (limita la memòria)
+EDGE_CHUNK = 1 << 21
+
+# Parells punt-polígon avaluats per bloc en la cerca del més proper
+NEAREST_CHUNK = 1 << 22
+
+
+class PolygonIndex:
+    def __init__(self, store, cell_size=None, transform=None, image_hash=None):
+        """
+        Construeix l'índex sobre els polígons d'un magatzem.
+
+        Args:
+            store (PolygonStore): Polígons a indexar
+            cell_size (float): Mida de les cel·les en píxels; per defecte, la mediana
+                del costat més llarg de les caixes (limitada a MAX_GRID_SIDE cel·les per costat)
+            transform (GeoTransform): Georeferenciació per a les consultes en lat/lon
+            image_hash (str): Hash de la imatge dels polígons (es desa amb l'índex)
+        """
+        self.store = store
+        self.transform = transform
+        self.image_hash = image_hash
+
+        self._set_box_extents()
+        if len(store):
+            self.origin = (float(self._x0.min()), float(self._y0.min()))
+            extent = max(self._x1.max() - self.origin[0], self._y1.max() - self.origin[1]) + 1
+            if cell_size is None:
+                cell_size = float(np.median(store.bboxes[:, 2:].max(axis=1)))
+            cell_size = max(float(cell_size), extent / MAX_GRID_SIDE, 1.0)
+            self.grid_shape = (int((self._y1.max() - self.origin[1]) // cell_size) + 1,
+                               int((self._x1.max() - self.origin[0]) // cell_size) + 1)
+        else:
+            self.origin, cell_size, self.grid_shape = (0.0, 0.0), 1.0, (0, 0)
+        self.cell_size = cell_size
+        self.cell_offsets, self.cell_polygons = self._build_grid()
+
+    @classmethod
+    def from_vertex_data(cls, vertex_data, **kwargs):
+        """Construeix l'índex a partir del diccionari {tipus: [polígon, ...]}."""
+        return cls(PolygonStore.from_vertex_data(vertex_data), **kwargs)
+
+    def _set_box_extents(self):
+        """Extrems inclusius de les caixes (cv2.boundingRect inclou el píxel x + amplada - 1)."""
+        bboxes = self.store.bboxes.astype(np.float64)
+        self._x0, self._y0 = bboxes[:, 0], bboxes[:, 1]
+        self._x1 = bboxes[:, 0] + np.maximum(bboxes[:, 2] - 1, 0)
+        self._y1 = bboxes[:, 1] + np.maximum(bboxes[:, 3] - 1, 0)
+
+    def _build_grid(self):
+        """Reparteix els polígons per les cel·les que toquen les seves caixes (CSR)."""
+        rows, cols = self.grid_shape
+        if not len(self.store):
+            return np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32)
+
+        cx0, cy0 = self._cells(self._x0, self._y0)
+        cx1, cy1 = self._cells(self._x1, self._y1)
+        nx, ny = cx1 - cx0 + 1, cy1 - cy0 + 1
+        counts = nx * ny
+
+        # Una entrada per parell (polígon, cel·la), sense bucles per polígon
+        polygon = np.repeat(np.arange(len(self.store)), counts)
+        local = group_positions(counts)
+        cell = (np.repeat(cy0, counts) + local // np.repeat(nx, counts)) * cols + \
+            np.repeat(cx0, counts) + local % np.repeat(nx, counts)
+
+        order = np.argsort(cell, kind="stable")
+        offsets = np.zeros(rows * cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell, minlength=rows * cols), out=offsets[1:])
+        return offsets, polygon[order].astype(np.int32)
+
+    def _cells(self, x, y):
+        """Cel·la (columna, fila) de coordenades de píxel, sense limitar a la graella."""
+        return (np.floor((np.asarray(x, dtype=np.float64) - self.origin[0]) / self.cell_size).astype(np.int64),
+                np.floor((np.asarray(y, dtype=np.float64) - self.origin[1]) / self.cell_size).astype(np.int64))
+
+    def _pair_chunks(self, polygons):
+        """Divideix els parells en blocs de com a molt EDGE_CHUNK arestes."""
+        edge_ends = np.cumsum((self.store.num_vertices + self.store.num_hole_vertices)[polygons])
+        start = 0
+        while start < len(polygons):
+            limit = (edge_ends[start - 1] if start else 0) + EDGE_CHUNK
+            end = max(int(np.searchsorted(edge_ends, limit, side="right")), start + 1)
+            yield start, end
+            start = end
+
+    def _contains(self, x, y, polygons):
+        """
+        Prova punt-polígon vectoritzada (regla parell-senar) per parells (x[i], y[i], polygons[i]).
+
+        Returns:
+            np.ndarray: Màscara booleana per parell
+        """
+        inside = np.zeros(len(polygons), dtype=bool)
+        for start, end in self._pair_chunks(polygons):
+            pair, x1, y1, x2, y2 = self.store.edges(polygons[start:end])
+            px, py = x[start:end][pair], y[start:end][pair]
+            spans = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            crossings = np.bincount(pair, weights=spans & (px < crossing_x), minlength=end - start)
+            inside[start:end] = crossings % 2 == 1
+        return inside
+
+    def contains_pairs(self, points, polygons):
+        """
+        Prova punt-polígon per parells: si el punt points[i] és dins del polígon polygons[i].
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel
+            polygons (array): Índex de polígon de cada punt, N elements
+
+        Returns:
+            np.ndarray: Màscara booleana per parell (la mateixa regla que query_points)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return self._contains(points[:, 0], points[:, 1], np.asarray(polygons, dtype=np.int64))
+
+    def _candidates(self, x, y):
+        """Parells (punt, polígon) amb el punt dins de la caixa del polígon."""
+        rows, cols = self.grid_shape
+        cx, cy = self._cells(x, y)
+        valid = np.flatnonzero((cx >= 0) & (cx < cols) & (cy >= 0) & (cy < rows))
+        cell = cy[valid] * cols + cx[valid]
+        starts = self.cell_offsets[cell]
+        counts = self.cell_offsets[cell + 1] - starts
+
+        points = np.repeat(valid, counts)
+        polygons = self.cell_polygons[expand_ranges(starts, counts)]
+
+        px, py = x[points], y[points]
+        in_box = (px >= self._x0[polygons]) & (px <= self._x1[polygons]) & \
+            (py >= self._y0[polygons]) & (py <= self._y1[polygons])
+        return points[in_box], polygons[in_box]
+
+    def query_points(self, points):
+        """
+        Troba els polígons que contenen cada punt.
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel
+
+        Returns:
+            tuple: Arrays (índexs de punt, índexs de polígon) de cada parell contingut,
+                ordenats per punt; els índexs de polígon són del magatzem
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, 0], points[:, 1]
+        point_indices, polygons = self._candidates(x, y)
+        inside = self._contains(x[point_indices], y[point_indices], polygons)
+        return point_indices[inside], polygons[inside]
+
+    def query_latlon(self, latlon, transform=None):
+        """
+        Com query_points, amb punts (lat, lon) en graus.
+
+        Args:
+            latlon (array): Array (N, 2) de (lat, lon)
+            transform (GeoTransform): Georeferenciació (per defecte, la de l'índex)
+        """
+        return self.query_points(resolve_transform(transform, self.transform).latlon_to_points(latlon))
+
+    def contains(self, points):
+        """
+        Matriu de pertinença punt × polígon.
+
+        Returns:
+            np.ndarray: Array booleà (N, P)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        membership = np.zeros((len(points), len(self.store)), dtype=bool)
+        membership[self.query_points(points)] = True
+        return membership
+
+    def segment_candidates(self, x0, y0, x1, y1):
+        """
+        Parells (segment, polígon) amb la caixa del segment i la del polígon superposades.
+
+        Args:
+            x0, y0, x1, y1 (array): Extrems de S segments en píxels
+
+        Returns:
+            tuple: Arrays (índexs de segment, índexs de polígon), sense repeticions
+        """
+        rows, cols = self.grid_shape
+        x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+        box_x0, box_x1 = np.minimum(x0, x1), np.maximum(x0, x1)
+        box_y0, box_y1 = np.minimum(y0, y1), np.maximum(y0, y1)
+
+        # Cel·les de la caixa de cada segment, retallades a la graella
+        cx0, cy0 = self._cells(box_x0, box_y0)
+        cx1, cy1 = self._cells(box_x1, box_y1)
+        cx0, cy0 = np.maximum(cx0, 0), np.maximum(cy0, 0)
+        cx1, cy1 = np.minimum(cx1, cols - 1), np.minimum(cy1, rows - 1)
+        valid = np.flatnonzero((cx0 <= cx1) & (cy0 <= cy1))
+        nx = cx1[valid] - cx0[valid] + 1
+        counts = nx * (cy1[valid] - cy0[valid] + 1)
+        segments = np.repeat(valid, counts)
+        local = group_positions(counts)
+        cell = (cy0[segments] + local // np.repeat(nx, counts)) * cols + cx0[segments] + local % np.repeat(nx, counts)
+
+        # Polígons de cada cel·la, sense repetir els parells que surten a diverses cel·les
+        starts = self.cell_offsets[cell]
+        counts = self.cell_offsets[cell + 1] - starts
+        pairs = np.unique(np.repeat(segments, counts) * len(self.store) +
+                          self.cell_polygons[expand_ranges(starts, counts)])
+        segments, polygons = pairs // max(len(self.store), 1), pairs % max(len(self.store), 1)
+
+        overlap = (box_x0[segments] <= self._x1[polygons]) & (box_x1[segments] >= self._x0[polygons]) & \
+            (box_y0[segments] <= self._y1[polygons]) & (box_y1[segments] >= self._y0[polygons])
+        return segments[overlap], polygons[overlap]
+
+    def segment_crossings(self, x0, y0, x1, y1, closed=False):
+        """
+        Troba on creuen els segments les vores dels polígons.
+
+        Cada segment es prova contra totes les arestes dels polígons candidats (vegeu
+        segment_candidates). Els segments es consideren semioberts ([inici, final)),
+        com les arestes, perquè un creuament exacte sobre un vèrtex o un extrem es
+        compti una sola vegada.
+
+        Args:
+            x0, y0, x1, y1 (array): Extrems de S segments en píxels
+            closed (bool): Segments i arestes tancats: inclou també els contactes als
+                extrems i als vèrtexs (pot repetir un mateix punt de tall)
+
+        Returns:
+            tuple: Arrays (índex de segment, índex de polígon, fracció 0 <= t < 1 del
+                segment, o t <= 1 si closed) de cada creuament, ordenats per segment i t
+        """
+        x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+        segments, polygons = self.segment_candidates(x0, y0, x1, y1)
+        hit_segments, hit_polygons, hit_t = [], [], []
+        for start, end in self._pair_chunks(polygons):
+            pair, ex1, ey1, ex2, ey2 = self.store.edges(polygons[start:end])
+            chunk = segments[start:end][pair]
+            sx, sy = x0[chunk], y0[chunk]
+            dx, dy = x1[chunk] - sx, y1[chunk] - sy
+            ex, ey = ex2 - ex1, ey2 - ey1
+            denominator = dx * ey - dy * ex
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = ((ex1 - sx) * ey - (ey1 - sy) * ex) / denominator
+                u = ((ex1 - sx) * dy - (ey1 - sy) * dx) / denominator
+            if closed:
+                hit = (denominator != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+            else:
+                hit = (denominator != 0) & (t >= 0) & (t < 1) & (u >= 0) & (u < 1)
+            hit_segments.append(chunk[hit])
+            hit_polygons.append(polygons[start:end][pair[hit]])
+            hit_t.append(t[hit])
+
+        if not hit_segments:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        hit_segments, hit_polygons, hit_t = (np.concatenate(values) for values in
+                                             (hit_segments, hit_polygons, hit_t))
+        order = np.lexsort((hit_t, hit_segments))
+        return hit_segments[order], hit_polygons[order].astype(np.int64), hit_t[order]
+
+    def query_box(self, x0, y0, x1, y1):
+        """
+        Retorna els índexs dels polígons amb la caixa contenidora dins o tocant un rectangle.
+
+        Args:
+            x0, y0, x1, y1 (float): Cantonades del rectangle en píxels (inclusives)
+        """
+        rows, cols = self.grid_shape
+        if not len(self.store):
+            return np.empty(0, dtype=np.int64)
+        (cx0, cx1), (cy0, cy1) = self._cells([x0, x1], [y0, y1])
+        cx0, cx1 = max(cx0, 0), min(cx1, cols - 1)
+        cy0, cy1 = max(cy0, 0), min(cy1, rows - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+
+        cells = (np.arange(cy0, cy1 + 1)[:, None] * cols + np.arange(cx0, cx1 + 1)).ravel()
+        candidates = np.unique(np.concatenate([self.cell_polygons[self.cell_offsets[c]:self.cell_offsets[c + 1]]
+                                               for c in cells]))
+        overlap = (self._x0[candidates] <= x1) & (self._x1[candidates] >= x0) & \
+            (self._y0[candidates] <= y1) & (self._y1[candidates] >= y0)
+        return candidates[overlap].astype(np.int64)
+
+    def _edge_distances(self, x, y, polygons):
+        """Distància mínima de cada punt a les arestes del seu polígon (parells)."""
+        distances = np.empty(len(polygons))
+        for start, end in self._pair_chunks(polygons):
+            pair, x1, y1, x2, y2 = self.store.edges(polygons[start:end])
+            px, py = x[start:end][pair], y[start:end][pair]
+            dx, dy = x2 - x1, y2 - y1
+            length = dx * dx + dy * dy
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.clip(np.where(length > 0, ((px - x1) * dx + (py - y1) * dy) / length, 0.0), 0.0, 1.0)
+            edge_distance = np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+            first = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+            distances[start:end] = np.minimum.reduceat(edge_distance, first)
+        return distances
+
+    def nearest(self, points, max_distance=None):
+        """
+        Troba el polígon més proper a cada punt (distància 0 si el punt hi és dins).
+
+        Només s'avaluen exactament els polígons amb la caixa prou a prop: un polígon
+        toca els quatre costats de la seva caixa, de manera que la distància al
+        polígon és com a molt la de la cantonada més llunyana de la caixa.
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel
+            max_distance (float): Distància màxima de cerca en píxels
+
+        Returns:
+            tuple: (índexs de polígon, -1 si no n'hi ha cap; distàncies en píxels, inf si no n'hi ha cap)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        nearest_polygons = np.full(len(points), -1, dtype=np.int64)
+        nearest_distances = np.full(len(points), np.inf)
+        if not len(self.store):
+            return nearest_polygons, nearest_distances
+
+        chunk = max(1, NEAREST_CHUNK // len(self.store))
+        for start in range(0, len(points), chunk):
+            x = points[start:start + chunk, 0:1]
+            y = points[start:start + chunk, 1:2]
+            box_distance = np.hypot(np.maximum(np.maximum(self._x0 - x, x - self._x1), 0),
+                                    np.maximum(np.maximum(self._y0 - y, y - self._y1), 0))
+            bound = np.hypot(np.maximum(np.abs(x - self._x0), np.abs(x - self._x1)),
+                             np.maximum(np.abs(y - self._y0), np.abs(y - self._y1))).min(axis=1)
+            if max_distance is not None:
+                bound = np.minimum(bound, max_distance)
+
+            point_indices, polygons = np.nonzero(box_distance <= bound[:, None])
+            px, py = x[point_indices, 0], y[point_indices, 0]
+            distances = self._edge_distances(px, py, polygons)
+            distances[self._contains(px, py, polygons)] = 0.0
+
+            # El més proper de cada punt: ordenar per (punt, distància) i agafar el primer
+            order = np.lexsort((distances, point_indices))
+            sorted_points = point_indices[order]
+            first = order[np.r_[True, sorted_points[1:] != sorted_points[:-1]][:len(order)]]
+            if max_distance is not None:
+                first = first[distances[first] <= max_distance]
+            nearest_polygons[start + point_indices[first]] = polygons[first]
+            nearest_distances[start + point_indices[first]] = distances[first]
+        return nearest_polygons, nearest_distances
+
+    def save(self, output_path):
+        """Desa l'índex i els polígons en un fitxer .npz."""
+        arrays = self.store.to_arrays()
+        arrays["class_names"] = np.array(arrays["class_names"], dtype=str)
+        metadata = {
+            "cell_size": self.cell_size,
+            "origin": list(self.origin),
+            "grid_shape": list(self.grid_shape),
+            "transform": self.transform.to_dict() if self.transform is not None else None,
+            "image_sha256": self.image_hash,
+        }
+        np.savez_compressed(output_path, cell_offsets=self.cell_offsets, cell_polygons=self.cell_polygons,
+                            metadata=np.array(json.dumps(metadata)), **arrays)
+        print(f"✓ Índex espacial desat: {output_path}")
+
+    @classmethod
+    def load(cls, input_path):
+        """Carrega un índex desat amb save."""
+        with np.load(input_path, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            arrays = {name: data[name] for name in STORE_ARRAYS if name in data}
+            arrays["class_names"] = data["class_names"].tolist()
+            index = cls.__new__(cls)
+            index.store = PolygonStore.from_arrays(arrays)
+            index.cell_offsets = data["cell_offsets"]
+            index.cell_polygons = data["cell_polygons"]
+
+        transform = metadata["transform"]
+        index.transform = GeoTransform.from_dict(transform) if transform else None
+        index.image_hash = metadata["image_sha256"]
+        index.cell_size = metadata["cell_size"]
+        index.origin = tuple(metadata["origin"])
+        index.grid_shape = tuple(metadata["grid_shape"])
+        index._set_box_extents()
+        return index
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Instrumentació per Etapes
+
+Aquest mòdul mesura cada etapa del preprocessament, la detecció i la
+superposició: temps real, temps de CPU, bytes escrits, pic de memòria
+(tracemalloc i RSS) i mida dels arrays produïts. El perfil de cada execució es
+desa en JSON i CSV, i opcionalment es pot capturar un cProfile d'etapes concretes.
+"""
+
+import contextlib
+import cProfile
+import csv
+import functools
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Columnes del perfil CSV (i ordre dels camps de cada registre)
+PROFILE_FIELDS = ("component", "stage", "parent", "depth", "start_s", "wall_s", "cpu_s",
+                  "bytes_written", "tracemalloc_peak_bytes", "rss_delta_bytes", "peak_rss_delta_bytes",
+                  "output_arrays", "output_bytes", "output_shapes", "cached", "cprofile")
+
+
+def _written_bytes():
+    """Bytes escrits pel procés fins ara (Linux), o None si no es pot mesurar."""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _rss_bytes():
+    """Memòria resident actual del procés (Linux), o None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes():
+    """Pic de memòria resident del procés, o None."""
+    if resource is None:
+        return None
+    # ru_maxrss és en KiB a Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _delta(end, start):
+    return end - start if end is not None and start is not None else None
+
+
+def summarize_arrays(value):
+    """
+    Retorna el nombre, la mida total i les formes dels arrays d'un resultat.
+
+    Recorre llistes, tuples i diccionaris (com els resultats del pipeline).
+    """
+    arrays = []
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, np.ndarray):
+            arrays.append(item)
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            pending.extend(item.values())
+
+    shapes = [f"{array.dtype}{list(array.shape)}" for array in arrays[:8]]
+    if len(arrays) > 8:
+        shapes.append(f"... +{len(arrays) - 8}")
+    return {"output_arrays": len(arrays), "output_bytes": int(sum(array.nbytes for array in arrays)),
+            "output_shapes": " ".join(shapes)}
+
+
+class StageProfiler:
+    def __init__(self, enabled=True, trace_memory=True, cprofile_stages=()):
+        """
+        Inicialitza el perfilador.
+
+        Args:
+            enabled (bool): Si és False, les etapes no es mesuren (cost pràcticament nul)
+            trace_memory (bool): Mesurar el pic de memòria Python/NumPy amb tracemalloc
+                (afegeix sobrecost a les etapes amb moltes assignacions)
+            cprofile_stages (iterable): Noms d'etapes ("etapa" o "Component.etapa") a
+                capturar amb cProfile
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.cprofile_stages = set(cprofile_stages)
+        self.records = []
+        self.cprofiles = {}
+        self._stack = []
+        self._active_cprofile = None
+        self._started_tracemalloc = False
+        self._t0 = time.perf_counter()
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    @contextlib.contextmanager
+    def stage(self, name, component=None, **metadata):
+        """
+        Mesura el bloc com una etapa.
+
+        Les etapes es poden niuar; el pic de memòria d'una etapa inclou el de les
+        seves filles.
+
+        Yields:
+            dict: Registre de l'etapa; record_output hi afegeix la mida dels arrays
+        """
+        record = {"component": component, "stage": name}
+        if not self.enabled:
+            yield record
+            return
+
+        record.update(metadata)
+        record["parent"] = self._stack[-1]["stage"] if self._stack else None
+        record["depth"] = len(self._stack)
+
+        if self.trace_memory:
+            # El pic de l'etapa pare s'ha d'acumular abans de reiniciar-lo per a la filla
+            peak = tracemalloc.get_traced_memory()[1]
+            for open_record in self._stack:
+                open_record["_peak"] = max(open_record["_peak"], peak)
+            record["_traced_start"] = tracemalloc.get_traced_memory()[0]
+            record["_peak"] = 0
+            tracemalloc.reset_peak()
+
+        profile = None
+        qualified = f"{component}.{name}" if component else name
+        if self._active_cprofile is None and {name, qualified} & self.cprofile_stages:
+            profile = self._active_cprofile = cProfile.Profile()
+
+        self._stack.append(record)
+        written, rss, peak_rss = _written_bytes(), _rss_bytes(), _peak_rss_bytes()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._active_cprofile = None
+                self.cprofiles[qualified] = profile
+                record["cprofile"] = qualified
+
+            record["start_s"] = wall - self._t0
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            record["bytes_written"] = _delta(_written_bytes(), written)
+            record["rss_delta_bytes"] = _delta(_rss_bytes(), rss)
+            record["peak_rss_delta_bytes"] = _delta(_peak_rss_bytes(), peak_rss)
+            self._stack.pop()
+
+            if self.trace_memory:
+                peak = max(record.pop("_peak"), tracemalloc.get_traced_memory()[1])
+                record["tracemalloc_peak_bytes"] = peak - record.pop("_traced_start")
+                for open_record in self._stack:
+                    open_record["_peak"] = max(open_record["_peak"], peak)
+            self.records.append(record)
+
+    @staticmethod
+    def record_output(record, value):
+        """Afegeix al registre d'una etapa la mida dels arrays que ha produït."""
+        if value is not None:
+            record.update(summarize_arrays(value))
+
+    def save(self, folder, name="profile"):
+        """
+        Desa el perfil en JSON i CSV (i els cProfile capturats en .prof).
+
+        Args:
+            folder (str): Carpeta de sortida
+            name (str): Prefix dels fitxers
+
+        Returns:
+            Path: Camí del fitxer JSON
+        """
+        if not self.enabled:
+            return None
+
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        records = sorted(self.records, key=lambda record: record["start_s"])
+
+        for qualified, profile in self.cprofiles.items():
+            profile.dump_stats(str(folder / f"{name}_{qualified}.prof"))
+
+        json_path = folder / f"{name}.json"
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"timestamp": datetime.now().isoformat(), "stages": records}, f, indent=2,
+                      ensure_ascii=False)
+
+        with open(folder / f"{name}.csv", 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=PROFILE_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+
+        print(f"✓ Perfil d'execució desat: {json_path}")
+        return json_path
+
+    def print_summary(self):
+        """Imprimeix el temps i la memòria de cada etapa."""
+        if not self.enabled:
+            return
+
+        print("\n⏱  PERFIL PER ETAPES")
+        print("=" * 78)
+        print(f"{'Etapa':<40} {'Real (s)':>9} {'CPU (s)':>9} {'Pic (MiB)':>10} {'Escrit (MiB)':>12}")
+        for record in sorted(self.records, key=lambda record: record["start_s"]):
+            label = "  " * record["depth"] + (f"{record['component']}.{record['stage']}"
+                                              if record["component"] else record["stage"])
+            peak = record.get("tracemalloc_peak_bytes")
+            written = record.get("bytes_written")
+            print(f"{label[:40]:<40} {record['wall_s']:>9.3f} {record['cpu_s']:>9.3f} "
+                  f"{peak / 2 ** 20 if peak is not None else float('nan'):>10.1f} "
+                  f"{written / 2 ** 20 if written is not None else float('nan'):>12.1f}")
+
+    def close(self):
+        """Atura tracemalloc si l'ha iniciat aquest perfilador."""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+def profiled(stage_name=None, output=None):
+    """
+    Decorador que mesura un mètode com una etapa de self.profiler.
+
+    Args:
+        stage_name (str): Nom de l'etapa (per defecte, el nom del mètode)
+        output (callable): Funció (self, resultat) que retorna el valor del qual es
+            mesuren els arrays (per defecte, el resultat del mètode)
+    """
+    def decorator(method):
+        name = stage_name or method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.stage(name, component=type(self).__name__) as record:
+                result = method(self, *args, **kwargs)
+                if self.profiler.enabled:
+                    self.profiler.record_output(record, output(self, result) if output else result)
+                return result
+        return wrapper
+    return decorator
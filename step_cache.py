@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Memòria Cau de Passos amb Adreçament per Contingut
+
+Aquest mòdul desa a disc els resultats dels passos de processament, indexats
+pel hash del contingut de la imatge i pels paràmetres exactes de cada pas.
+Les claus d'un pas inclouen les claus dels seus passos d'entrada, de manera que
+canviar un paràmetre invalida només aquell pas i els que en depenen.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class StepCache:
+    def __init__(self, cache_dir=".step_cache", max_bytes=2 * 1024 ** 3):
+        """
+        Inicialitza la memòria cau.
+
+        Args:
+            cache_dir (str): Carpeta on es desen els resultats
+            max_bytes (int): Mida màxima de la carpeta; els resultats menys usats
+                recentment s'eliminen quan se supera (LRU)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Claus que l'execució en curs fa servir; l'LRU no les elimina
+        self.pinned = set()
+
+    @staticmethod
+    def hash_image(image):
+        """Retorna el hash SHA-256 del contingut (píxels, forma i tipus) d'una imatge."""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+        digest.update(memoryview(image).cast("B"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def step_key(step_name, params=None, input_keys=()):
+        """
+        Retorna la clau d'un pas a partir del seu nom, paràmetres i claus d'entrada.
+
+        Args:
+            step_name (str): Nom del pas
+            params (dict): Paràmetres exactes del pas (mides de nucli, llindars, rangs HSV...)
+            input_keys (iterable): Claus dels resultats que el pas rep com a entrada
+        """
+        payload = json.dumps([step_name, params or {}, list(input_keys)], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        """Retorna el fitxer existent d'una clau, o None."""
+        for suffix in (".npy", ".npz"):
+            path = self.cache_dir / f"{key}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def contains(self, key):
+        """Indica si hi ha un resultat desat per a la clau."""
+        return self._path(key) is not None
+
+    def get(self, key):
+        """
+        Retorna el resultat desat per a la clau, o None si no n'hi ha.
+
+        Els arrays únics es carreguen en mode mapejat a memòria.
+        """
+        path = self._path(key)
+        if path is None:
+            return None
+
+        try:
+            # Marcar com a usat recentment per a l'LRU
+            os.utime(path)
+            if path.suffix == ".npy":
+                return np.load(path, mmap_mode="r")
+            with np.load(path, allow_pickle=False) as archive:
+                spec = json.loads(str(archive["__spec__"]))
+                return _unpack(spec, archive)
+        except FileNotFoundError:
+            # Un altre procés que comparteix la carpeta l'ha eliminada entretant
+            return None
+        except (OSError, ValueError) as e:
+            print(f"⚠ Entrada de memòria cau il·legible {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, key, value):
+        """
+        Desa un resultat.
+
+        Un array únic es desa com a .npy; les estructures (llistes, tuples i
+        diccionaris d'arrays i escalars) es desen com a .npz.
+        """
+        if isinstance(value, np.ndarray):
+            path = self.cache_dir / f"{key}.npy"
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+        else:
+            arrays = {}
+            spec = _pack(value, "a", arrays)
+            path = self.cache_dir / f"{key}.npz"
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, __spec__=np.array(json.dumps(spec)), **arrays)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def pin(self, keys):
+        """Protegeix les claus de l'expulsió LRU fins que es cridi unpin."""
+        self.pinned.update(keys)
+
+    def unpin(self, keys):
+        """Deixa de protegir les claus."""
+        self.pinned.difference_update(keys)
+
+    def _evict(self):
+        """Elimina les entrades menys usades (excepte les protegides) fins que la carpeta càpiga a max_bytes."""
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.suffix in (".npy", ".npz") and path.stem not in self.pinned:
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    # Un altre procés que comparteix la carpeta l'ha eliminada
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        """Elimina totes les entrades."""
+        for path in self.cache_dir.iterdir():
+            if path.suffix in (".npy", ".npz"):
+                path.unlink(missing_ok=True)
+
+
+def _pack(value, name, arrays):
+    """Separa una estructura en arrays (per al .npz) i una descripció serialitzable en JSON."""
+    if isinstance(value, np.ndarray):
+        arrays[name] = value
+        return {"type": "array", "name": name}
+    if isinstance(value, (list, tuple)):
+        return {"type": "tuple" if isinstance(value, tuple) else "list",
+                "items": [_pack(item, f"{name}_{i}", arrays) for i, item in enumerate(value)]}
+    if isinstance(value, dict):
+        return {"type": "dict",
+                "items": [[key, _pack(item, f"{name}_{i}", arrays)]
+                          for i, (key, item) in enumerate(value.items())]}
+    if isinstance(value, np.generic):
+        value = value.item()
+    return {"type": "value", "value": value}
+
+
+def _unpack(spec, archive):
+    """Reconstrueix una estructura desada amb _pack."""
+    kind = spec["type"]
+    if kind == "array":
+        return archive[spec["name"]]
+    if kind == "list":
+        return [_unpack(item, archive) for item in spec["items"]]
+    if kind == "tuple":
+        return tuple(_unpack(item, archive) for item in spec["items"])
+    if kind == "dict":
+        return {key: _unpack(item, archive) for key, item in spec["items"]}
+    return spec["value"]
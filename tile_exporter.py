@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Exportador de Piràmides de Tessel·les
+
+Aquest mòdul talla una imatge georeferenciada de la carta (per exemple, la
+superposició de tots els polígons) en una piràmide de tessel·les Web Mercator
+XYZ o TMS, llesta per a un mapa web (Leaflet, OpenLayers, MapLibre...).
+
+Cada tessel·la es reprojecta des de la carta amb cv2.remap a partir de la
+GeoTransform de la carta, agafant el nivell de la piràmide de la imatge més
+proper a la resolució del zoom. Les tessel·les es renderitzen en paral·lel, les
+buides (fora de la carta) no es desen i un manifest (tiles.json) guarda el hash
+del contingut de cada tessel·la: en tornar a exportar (p. ex. en el següent
+cicle AIRAC), les tessel·les amb el mateix hash no es tornen a codificar ni a
+escriure, i les que ja no existeixen s'esborren.
+"""
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from artifact_writer import ArtifactWriter
+from stage_profiler import StageProfiler, profiled
+
+TILE_SIZE = 256
+TILE_SCHEMES = ("xyz", "tms")
+MANIFEST_FILE = "tiles.json"
+
+# Punts mostrejats per cada vora de la carta per calcular-ne l'extensió geogràfica
+FOOTPRINT_SAMPLES = 64
+
+# Latitud màxima de Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+def mercator_fraction(lat, lon):
+    """
+    Converteix latitud/longitud a coordenades Web Mercator normalitzades.
+
+    Returns:
+        tuple: Arrays (mx, my) en [0, 1]; my creix cap al sud, com a XYZ
+    """
+    lat = np.radians(np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    mx = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    my = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0
+    return mx, my
+
+
+def tile_pixel_latlon(tile_x, tile_y, zoom, tile_size=TILE_SIZE):
+    """
+    Latitud i longitud dels centres dels píxels d'una tessel·la XYZ.
+
+    Returns:
+        tuple: Arrays (lat, lon) de forma (tile_size, tile_size)
+    """
+    world = tile_size * 2 ** zoom
+    offsets = np.arange(tile_size) + 0.5
+    lon = (tile_x * tile_size + offsets) / world * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (tile_y * tile_size + offsets) / world))))
+    return np.meshgrid(lat, lon, indexing="ij")
+
+
+class TileExporter:
+    def __init__(self, image, transform, output_folder, tile_size=TILE_SIZE, scheme="xyz", max_workers=4,
+                 writer=None, profiler=None):
+        """
+        Inicialitza l'exportador.
+
+        Args:
+            image (np.ndarray): Imatge BGR de la carta (amb les capes ja compostes)
+            transform (GeoTransform): Transformació píxel ↔ lat/lon de la carta
+            output_folder (str): Carpeta de la piràmide; ha de ser la mateixa d'una
+                exportació a l'altra perquè es puguin reutilitzar les tessel·les
+            tile_size (int): Mida de les tessel·les en píxels
+            scheme (str): "xyz" (y creix cap al sud) o "tms" (y creix cap al nord)
+            max_workers (int): Fils de renderització
+            writer (ArtifactWriter): Escriptor de les tessel·les (classe "tile");
+                per defecte, síncron en PNG
+            profiler (StageProfiler): Instrumentació opcional de cada nivell de zoom
+        """
+        if scheme not in TILE_SCHEMES:
+            raise ValueError(f"Esquema desconegut: {scheme} (vàlids: {TILE_SCHEMES})")
+
+        self.transform = transform
+        self.output_folder = Path(output_folder)
+        self.tile_size = tile_size
+        self.scheme = scheme
+        self.max_workers = max_workers
+        self.writer = writer if writer is not None else ArtifactWriter(max_workers=0)
+        self.profiler = profiler if profiler is not None else StageProfiler(enabled=False)
+
+        # L'alfa marca la carta; fora de la carta, remap hi posa 0 (tessel·la transparent)
+        self.height, self.width = image.shape[:2]
+        self._levels = [cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)]
+        self.bounds = self._footprint()
+        self.pixel_size = self._pixel_size()
+
+    def _footprint(self):
+        """Extensió geogràfica (west, south, east, north) de la carta, mostrejant-ne les vores."""
+        t = np.linspace(0.0, 1.0, FOOTPRINT_SAMPLES)
+        w, h = self.width - 1, self.height - 1
+        xs = np.concatenate([t * w, np.full_like(t, w), t * w, np.zeros_like(t)])
+        ys = np.concatenate([np.zeros_like(t), t * h, np.full_like(t, h), t * h])
+        lat, lon = self.transform.pixel_to_latlon(xs, ys)
+        return {"west": float(lon.min()), "south": float(lat.min()),
+                "east": float(lon.max()), "north": float(lat.max())}
+
+    def _pixel_size(self):
+        """Mida d'un píxel de la carta en coordenades Mercator normalitzades (al centre)."""
+        cx, cy = self.width / 2.0, self.height / 2.0
+        lat, lon = self.transform.pixel_to_latlon([cx, cx + 1, cx], [cy, cy, cy + 1])
+        mx, my = mercator_fraction(lat, lon)
+        return (np.hypot(mx[1] - mx[0], my[1] - my[0]) + np.hypot(mx[2] - mx[0], my[2] - my[0])) / 2
+
+    def native_zoom(self):
+        """Zoom mínim amb què una tessel·la té almenys la resolució de la carta."""
+        return max(0, int(np.ceil(np.log2(1.0 / (self.tile_size * self.pixel_size)))))
+
+    def overview_zoom(self):
+        """Zoom màxim amb què tota la carta cap en una tessel·la."""
+        mx, my = mercator_fraction([self.bounds["south"], self.bounds["north"]],
+                                   [self.bounds["west"], self.bounds["east"]])
+        extent = max(mx[1] - mx[0], my[0] - my[1])
+        return max(0, int(np.floor(np.log2(1.0 / extent))))
+
+    def tile_range(self, zoom):
+        """Rang (x_min, x_max, y_min, y_max) XYZ de les tessel·les que cobreixen la carta."""
+        n = 2 ** zoom
+        mx, my = mercator_fraction([self.bounds["north"], self.bounds["south"]],
+                                   [self.bounds["west"], self.bounds["east"]])
+        x_min, x_max = (np.clip(np.floor(mx * n), 0, n - 1).astype(int)).tolist()
+        y_min, y_max = (np.clip(np.floor(my * n), 0, n - 1).astype(int)).tolist()
+        return x_min, x_max, y_min, y_max
+
+    def _source_level(self, zoom):
+        """
+        Retorna el nivell de la piràmide de la carta adequat per a un zoom.
+
+        Cada nivell és la meitat de l'anterior; es tria el més petit que encara té
+        almenys la resolució de les tessel·les, per evitar l'aliasing en allunyar.
+        """
+        chart_pixels_per_tile_pixel = 1.0 / (self.tile_size * 2 ** zoom * self.pixel_size)
+        level = max(0, int(np.floor(np.log2(max(chart_pixels_per_tile_pixel, 1.0)))))
+        while len(self._levels) <= level:
+            previous = self._levels[-1]
+            if min(previous.shape[:2]) < 2:
+                break
+            self._levels.append(cv2.resize(previous, ((previous.shape[1] + 1) // 2, (previous.shape[0] + 1) // 2),
+                                           interpolation=cv2.INTER_AREA))
+        return self._levels[min(level, len(self._levels) - 1)]
+
+    def render_tile(self, zoom, tile_x, tile_y):
+        """
+        Renderitza una tessel·la XYZ.
+
+        Returns:
+            np.ndarray: Tessel·la BGR (o BGRA si toca la vora de la carta), o None si és buida
+        """
+        lat, lon = tile_pixel_latlon(tile_x, tile_y, zoom, self.tile_size)
+        x, y = self.transform.latlon_to_pixel(lat, lon)
+
+        source = self._source_level(zoom)
+        scale_x = source.shape[1] / self.width
+        scale_y = source.shape[0] / self.height
+        map_x = ((x + 0.5) * scale_x - 0.5).astype(np.float32)
+        map_y = ((y + 0.5) * scale_y - 0.5).astype(np.float32)
+        tile = cv2.remap(source, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT,
+                         borderValue=(0, 0, 0, 0))
+
+        alpha = tile[:, :, 3]
+        if not alpha.any():
+            return None
+        if alpha.min() == 255:
+            return np.ascontiguousarray(tile[:, :, :3])
+        return tile
+
+    def _tile_stem(self, zoom, tile_x, tile_y):
+        """Camí relatiu (sense extensió) d'una tessel·la segons l'esquema."""
+        file_y = tile_y if self.scheme == "xyz" else 2 ** zoom - 1 - tile_y
+        return f"{zoom}/{tile_x}/{file_y}"
+
+    def _export_tile(self, zoom, tile_x, tile_y, previous):
+        """
+        Renderitza una tessel·la i la desa si ha canviat.
+
+        Returns:
+            tuple: (clau "z/x/y", entrada del manifest o None, estat "written",
+                "unchanged" o "empty")
+        """
+        key = f"{zoom}/{tile_x}/{tile_y}"
+        tile = self.render_tile(zoom, tile_x, tile_y)
+        if tile is None:
+            return key, None, "empty"
+
+        # El hash inclou la codificació: si canvia el format, es torna a escriure
+        digest = hashlib.sha256()
+        digest.update(repr((tile.shape, self.writer.encoding_for("tile"))).encode())
+        digest.update(tile.data)
+        digest = digest.hexdigest()
+
+        stem = self._tile_stem(zoom, tile_x, tile_y)
+        old = previous.get(key)
+        if (old is not None and old["sha256"] == digest and old["file"].rsplit(".", 1)[0] == stem
+                and (self.output_folder / old["file"]).exists()):
+            return key, old, "unchanged"
+
+        path = self.output_folder / f"{stem}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path = Path(self.writer.write_image(path, tile, artifact_class="tile"))
+        return key, {"file": path.relative_to(self.output_folder).as_posix(), "sha256": digest}, "written"
+
+    def _load_manifest(self):
+        """Retorna les tessel·les de l'exportació anterior ({} si no n'hi ha)."""
+        manifest_path = self.output_folder / MANIFEST_FILE
+        if not manifest_path.exists():
+            return {}
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f).get("tiles", {})
+
+    @profiled("export_tiles")
+    def export(self, min_zoom=None, max_zoom=None):
+        """
+        Exporta la piràmide de tessel·les.
+
+        Args:
+            min_zoom (int): Zoom mínim (per defecte, el de tota la carta en una tessel·la)
+            max_zoom (int): Zoom màxim (per defecte, el de la resolució de la carta)
+
+        Returns:
+            dict: Manifest de l'exportació, amb el recompte de tessel·les escrites,
+                reutilitzades, buides i esborrades
+        """
+        max_zoom = self.native_zoom() if max_zoom is None else max_zoom
+        min_zoom = min(self.overview_zoom(), max_zoom) if min_zoom is None else min_zoom
+        if min_zoom > max_zoom:
+            raise ValueError(f"min_zoom ({min_zoom}) és més gran que max_zoom ({max_zoom})")
+
+        print(f"\n🗺  Exportant tessel·les {self.scheme.upper()} (zoom {min_zoom}-{max_zoom})...")
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        previous = self._load_manifest()
+        tiles = {}
+        counts = {"written": 0, "unchanged": 0, "empty": 0}
+
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1), thread_name_prefix="tile_exporter") as pool:
+            for zoom in range(min_zoom, max_zoom + 1):
+                x_min, x_max, y_min, y_max = self.tile_range(zoom)
+                coords = [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+                # El nivell de la carta es construeix aquí, abans de repartir les tessel·les entre fils
+                self._source_level(zoom)
+                with self.profiler.stage(f"zoom_{zoom}", component="TileExporter", tiles=len(coords)):
+                    for key, entry, status in pool.map(
+                            lambda coord: self._export_tile(zoom, coord[0], coord[1], previous), coords):
+                        counts[status] += 1
+                        if entry is not None:
+                            tiles[key] = entry
+
+        failures = self.writer.flush()
+        for path, _ in failures:
+            tiles = {key: entry for key, entry in tiles.items()
+                     if self.output_folder / entry["file"] != Path(path)}
+
+        # Esborrar les tessel·les que ja no formen part de la piràmide
+        removed = 0
+        current_files = {entry["file"] for entry in tiles.values()}
+        for old in previous.values():
+            if old["file"] not in current_files:
+                stale = self.output_folder / old["file"]
+                if stale.exists():
+                    stale.unlink()
+                    removed += 1
+        counts["removed"] = removed
+
+        manifest = {
+            "timestamp": datetime.now().isoformat(),
+            "scheme": self.scheme,
+            "tile_size": self.tile_size,
+            "min_zoom": min_zoom,
+            "max_zoom": max_zoom,
+            "bounds": [self.bounds["west"], self.bounds["south"], self.bounds["east"], self.bounds["north"]],
+            "transform": self.transform.to_dict(),
+            "encoding": self.writer.encoding_for("tile"),
+            "counts": counts,
+            "tiles": tiles,
+        }
+        with open(self.output_folder / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        print(f"✓ Tessel·les: {counts['written']} escrites, {counts['unchanged']} sense canvis, "
+              f"{counts['empty']} buides, {removed} esborrades")
+        print(f"✓ Piràmide desada a: {self.output_folder}")
+        return manifest
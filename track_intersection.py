@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Intersecció de Traces de Vol amb els Espais Aeris
+
+Aquest mòdul creua traces GPS (arrays de lat/lon i, opcionalment, altitud i
+temps) amb els polígons detectats, per lots i sense bucles Python per fix:
+
+- events: cada entrada o sortida d'un espai aeri, amb la posició, l'altitud i
+  el temps interpolats al punt de creuament,
+- segments: cada parell (segment de la traça, polígon) que es toquen,
+- intervals: cada tram continu d'una traça dins d'un espai aeri.
+
+Diverses traces es poden processar en una sola crida concatenant-les amb un
+array track_ids; els segments entre fixes de traces diferents s'ignoren.
+Els creuaments es troben amb PolygonIndex.segment_crossings (poda per caixes i
+proves segment-aresta vectoritzades) i l'estat inicial amb query_points.
+"""
+
+import csv
+
+import numpy as np
+
+from geo_transform import resolve_transform
+
+# Columnes de l'exportació CSV dels events
+EVENT_FIELDS = ("track", "airspace_type", "airspace_id", "entering", "position", "lat", "lon",
+                "altitude", "time")
+
+
+def _interpolate(values, positions):
+    """Valor d'un array per fix a posicions fraccionàries (índex de fix + fracció del segment)."""
+    if values is None:
+        return None
+    segment = np.minimum(np.floor(positions).astype(np.int64), len(values) - 1)
+    following = np.minimum(segment + 1, len(values) - 1)
+    fraction = positions - segment
+    return values[segment] + fraction * (values[following] - values[segment])
+
+
+class TrackIntersector:
+    def __init__(self, index, transform=None):
+        """
+        Inicialitza l'intersector.
+
+        Args:
+            index (PolygonIndex): Índex dels polígons de la carta
+            transform (GeoTransform): Georeferenciació de la carta (per defecte, la de l'índex)
+        """
+        self.index = index
+        self.transform = resolve_transform(transform, index.transform)
+
+    @classmethod
+    def from_detector(cls, detector, transform):
+        """Crea l'intersector sobre els polígons d'un AirspaceVertexDetector."""
+        return cls(detector.spatial_index, transform)
+
+    def intersect(self, lat, lon, altitude=None, times=None, track_ids=None):
+        """
+        Creua una o diverses traces amb els espais aeris.
+
+        Args:
+            lat, lon (array): Fixes en graus, N elements
+            altitude (array): Altitud de cada fix (opcional, s'interpola als creuaments)
+            times (array): Temps numèric de cada fix, p. ex. segons (opcional, s'interpola)
+            track_ids (array): Traça de cada fix, amb les traces consecutives (opcional)
+
+        Returns:
+            dict: Taules columnars "events", "segments" i "intervals" (diccionaris
+                d'arrays); les posicions són índex de fix + fracció del segment
+        """
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        lon = np.asarray(lon, dtype=np.float64).ravel()
+        altitude = np.asarray(altitude, dtype=np.float64).ravel() if altitude is not None else None
+        times = np.asarray(times, dtype=np.float64).ravel() if times is not None else None
+        track_ids = np.asarray(track_ids).ravel() if track_ids is not None else np.zeros(len(lat), dtype=np.int64)
+        num_polygons = max(len(self.index.store), 1)
+
+        x, y = self.transform.latlon_to_pixel(lat, lon)
+
+        # Segments entre fixes consecutius de la mateixa traça
+        segment_starts = np.flatnonzero(track_ids[1:] == track_ids[:-1])
+        first_fix = np.r_[True, track_ids[1:] != track_ids[:-1]] if len(lat) else np.empty(0, dtype=bool)
+        last_fix = np.r_[track_ids[1:] != track_ids[:-1], True] if len(lat) else np.empty(0, dtype=bool)
+
+        # Polígons que contenen cada fix (claus fix * P + polígon, ordenades)
+        inside_fixes, inside_polygons = self.index.query_points(np.column_stack([x, y]))
+        inside_keys = np.sort(inside_fixes * num_polygons + inside_polygons)
+
+        # Creuaments: on canvia l'estat dins/fora de cada polígon
+        crossing_segments, polygons, fractions = self.index.segment_crossings(
+            x[segment_starts], y[segment_starts], x[segment_starts + 1], y[segment_starts + 1], closed=True)
+        fixes, polygons, fractions, entering = self._state_changes(
+            x, y, segment_starts[crossing_segments], polygons, fractions, inside_keys, segment_starts, num_polygons)
+        order = np.lexsort((fractions, fixes, polygons))
+        fixes, polygons, fractions, entering = fixes[order], polygons[order], fractions[order], entering[order]
+        positions = fixes + fractions
+
+        events = {
+            "track": track_ids[fixes],
+            "polygon": polygons,
+            "segment": fixes,
+            "position": positions,
+            "entering": entering,
+            "lat": _interpolate(lat, positions),
+            "lon": _interpolate(lon, positions),
+            "altitude": _interpolate(altitude, positions),
+            "time": _interpolate(times, positions),
+        }
+
+        # Segments que toquen cada polígon: amb creuaments o amb algun extrem a dins
+        segment_set = np.zeros(len(lat), dtype=bool)
+        segment_set[segment_starts] = True
+        inside_after = inside_fixes - 1
+        touching = np.concatenate([
+            fixes * num_polygons + polygons,
+            (inside_fixes * num_polygons + inside_polygons)[segment_set[inside_fixes]],
+            (inside_after * num_polygons + inside_polygons)[(inside_after >= 0) &
+                                                            segment_set[np.maximum(inside_after, 0)]],
+        ])
+        touching = np.unique(touching)
+        segment_fixes = touching // num_polygons
+        segments = {"track": track_ids[segment_fixes], "segment": segment_fixes,
+                    "polygon": touching % num_polygons}
+
+        # Intervals: entrades i sortides (més l'inici i el final de cada traça si hi és dins)
+        starts_inside = first_fix[inside_fixes]
+        ends_inside = last_fix[inside_fixes]
+        boundary_polygons = np.concatenate([polygons, inside_polygons[starts_inside], inside_polygons[ends_inside]])
+        boundary_positions = np.concatenate([positions, inside_fixes[starts_inside].astype(np.float64),
+                                             inside_fixes[ends_inside].astype(np.float64)])
+        boundary_entering = np.concatenate([entering, np.ones(starts_inside.sum(), dtype=bool),
+                                            np.zeros(ends_inside.sum(), dtype=bool)])
+        boundary_fixes = np.floor(boundary_positions).astype(np.int64)
+        boundary_tracks = (np.cumsum(first_fix) - 1)[boundary_fixes]
+        order = np.lexsort((~boundary_entering, boundary_positions, boundary_polygons, boundary_tracks))
+
+        # Dins de cada (traça, polígon), la k-èsima entrada s'aparella amb la k-èsima sortida
+        group_changes = np.r_[True, (boundary_tracks[order][1:] != boundary_tracks[order][:-1]) |
+                              (boundary_polygons[order][1:] != boundary_polygons[order][:-1])][:len(order)]
+        group = np.cumsum(group_changes)
+        entry, exit_ = order[boundary_entering[order]], order[~boundary_entering[order]]
+        entry_group, exit_group = group[boundary_entering[order]], group[~boundary_entering[order]]
+        entry_rank = np.arange(len(entry)) - np.searchsorted(entry_group, entry_group)
+        exit_rank = np.arange(len(exit_)) - np.searchsorted(exit_group, exit_group)
+        _, entry_match, exit_match = np.intersect1d(entry_group * (len(order) + 1) + entry_rank,
+                                                    exit_group * (len(order) + 1) + exit_rank,
+                                                    return_indices=True)
+        entry, exit_ = entry[entry_match], exit_[exit_match]
+        intervals = {
+            "track": track_ids[boundary_fixes[entry]],
+            "polygon": boundary_polygons[entry],
+            "start": boundary_positions[entry],
+            "end": boundary_positions[exit_],
+            "start_time": _interpolate(times, boundary_positions[entry]),
+            "end_time": _interpolate(times, boundary_positions[exit_]),
+        }
+        return {"events": events, "segments": segments, "intervals": intervals}
+
+    def _state_changes(self, x, y, fixes, polygons, fractions, inside_keys, segment_starts, num_polygons):
+        """
+        Troba on canvia l'estat dins/fora de cada polígon al llarg de cada segment.
+
+        Els punts de tall (contactes amb les vores, extrems i vèrtexs inclosos) divideixen
+        el segment en trams; l'estat de cada tram es prova al seu punt mig amb la mateixa
+        regla que els fixes (query_points). Hi ha un event on l'estat canvia entre dos
+        trams consecutius o entre un extrem i el seu tram, de manera que els events
+        sempre concorden amb l'estat dels fixes, fins i tot amb fixes sobre una vora,
+        vèrtexs tocats o segments que segueixen una aresta.
+
+        Args:
+            x, y (array): Fixes en píxels
+            fixes, polygons, fractions (array): Contactes tancats (segment_crossings
+                amb closed=True), amb el fix inicial del segment
+            inside_keys (array): Claus fix * P + polígon dels fixes dins, ordenades
+            segment_starts (array): Fix inicial de cada segment
+
+        Returns:
+            tuple: Arrays (fix inicial del segment, polígon, fracció 0 <= t <= 1, entrada)
+        """
+        # Estat dins/fora als dos extrems de cada parell (segment, polígon)
+        start_keys = inside_keys[np.isin(inside_keys // num_polygons, segment_starts)]
+        end_keys = inside_keys - num_polygons
+        end_keys = end_keys[(end_keys >= 0) & np.isin(end_keys // num_polygons, segment_starts)]
+
+        # Parells a estudiar: amb algun contacte o amb estats diferents als extrems
+        keys = fixes * num_polygons + polygons
+        group_keys = np.union1d(keys, np.setxor1d(start_keys, end_keys))
+
+        # Punts de tall interiors sense repetir, més els extrems 0 i 1 de cada parell
+        interior = (fractions > 0) & (fractions < 1)
+        bound_keys = np.concatenate([keys[interior], group_keys, group_keys])
+        bound_t = np.concatenate([fractions[interior], np.zeros(len(group_keys)), np.ones(len(group_keys))])
+        order = np.lexsort((bound_t, bound_keys))
+        bound_keys, bound_t = bound_keys[order], bound_t[order]
+        unique = np.r_[True, (bound_keys[1:] != bound_keys[:-1]) | (bound_t[1:] != bound_t[:-1])]
+        bound_keys, bound_t = bound_keys[unique], bound_t[unique]
+
+        # Estat al punt mig de cada tram entre punts de tall consecutius
+        same = np.flatnonzero(bound_keys[1:] == bound_keys[:-1])
+        mid_keys, mid_t = bound_keys[same], (bound_t[same] + bound_t[same + 1]) / 2
+        mid_fixes, mid_polygons = mid_keys // num_polygons, mid_keys % num_polygons
+        mid_x = x[mid_fixes] + mid_t * (x[mid_fixes + 1] - x[mid_fixes])
+        mid_y = y[mid_fixes] + mid_t * (y[mid_fixes + 1] - y[mid_fixes])
+        mid_inside = self.index.contains_pairs(np.column_stack([mid_x, mid_y]), mid_polygons)
+
+        # Seqüència d'estats de cada parell: extrem inicial, trams, extrem final. Cada parell
+        # té un estat més que punts de tall, i el canvi entre els estats i i i+1 és al tall i
+        state_keys = np.concatenate([group_keys, mid_keys, group_keys])
+        state_order = np.concatenate([np.full(len(group_keys), -1.0), mid_t, np.full(len(group_keys), 2.0)])
+        state_inside = np.concatenate([np.isin(group_keys, start_keys), mid_inside, np.isin(group_keys, end_keys)])
+        order = np.lexsort((state_order, state_keys))
+        state_keys, state_inside = state_keys[order], state_inside[order]
+        changes = np.flatnonzero((state_keys[1:] == state_keys[:-1]) & (state_inside[1:] != state_inside[:-1]))
+        bounds = changes - np.searchsorted(group_keys, state_keys[changes])
+        change_keys = state_keys[changes]
+        return (change_keys // num_polygons, change_keys % num_polygons, bound_t[bounds],
+                state_inside[changes + 1])
+
+    def save_events_csv(self, result, output_path):
+        """
+        Desa els events d'entrada i sortida en CSV (un per fila).
+
+        Args:
+            result (dict): Resultat de intersect
+            output_path (str): Camí del CSV
+        """
+        events = result["events"]
+        keys = self.index.store.polygon_keys(events["polygon"])
+        columns = {
+            "track": events["track"].tolist(),
+            "airspace_type": [airspace_type for airspace_type, _ in keys],
+            "airspace_id": [polygon_id for _, polygon_id in keys],
+            "entering": events["entering"].tolist(),
+            "position": events["position"].tolist(),
+            "lat": events["lat"].tolist(),
+            "lon": events["lon"].tolist(),
+            "altitude": events["altitude"].tolist() if events["altitude"] is not None else [None] * len(keys),
+            "time": events["time"].tolist() if events["time"] is not None else [None] * len(keys),
+        }
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(EVENT_FIELDS)
+            writer.writerows(zip(*(columns[field] for field in EVENT_FIELDS)))
+        print(f"✓ Events de la traça desats: {output_path} ({len(keys)} events)")
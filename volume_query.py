@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Consultes 3D als Volums dels Espais Aeris
+
+Aquest mòdul respon, per lots grans de punts (lat, lon, altitud) com ara mostres
+ADS-B o rutes planificades, quins espais aeris contenen cada punt. Cada polígon
+detectat és un volum entre el seu floor i el seu ceiling (en peus, donats per
+l'usuari; vegeu altitude_raster.limit_arrays).
+
+La consulta té dues fases, totes dues vectoritzades sobre els arrays d'entrada:
+
+- 2D: els polígons que cobreixen cada punt, amb el ràster d'etiquetes (una
+  lectura de píxel per punt; per defecte) o amb l'índex espacial (prova exacta),
+- vertical: dels parells (punt, polígon) resultants es conserven els que tenen
+  l'altitud del punt dins de [floor, ceiling].
+"""
+
+import numpy as np
+
+from altitude_raster import limit_arrays
+from geo_transform import resolve_transform
+
+# Punts processats per bloc (limita la mida dels arrays intermedis)
+QUERY_CHUNK = 1 << 20
+
+
+class AirspaceVolumes:
+    def __init__(self, lookup, limits, transform=None):
+        """
+        Inicialitza el motor de consultes.
+
+        Args:
+            lookup: LabelRaster o PolygonIndex dels polígons (qualsevol objecte amb
+                store i query_points)
+            limits: Floor i ceiling de cada polígon en peus (vegeu limit_arrays); els
+                polígons sense límits no contenen cap punt
+            transform (GeoTransform): Georeferenciació de la carta (per defecte, la de lookup)
+        """
+        self.lookup = lookup
+        self.store = lookup.store
+        self.floors, self.ceilings = limit_arrays(lookup.store, limits)
+        self.transform = resolve_transform(transform, lookup.transform)
+
+    @classmethod
+    def from_detector(cls, detector, limits, transform=None, exact=False):
+        """
+        Crea el motor sobre els polígons d'un AirspaceVertexDetector.
+
+        Args:
+            detector (AirspaceVertexDetector): Detector amb els polígons
+            limits: Floor i ceiling de cada polígon (vegeu limit_arrays)
+            transform (GeoTransform): Georeferenciació de la carta
+            exact (bool): Prova punt-polígon exacta amb l'índex espacial en lloc del
+                ràster d'etiquetes (més lenta; els punts s'arrodoneixen al píxel al ràster)
+        """
+        lookup = detector.spatial_index if exact else detector.build_label_raster(transform=transform)
+        return cls(lookup, limits, transform)
+
+    def query_points(self, points, altitudes):
+        """
+        Troba els espais aeris que contenen cada punt en 3D.
+
+        Args:
+            points (array): Array (N, 2) de coordenades (x, y) de píxel
+            altitudes (array): Altitud de cada punt en peus, N elements
+
+        Returns:
+            tuple: Arrays (índexs de punt, índexs de polígon), ordenats per punt
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        altitudes = np.asarray(altitudes, dtype=np.float64).ravel()
+        if len(altitudes) != len(points):
+            raise ValueError(f"Cal una altitud per punt: {len(altitudes)} per a {len(points)}")
+
+        point_chunks, polygon_chunks = [], []
+        for start in range(0, len(points), QUERY_CHUNK):
+            point_indices, polygon_indices = self.lookup.query_points(points[start:start + QUERY_CHUNK])
+            point_altitudes = altitudes[start + point_indices]
+            inside = (point_altitudes >= self.floors[polygon_indices]) & \
+                (point_altitudes <= self.ceilings[polygon_indices])
+            point_chunks.append(point_indices[inside] + start)
+            polygon_chunks.append(polygon_indices[inside])
+
+        if not point_chunks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        return np.concatenate(point_chunks), np.concatenate(polygon_chunks)
+
+    def query(self, lat, lon, altitude, transform=None):
+        """
+        Com query_points, amb punts en graus.
+
+        Args:
+            lat, lon (array): Posició de cada punt en graus
+            altitude (array): Altitud de cada punt en peus
+            transform (GeoTransform): Georeferenciació (per defecte, la del motor)
+        """
+        latlon = np.column_stack([np.ravel(lat), np.ravel(lon)])
+        return self.query_points(resolve_transform(transform, self.transform).latlon_to_points(latlon), altitude)
+
+    def counts(self, lat, lon, altitude, transform=None):
+        """Nombre d'espais aeris que contenen cada punt."""
+        point_indices, _ = self.query(lat, lon, altitude, transform)
+        return np.bincount(point_indices, minlength=np.size(lat)).astype(np.int32)